@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -37,15 +40,21 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
 ]
 
 MIDDLEWARE = [
+    # First, so its total covers every other middleware too.
+    'core.profiling.ProfilingMiddleware',
+    # Before anything that queries, so a pinned request reads from the primary throughout.
+    'core.db_routing.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # AuthenticationMiddleware that reads the user from the session (core.session_user).
+    'core.session_user.SessionUserMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -84,6 +93,145 @@ DATABASES = {
     }
 }
 
+# Read replicas for reports (core.db_routing): a comma-separated list of
+# hosts in DATABASE_REPLICA_HOSTS, served with the primary's database and
+# credentials as aliases replica1, replica2, ...
+for _number, _host in enumerate(
+    (host.strip() for host in os.environ.get('DATABASE_REPLICA_HOSTS', '').split(',') if host.strip()), 1
+):
+    DATABASES[f'replica{_number}'] = {**DATABASES['default'], 'HOST': _host, 'TEST': {'MIRROR': 'default'}}
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['core.db_routing.ReplicaRouter']
+# Seconds after a POST during which the same browser reads from the primary.
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '5'))
+
+
+# Request profiling (core.profiling): share of requests timed, and how many
+# runs of the same SQL in one request count as an N+1 pattern.
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '1.0' if DEBUG else '0.05'))
+PROFILING_DUPLICATE_THRESHOLD = 5
+
+# Background tasks (core.tasks, run by `python manage.py run_tasks`).
+# Periodic entries are enqueued once per period (`every` seconds, starting
+# `offset` seconds after midnight UTC). A running task whose worker has not
+# renewed its lease for TASK_LEASE_SECONDS is queued again.
+TASK_SCHEDULE = {
+    'sweep-overdue': {'task': 'core.sweep_overdue', 'every': 24 * 3600, 'offset': 3600},
+    'reminders': {'task': 'core.send_reminders', 'every': 24 * 3600, 'offset': 2 * 3600},
+    'prune-tasks': {'task': 'core.prune_tasks', 'every': 24 * 3600, 'offset': 3 * 3600},
+    'expire-holds': {'task': 'core.expire_holds', 'every': 3600},
+    'project-circulation': {'task': 'core.project_circulation', 'every': 60},
+}
+TASK_LEASE_SECONDS = 300
+# Days a succeeded task row (and its result) is kept.
+TASK_RESULT_DAYS = 7
+
+# Seconds a signed-in user's session copy is trusted before it is checked
+# against the user table again. Saves to the user invalidate it at once
+# only with a shared cache (REDIS_URL). With local memory, core.session_user
+# caps the TTL at a few seconds instead.
+SESSION_USER_TTL = 300
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory by default; set REDIS_URL (e.g. redis://redis:6379/0) to share
+# the cache between workers. The Redis backend needs the `redis` package.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'college-erp',
+    }
+}
+
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
+
+# Sessions
+# https://docs.djangoproject.com/en/5.2/topics/http/sessions/
+# SESSION_BACKEND picks the engine. cached_db reads sessions from the cache
+# and only falls back to the database on a miss; signed_cookies keeps them
+# in the browser and never touches the server. cached_db is the default
+# only when the cache is shared (REDIS_URL): with per-process local memory,
+# one worker could read a session that another has since changed.
+# `python manage.py purge_sessions` deletes expired database sessions.
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cached_db' if os.environ.get('REDIS_URL') else 'db')
+if SESSION_BACKEND not in SESSION_ENGINES:
+    raise ImproperlyConfigured(f"SESSION_BACKEND must be one of {', '.join(SESSION_ENGINES)}.")
+SESSION_ENGINE = SESSION_ENGINES[SESSION_BACKEND]
+
+
+# Email
+# https://docs.djangoproject.com/en/5.2/topics/email/
+# EMAIL_DELIVERY picks the backend. With DEBUG on it defaults to `file`
+# (messages land in sent_emails/), so local runs of the reminder pipeline
+# (core.reminders) never reach a real inbox.
+
+EMAIL_BACKENDS = {
+    'smtp': 'django.core.mail.backends.smtp.EmailBackend',
+    'file': 'django.core.mail.backends.filebased.EmailBackend',
+    'console': 'django.core.mail.backends.console.EmailBackend',
+    'locmem': 'django.core.mail.backends.locmem.EmailBackend',
+}
+EMAIL_DELIVERY = os.environ.get('EMAIL_DELIVERY', 'file' if DEBUG else 'smtp')
+if EMAIL_DELIVERY not in EMAIL_BACKENDS:
+    raise ImproperlyConfigured(f"EMAIL_DELIVERY must be one of {', '.join(EMAIL_BACKENDS)}.")
+EMAIL_BACKEND = EMAIL_BACKENDS[EMAIL_DELIVERY]
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS') == '1'
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'library@college-erp.local')
+
+# Reminder digests cover open loans overdue or due within this many days.
+REMINDER_DAYS_AHEAD = 3
+# Days a copy waits on the hold shelf for its student before the hold expires.
+HOLD_PICKUP_DAYS = 3
+# Seconds after which a gap in the circulation log's event ids is taken to
+# be a rolled-back insert and skipped by the projections (core.projections).
+PROJECTION_SETTLE_SECONDS = 30
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/5.2/topics/auth/passwords/
+# PASSWORD_HASHER_PROFILE=fast hashes new passwords with MD5 so test and
+# benchmark runs of register/login are not dominated by PBKDF2. The default
+# hashers stay listed, so existing passwords still verify, but they are
+# re-hashed with MD5 on login: never use it with real accounts.
+
+PASSWORD_HASHER_PROFILES = {
+    'default': [
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.Argon2PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+        'django.contrib.auth.hashers.ScryptPasswordHasher',
+    ],
+}
+PASSWORD_HASHER_PROFILES['fast'] = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+    *PASSWORD_HASHER_PROFILES['default'],
+]
+PASSWORD_HASHER_PROFILE = os.environ.get('PASSWORD_HASHER_PROFILE', 'default')
+if PASSWORD_HASHER_PROFILE not in PASSWORD_HASHER_PROFILES:
+    raise ImproperlyConfigured(
+        f"PASSWORD_HASHER_PROFILE must be one of {', '.join(PASSWORD_HASHER_PROFILES)}."
+    )
+if PASSWORD_HASHER_PROFILE == 'fast' and not DEBUG:
+    raise ImproperlyConfigured("PASSWORD_HASHER_PROFILE=fast is only allowed with DEBUG on.")
+PASSWORD_HASHERS = PASSWORD_HASHER_PROFILES[PASSWORD_HASHER_PROFILE]
 
 
 # Password validation
@@ -123,6 +271,10 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'core/static']
 
+# Files written by background tasks (exports); served through the task
+# download view, not as public media.
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
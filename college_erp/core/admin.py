@@ -1,7 +1,11 @@
 # college_erp/core/admin.py
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
-from .models import User, Book, BookIssue
+from . import copies
+from .models import (
+    User, Book, BookCopy, BookIssue, BackgroundTask, CatalogueImport, CirculationDailyStat,
+    CirculationEvent, FineAccount, FineEntry, Hold, OverdueSweep, ProjectionOffset,
+)
 
 @admin.register(User)
 class UserAdmin(DjangoUserAdmin):
@@ -18,6 +22,48 @@ class BookAdmin(admin.ModelAdmin):
     search_fields = ("title", "author", "isbn")
     list_filter = ("author",)
 
+    # The counters follow the book's copies (core.copies): a new copy count
+    # adds or withdraws copies, and copies_available is never entered here.
+    readonly_fields = ("copies_available",)
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.copies_available = obj.copies_total
+            super().save_model(request, obj, form, change)
+            return
+        # Save only what was edited, so the counters on the loaded row (stale
+        # if a copy went out meanwhile) are not written back.
+        fields = [name for name in form.changed_data if name != "copies_total"]
+        if fields:
+            obj.save(update_fields=fields)
+        if "copies_total" in form.changed_data:
+            obj.copies_total = copies.set_copy_count(obj.pk, obj.copies_total)
+            if obj.copies_total != form.cleaned_data["copies_total"]:
+                self.message_user(
+                    request,
+                    f"Only copies on the shelf can be withdrawn; '{obj}' keeps {obj.copies_total}.",
+                    messages.WARNING,
+                )
+
+
+@admin.register(BookCopy)
+class BookCopyAdmin(admin.ModelAdmin):
+    list_display = ("barcode", "book", "status", "created_at")
+    list_filter = ("status",)
+    list_select_related = ("book",)
+    search_fields = ("=barcode", "book__title")
+    readonly_fields = ("book", "barcode", "status")
+
+
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    list_display = ("book", "student", "status", "ticket", "created_at", "expires_at")
+    list_filter = ("status",)
+    list_select_related = ("book", "student")
+    search_fields = ("book__title", "student__username")
+    # Queue changes go through core.holds, which keeps tickets and copies in step.
+    readonly_fields = ("book", "student", "status", "ticket", "copy", "ready_at", "expires_at", "closed_at")
+
 
 @admin.register(BookIssue)
 class BookIssueAdmin(admin.ModelAdmin):
@@ -48,3 +94,77 @@ class BookIssueAdmin(admin.ModelAdmin):
     list_display = ("book_title", "student_username", "action_value", "issued_at_value", "returned_at_value")
     list_filter = ("action",) if "action" in [f.name for f in BookIssue._meta.get_fields()] else ()
     search_fields = ("book__title", "student__username")
+
+
+@admin.register(OverdueSweep)
+class OverdueSweepAdmin(admin.ModelAdmin):
+    list_display = ("swept_through", "marked", "cleared", "ran_at")
+
+
+# The ledger only changes through core.ledger, which keeps balances in step.
+@admin.register(FineEntry)
+class FineEntryAdmin(admin.ModelAdmin):
+    list_display = ("student", "kind", "amount", "balance", "issue", "recorded_by", "created_at")
+    list_filter = ("kind",)
+    list_select_related = ("student", "recorded_by")
+    search_fields = ("student__username",)
+    readonly_fields = ("student", "kind", "amount", "balance", "issue", "recorded_by", "note", "created_at")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(FineAccount)
+class FineAccountAdmin(admin.ModelAdmin):
+    list_display = ("student", "balance", "updated_at")
+    list_select_related = ("student",)
+    search_fields = ("student__username",)
+    readonly_fields = ("student", "balance", "updated_at")
+
+
+@admin.register(CirculationDailyStat)
+class CirculationDailyStatAdmin(admin.ModelAdmin):
+    list_display = ("date", "book", "issues", "returns", "overdue", "fines")
+    list_select_related = ("book",)
+    date_hierarchy = "date"
+
+
+# The circulation log is append-only; its read models are rebuilt with replay_projection.
+@admin.register(CirculationEvent)
+class CirculationEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "previous", "issue", "book", "student", "occurred_at", "recorded_at")
+    list_filter = ("kind",)
+    list_select_related = ("book", "student")
+    search_fields = ("book__title", "student__username")
+    readonly_fields = (
+        "kind", "previous", "issue", "book", "student", "due_date", "fine", "occurred_at", "recorded_at",
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ProjectionOffset)
+class ProjectionOffsetAdmin(admin.ModelAdmin):
+    list_display = ("name", "position", "updated_at")
+    readonly_fields = ("name", "position", "updated_at")
+
+
+@admin.register(CatalogueImport)
+class CatalogueImportAdmin(admin.ModelAdmin):
+    list_display = ("source", "format", "status", "records_done", "created", "updated", "rejected", "started_at")
+    list_filter = ("status", "format")
+    readonly_fields = ("fingerprint", "errors", "last_error")
+
+
+@admin.register(BackgroundTask)
+class BackgroundTaskAdmin(admin.ModelAdmin):
+    list_display = ("name", "status", "attempts", "max_attempts", "run_at", "locked_by", "finished_at")
+    list_filter = ("status", "name")
+    readonly_fields = ("kwargs", "key", "locked_by", "locked_at", "result", "last_error", "finished_at")
@@ -0,0 +1,137 @@
+# college_erp/core/analytics.py
+"""
+Library analytics in a fixed number of queries.
+
+Historical counters and the monthly trend come from one TruncMonth group-by
+over the daily rollup (CirculationDailyStat), current-state counters from one
+conditional aggregate over open issues, and the popular-books table (which
+also carries the book and student totals as scalar subqueries) from a third
+query. None of them scan the full BookIssue history.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, IntegerField, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from . import async_queries, caching
+from .models import Book, BookIssue, CirculationDailyStat, User
+
+TREND_MONTHS = 6
+POPULAR_BOOKS = 5
+RECENT_DAYS = 30
+
+
+def _count_subquery(queryset):
+    """Uncorrelated scalar subquery returning COUNT(*) of `queryset`."""
+    counted = (
+        queryset.order_by()
+        .annotate(_group=Value(1))
+        .values("_group")
+        .annotate(n=Count("*"))
+        .values("n")
+    )
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def month_starts(today, months=TREND_MONTHS):
+    """First day of each of the last `months` calendar months, oldest first."""
+    starts = []
+    year, month = today.year, today.month
+    for _ in range(months):
+        starts.append(today.replace(year=year, month=month, day=1))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return starts[::-1]
+
+
+def open_issue_counters():
+    """Current-state counters, from the open issues only (one query)."""
+    open_issues = BookIssue.objects.filter(action__in=BookIssue.OPEN_ACTIONS)
+    return open_issues.aggregate(
+        active_issues=Count("id"),
+        # Maintained by the nightly `sweep_overdue` command
+        overdue_books=Count("id", filter=Q(action="overdue")),
+        active_students=Count("student", distinct=True),
+    )
+
+
+def history_counters(today=None, months=TREND_MONTHS):
+    """
+    Historical counters and the monthly trend from the daily rollup, in one
+    group-by over calendar months. Returns (counters, monthly_data).
+    """
+    today = today or timezone.localdate()
+    recent = today - timedelta(days=RECENT_DAYS)
+    by_month = {
+        (row["month"].year, row["month"].month): row
+        for row in CirculationDailyStat.objects.annotate(month=TruncMonth("date"))
+        .values("month")
+        .annotate(
+            total_issues=Coalesce(Sum("issues"), 0),
+            recent_issues=Coalesce(Sum("issues", filter=Q(date__gte=recent)), 0),
+            recent_returns=Coalesce(Sum("returns", filter=Q(date__gte=recent)), 0),
+        )
+        .order_by()
+    }
+    counters = {
+        key: sum(row[key] for row in by_month.values())
+        for key in ("total_issues", "recent_issues", "recent_returns")
+    }
+    monthly_data = [
+        {
+            "month": start.strftime("%b"),
+            "count": by_month.get((start.year, start.month), {}).get("total_issues", 0),
+        }
+        for start in month_starts(today, months)
+    ]
+    return counters, monthly_data
+
+
+def popular_books(limit=POPULAR_BOOKS):
+    """
+    Most issued books, each annotated with `issue_count`, `total_books` and
+    `total_students` (the last two are the same on every row).
+    """
+    return list(
+        Book.objects.annotate(
+            issue_count=Coalesce(Sum("daily_stats__issues"), 0),
+            total_books=_count_subquery(Book.objects.all()),
+            total_students=_count_subquery(User.objects.filter(role="student")),
+        ).order_by("-issue_count", "title")[:limit]
+    )
+
+
+def library_summary(now=None):
+    """Context for the analytics dashboard; at most three queries."""
+    today = timezone.localdate(now or timezone.now())
+    summary = open_issue_counters()
+    counters, summary["monthly_data"] = history_counters(today)
+    books = caching.cached("popular_books", popular_books, POPULAR_BOOKS)
+    # Empty catalogue; nothing to count but students.
+    students = None if books else User.objects.filter(role="student").count()
+    return _combine(summary, counters, books, students)
+
+
+async def alibrary_summary(now=None):
+    """library_summary() with its three queries run concurrently."""
+    today = timezone.localdate(now or timezone.now())
+    summary, (counters, monthly_data), books = await async_queries.gather(
+        open_issue_counters,
+        lambda: history_counters(today),
+        lambda: caching.cached("popular_books", popular_books, POPULAR_BOOKS),
+    )
+    summary["monthly_data"] = monthly_data
+    students = None if books else await User.objects.filter(role="student").acount()
+    return _combine(summary, counters, books, students)
+
+
+def _combine(summary, counters, books, students):
+    summary.update(counters)
+    summary["popular_books"] = books
+    if books:
+        summary["total_books"] = books[0].total_books
+        summary["total_students"] = books[0].total_students
+    else:
+        summary["total_books"] = 0
+        summary["total_students"] = students
+    return summary
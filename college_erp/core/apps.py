@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Signal handlers: the profiler's query observer on every new
+        # connection, invalidation of cached session users and the copies
+        # of new books. Importing jobs registers the background tasks
+        # (core.tasks).
+        from . import copies, jobs, profiling, session_user  # noqa: F401
@@ -0,0 +1,85 @@
+# college_erp/core/async_queries.py
+"""
+Concurrent read-only queries for async views.
+
+Django's async ORM (`acount`, `aaggregate`, `aiterator`, ...) hands every
+call to the request's single thread-sensitive executor. So
+`asyncio.gather(a.acount(), b.acount())` still runs the two queries one
+after the other. `gather` here runs independent, read-only queries at the
+same time instead: each call goes to a small thread pool, and each pool
+thread keeps its own database connection.
+
+The calls only see committed data. When the request's own connection is
+inside a transaction (an atomic block, or a TestCase), they run one after
+another on that connection instead, so they see the same snapshot as the
+rest of the request.
+
+Connection budget: every worker process can hold ASYNC_QUERY_THREADS extra
+connections besides the request connections.
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, DEFAULT_DB_ALIAS, connections
+
+DEFAULT_THREADS = 4
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def thread_count():
+    return getattr(settings, "ASYNC_QUERY_THREADS", DEFAULT_THREADS)
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=thread_count(), thread_name_prefix="erp-query"
+            )
+        return _executor
+
+
+def _run(call):
+    try:
+        return call()
+    except DatabaseError:
+        # Reconnect on the next call instead of reusing a broken connection.
+        connections.close_all()
+        raise
+
+
+def _in_transaction(using=DEFAULT_DB_ALIAS):
+    return connections[using].in_atomic_block
+
+
+async def gather(*calls):
+    """
+    Results of the zero-argument callables `calls` (each running read-only
+    ORM code), in order, run concurrently where possible.
+    """
+    if len(calls) < 2 or thread_count() < 1 or await sync_to_async(_in_transaction)():
+        return [await sync_to_async(call)() for call in calls]
+    loop = asyncio.get_running_loop()
+    pool = _pool()
+    # copy_context keeps the request's context (the profiler's current
+    # request) visible on the pool threads.
+    return await asyncio.gather(*(
+        loop.run_in_executor(pool, contextvars.copy_context().run, _run, call)
+        for call in calls
+    ))
+
+
+def shutdown():
+    """Stop the pool threads; their connections close with them."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
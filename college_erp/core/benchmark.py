@@ -0,0 +1,271 @@
+# college_erp/core/benchmark.py
+"""
+Request benchmark over every route in core/urls.py.
+
+Each route is requested through the Django test client as a user with the
+right role, first to warm up and then `iterations` times under a timer.
+For every route we record the status, the number of SQL queries (on any
+thread, see core.profiling.capture), p50/p95/
+mean latency, and the peak Python memory allocated while one request is
+served (measured in a separate run so tracemalloc does not skew the
+timings). `compare` checks a run against an earlier one saved as JSON.
+
+`login_throughput` measures logins per second under each session backend
+and password hasher profile (see config/settings.py).
+"""
+import math
+import platform
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from . import profiling, seeding
+from . import urls as core_urls
+from .models import BackgroundTask, Book, BookIssue, CatalogueImport, Hold, User
+
+DEFAULT_ITERATIONS = 20
+# Latency may grow by this factor before it counts as a regression.
+DEFAULT_TOLERANCE = 1.5
+
+# Who requests each route. Anything not listed runs as a librarian.
+ROUTE_ROLES = {
+    "home": None,
+    "register": None,
+    "login": None,
+    "logout": None,
+    "student_dashboard": "student",
+    "student_issued_books": "student",
+    "teacher_dashboard": "teacher",
+    "admin_dashboard": "admin",
+    "clerk_dashboard": "clerk",
+    "cache_stats": "staff",
+    "profiling_stats": "staff",
+}
+# Routes that only accept POST, with a request body that changes nothing.
+POST_BODIES = {
+    "bulk_issue_books": {"rows": []},
+    "bulk_return_books": {"rows": []},
+    "import_books": {},
+}
+ROUTE_QUERY = {
+    "search_books": {"q": "data"},
+    "student_autocomplete": {"q": "pri"},
+}
+
+
+class MissingData(Exception):
+    pass
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def _users():
+    users = {}
+    for role in ("student", "teacher", "admin", "clerk", "librarian"):
+        users[role] = User.objects.filter(role=role, is_active=True).order_by("pk").first()
+    users["staff"] = User.objects.filter(is_staff=True, is_active=True).order_by("pk").first()
+    return users
+
+
+def _url_kwargs():
+    book = Book.objects.order_by("pk").first()
+    issue = BookIssue.objects.filter(action__in=BookIssue.OPEN_ACTIONS).order_by("pk").first()
+    job = CatalogueImport.objects.order_by("pk").first()
+    task = BackgroundTask.objects.order_by("pk").first()
+    hold = Hold.objects.order_by("pk").first()
+    student = User.objects.filter(role="student").order_by("pk").first()
+    return {
+        "book_id": book.pk if book else None,
+        "issue_id": issue.pk if issue else None,
+        # A missing import, task or hold is still a valid request (404).
+        "import_id": job.pk if job else 0,
+        "task_id": task.pk if task else 0,
+        "hold_id": hold.pk if hold else 0,
+        "student_id": student.pk if student else None,
+    }
+
+
+def routes():
+    """[(name, path)] for every named route in core/urls.py."""
+    kwargs = _url_kwargs()
+    found = []
+    for pattern in core_urls.urlpatterns:
+        if not isinstance(pattern, URLPattern) or not pattern.name:
+            continue
+        needed = {name: kwargs.get(name) for name in pattern.pattern.converters}
+        if None in needed.values():
+            raise MissingData(f"No data for {pattern.name} {sorted(needed)}; run seed_erp first.")
+        found.append((pattern.name, reverse(f"{core_urls.app_name}:{pattern.name}", kwargs=needed)))
+    return found
+
+
+def _request(client, name, path):
+    if name in POST_BODIES:
+        return client.post(path, POST_BODIES[name], content_type="application/json")
+    return client.get(path, ROUTE_QUERY.get(name, {}))
+
+
+def run(iterations=DEFAULT_ITERATIONS, names=None):
+    """Benchmark every route (or only `names`); returns a JSON-serialisable report."""
+    users = _users()
+    results = []
+    for name, path in routes():
+        if names and name not in names:
+            continue
+        role = ROUTE_ROLES.get(name, "librarian")
+        # A broken route shows up as a 500 in the report instead of stopping the run.
+        client = Client(raise_request_exception=False)
+        if role is not None:
+            if users.get(role) is None:
+                raise MissingData(f"No active {role} user for {name}; run seed_erp first.")
+            client.force_login(users[role])
+
+        response = _request(client, name, path)  # warm-up
+        timings, queries = [], []
+        for _ in range(iterations):
+            if role is not None and name == "logout":
+                client.force_login(users[role])
+            # Counted through core.profiling, which also sees the queries
+            # async views run on core.async_queries' pool threads.
+            with profiling.capture() as captured:
+                started = time.perf_counter()
+                response = _request(client, name, path)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(captured.queries)
+
+        tracemalloc.start()
+        try:
+            _request(client, name, path)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        results.append({
+            "name": name,
+            "path": path,
+            "method": "POST" if name in POST_BODIES else "GET",
+            "role": role,
+            "status": response.status_code,
+            "queries": max(queries),
+            "p50_ms": round(percentile(timings, 50), 3),
+            "p95_ms": round(percentile(timings, 95), 3),
+            "mean_ms": round(statistics.fmean(timings), 3),
+            "peak_kib": round(peak / 1024, 1),
+        })
+
+    return {
+        "meta": {
+            "started": timezone.now().isoformat(),
+            "iterations": iterations,
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "rows": {
+                "users": User.objects.count(),
+                "books": Book.objects.count(),
+                "issues": BookIssue.objects.count(),
+            },
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, tolerance=DEFAULT_TOLERANCE):
+    """
+    Regressions of `current` against `baseline` (both run() reports): any
+    route that now runs more queries, or whose p95 grew by more than
+    `tolerance` times.
+    """
+    before = {row["name"]: row for row in baseline["results"]}
+    regressions = []
+    for row in current["results"]:
+        old = before.get(row["name"])
+        if old is None:
+            continue
+        if row["queries"] > old["queries"]:
+            regressions.append(f"{row['name']}: {old['queries']} -> {row['queries']} queries")
+        if row["p95_ms"] > old["p95_ms"] * tolerance:
+            regressions.append(f"{row['name']}: p95 {old['p95_ms']} -> {row['p95_ms']} ms")
+    return regressions
+
+
+# ---------------------------
+# Login throughput
+# ---------------------------
+LOGIN_ATTEMPTS = 20
+LOGIN_PASSWORD = "benchmark-pass-2468"
+# (session backend, password hasher profile); the first one is the old setup.
+LOGIN_SCENARIOS = [
+    ("db", "default"),
+    ("cached_db", "default"),
+    ("signed_cookies", "default"),
+    ("db", "fast"),
+    ("cached_db", "fast"),
+    ("signed_cookies", "fast"),
+]
+
+
+def _login_scenario(session_backend, hasher_profile, attempts):
+    """Time `attempts` fresh-browser logins plus the dashboard they land on."""
+    with override_settings(
+        SESSION_ENGINE=settings.SESSION_ENGINES[session_backend],
+        PASSWORD_HASHERS=settings.PASSWORD_HASHER_PROFILES[hasher_profile],
+    ):
+        email = f"login-benchmark@{seeding.SEED_DOMAIN}"
+        User.objects.create_user(
+            username=email, email=email, password=LOGIN_PASSWORD, role="librarian"
+        )
+        timings, queries = [], []
+        for attempt in range(attempts + 1):
+            client = Client(raise_request_exception=False)
+            with profiling.capture() as captured:
+                started = time.perf_counter()
+                response = client.post(reverse("core:login"), {"email": email, "password": LOGIN_PASSWORD})
+                if response.status_code != 302:
+                    raise MissingData(f"Login failed with {response.status_code}.")
+                client.get(response.url)
+                elapsed = (time.perf_counter() - started) * 1000
+            if attempt:  # the first one warms the dashboard cache
+                timings.append(elapsed)
+                queries.append(captured.queries)
+    total = sum(timings) / 1000
+    return {
+        "session_backend": session_backend,
+        "hasher_profile": hasher_profile,
+        "attempts": attempts,
+        "logins_per_s": round(attempts / total, 2),
+        "queries": max(queries),
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+    }
+
+
+def login_throughput(attempts=LOGIN_ATTEMPTS, scenarios=LOGIN_SCENARIOS):
+    """
+    Logins per second for each (session backend, hasher profile). Every
+    scenario runs in a transaction that is rolled back, so the benchmark
+    user and its sessions are never kept.
+    """
+    results = []
+    for session_backend, hasher_profile in scenarios:
+        with transaction.atomic():
+            results.append(_login_scenario(session_backend, hasher_profile, attempts))
+            transaction.set_rollback(True)
+    return {
+        "meta": {
+            "started": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "cache": settings.CACHES["default"]["BACKEND"],
+            "python": platform.python_version(),
+        },
+        "results": results,
+    }
@@ -0,0 +1,346 @@
+# college_erp/core/book_import.py
+"""
+Bulk catalogue import from CSV or MARC-in-JSON.
+
+Records are parsed as the file is read, de-duplicated on ISBN (ISBN-10 is
+converted to ISBN-13 first) and upserted in batches with
+`bulk_create(update_conflicts=True)`. The copy count in a record is the
+number of copies the library holds. For a title already in the catalogue,
+copies on loan are kept: `copies_total` never drops below them. Copies are
+added to or withdrawn from the shelf (core.copies) to match; new copies of
+a title go to its waiting holds first (core.circulation.release_copies),
+and the title's counters are then recounted from its copies.
+
+Every batch commits together with the CatalogueImport checkpoint. If a run
+fails, importing the same file again skips the records already committed
+and carries on from there.
+"""
+import csv
+import hashlib
+import io
+import json
+import re
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import caching, circulation, copies
+from .models import Book, CatalogueImport, Hold
+
+BATCH_SIZE = 1000
+MAX_STORED_ERRORS = 100
+READ_CHUNK = 64 * 1024
+FORMATS = ("csv", "marc-json")
+UPDATE_FIELDS = ["title", "author", "publisher", "year_published", "copies_total", "copies_available"]
+
+# CSV header -> record key; headers are matched case-insensitively.
+CSV_COLUMNS = {
+    "isbn": "isbn", "isbn13": "isbn", "isbn_13": "isbn", "isbn10": "isbn",
+    "title": "title",
+    "author": "author", "authors": "author",
+    "publisher": "publisher",
+    "year": "year_published", "year_published": "year_published", "published": "year_published",
+    "copies": "copies", "copies_total": "copies", "quantity": "copies", "qty": "copies",
+}
+
+_ISBN_CHARS = re.compile(r"[^0-9Xx]")
+_YEAR = re.compile(r"\d{4}")
+
+
+class CatalogueImportError(Exception):
+    pass
+
+
+def _isbn13_check(digits):
+    return str((10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10) % 10)
+
+
+def normalise_isbn(value):
+    """ISBN-13 digits for an ISBN-10/13 in any punctuation, or None if invalid."""
+    raw = _ISBN_CHARS.sub("", str(value or "").split("(")[0]).upper()
+    if len(raw) == 10 and raw[:9].isdigit():
+        total = sum((10 - i) * (10 if c == "X" else int(c)) for i, c in enumerate(raw))
+        if total % 11:
+            return None
+        body = "978" + raw[:9]
+        return body + _isbn13_check(body)
+    if len(raw) == 13 and raw.isdigit() and raw[12] == _isbn13_check(raw[:12]):
+        return raw
+    return None
+
+
+def clean_record(raw):
+    """Validated record dict from parsed fields; raises ValueError."""
+    isbn = normalise_isbn(raw.get("isbn"))
+    if not isbn:
+        raise ValueError(f"invalid or missing ISBN {raw.get('isbn')!r}")
+    title = (raw.get("title") or "").strip()
+    if not title:
+        raise ValueError("title is required")
+    year = raw.get("year_published")
+    match = _YEAR.search(str(year)) if year else None
+    copies = raw.get("copies")
+    try:
+        copies = 1 if copies in (None, "") else int(copies)
+    except (TypeError, ValueError):
+        raise ValueError(f"copies must be a whole number, got {copies!r}")
+    if copies < 0:
+        raise ValueError("copies must not be negative")
+    return {
+        "isbn": isbn,
+        "title": title[:255],
+        "author": (raw.get("author") or "").strip()[:255],
+        "publisher": (raw.get("publisher") or "").strip()[:255],
+        "year_published": int(match.group()) if match else None,
+        "copies": copies,
+    }
+
+
+def parse_csv(stream):
+    """Yield raw field dicts from a CSV text stream."""
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield {
+            CSV_COLUMNS[key.strip().lower()]: value
+            for key, value in row.items()
+            if key and key.strip().lower() in CSV_COLUMNS
+        }
+
+
+def iter_json_values(stream):
+    """
+    Yield top-level JSON values from a text stream holding either a JSON
+    array or one value per line (JSON Lines), without reading it all.
+    """
+    decoder = json.JSONDecoder()
+    buffer, eof, count = "", False, 0
+    while True:
+        buffer = buffer.lstrip(" \t\r\n,")
+        if buffer.startswith("[") and count == 0:
+            buffer = buffer[1:]
+            continue
+        if buffer.startswith("]"):
+            return
+        if buffer:
+            try:
+                value, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise CatalogueImportError(f"Invalid JSON after record {count}.")
+            else:
+                count += 1
+                buffer = buffer[end:]
+                yield value
+                continue
+        elif eof:
+            return
+        chunk = stream.read(READ_CHUNK)
+        eof = not chunk
+        buffer += chunk
+
+
+def _subfields(field, code):
+    return [
+        value.strip()
+        for subfield in field.get("subfields", [])
+        for key, value in subfield.items()
+        if key == code and isinstance(value, str)
+    ]
+
+
+def marc_fields(record):
+    """Raw field dict from one MARC-in-JSON record."""
+    fields = {}
+    for entry in record.get("fields", []):
+        for tag, value in entry.items():
+            if isinstance(value, dict):
+                fields.setdefault(tag, []).append(value)
+
+    def first(tags, code):
+        for tag in tags:
+            for field in fields.get(tag, []):
+                values = _subfields(field, code)
+                if values:
+                    return values[0]
+        return ""
+
+    isbns = [value for field in fields.get("020", []) for value in _subfields(field, "a")]
+    title = " ".join(filter(None, [first(["245"], "a"), first(["245"], "b")]))
+    return {
+        "isbn": next((isbn for isbn in isbns if normalise_isbn(isbn)), isbns[0] if isbns else ""),
+        "title": title.rstrip(" /:;,."),
+        "author": first(["100", "110", "700"], "a").rstrip(" ,."),
+        "publisher": first(["264", "260"], "b").rstrip(" :;,"),
+        "year_published": first(["264", "260"], "c"),
+        # One 852 (location/holdings) field per copy unless the feed says otherwise.
+        "copies": record.get("copies", len(fields.get("852", [])) or 1),
+    }
+
+
+def parse_marc_json(stream):
+    for record in iter_json_values(stream):
+        if not isinstance(record, dict):
+            raise CatalogueImportError("MARC-in-JSON records must be objects.")
+        yield marc_fields(record)
+
+
+PARSERS = {"csv": parse_csv, "marc-json": parse_marc_json}
+
+
+def detect_format(name):
+    lowered = (name or "").lower()
+    if lowered.endswith((".json", ".jsonl", ".ndjson")):
+        return "marc-json"
+    return "csv"
+
+
+def fingerprint(fileobj):
+    """SHA-256 of a binary file object, which is left rewound."""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(READ_CHUNK), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def _match_copies(books, existing):
+    """Add or withdraw copies so each upserted book has copies_total of them."""
+    added, withdrawn = {}, {}
+    new_isbns = [book.isbn for book in books if book.isbn not in existing]
+    ids = dict(Book.objects.filter(isbn__in=new_isbns).values_list("isbn", "pk")) if new_isbns else {}
+    for book in books:
+        old = existing.get(book.isbn)
+        if old is None:
+            added[ids[book.isbn]] = book.copies_total
+        elif book.copies_total > old.copies_total:
+            added[old.pk] = book.copies_total - old.copies_total
+        elif book.copies_total < old.copies_total:
+            withdrawn[old.pk] = old.copies_total - book.copies_total
+    if added:
+        created = copies.create_copies(added)
+        queued = set(
+            Hold.objects.filter(book_id__in=list(added), status="waiting")
+            .order_by().values_list("book_id", flat=True).distinct()
+        )
+        now = timezone.now()
+        for book_id in queued:
+            circulation.release_copies(book_id, [copy.pk for copy in created if copy.book_id == book_id], now)
+    if withdrawn:
+        copies.withdraw_copies(withdrawn)
+    recount = [old.pk for old in existing.values() if old.pk in added or old.pk in withdrawn]
+    if recount:
+        Book.objects.filter(pk__in=recount).update(**copies.counter_expressions())
+
+
+def apply_batch(records):
+    """Upsert one batch of clean records; returns (created, updated)."""
+    by_isbn = {record["isbn"]: record for record in records}  # last one wins
+    with transaction.atomic():
+        existing = {
+            book.isbn: book
+            for book in Book.objects.select_for_update()
+            .filter(isbn__in=list(by_isbn))
+            .order_by("pk")
+            .only("id", "isbn", *UPDATE_FIELDS)
+        }
+        books = []
+        for isbn, record in by_isbn.items():
+            book = Book(isbn=isbn, title=record["title"], copies_total=record["copies"])
+            old = existing.get(isbn)
+            if old is None:
+                book.author = record["author"]
+                book.publisher = record["publisher"]
+                book.year_published = record["year_published"]
+                book.copies_available = record["copies"]
+            else:
+                on_loan = max(old.copies_total - old.copies_available, 0)
+                book.author = record["author"] or old.author
+                book.publisher = record["publisher"] or old.publisher
+                book.year_published = record["year_published"] or old.year_published
+                book.copies_total = max(record["copies"], on_loan)
+                book.copies_available = book.copies_total - on_loan
+            books.append(book)
+        Book.objects.bulk_create(
+            books,
+            update_conflicts=True,
+            unique_fields=["isbn"],
+            update_fields=UPDATE_FIELDS,
+        )
+        _match_copies(books, existing)
+        caching.bump_library_version()
+    return len(books) - len(existing), len(existing)
+
+
+def run_import(fileobj, source, fmt=None, batch_size=BATCH_SIZE, progress=None, restart=False):
+    """
+    Import a binary file object. Resumes the latest unfinished import of the
+    same file unless `restart`. Calls progress(job, records_this_run,
+    seconds) after every batch. Returns the CatalogueImport.
+    """
+    fmt = fmt or detect_format(source)
+    if fmt not in PARSERS:
+        raise CatalogueImportError(f"Unknown format {fmt!r}; use one of {', '.join(FORMATS)}.")
+    digest = fingerprint(fileobj)
+    job = None
+    if not restart:
+        job = (
+            CatalogueImport.objects.filter(fingerprint=digest, format=fmt)
+            .exclude(status="completed")
+            .order_by("-started_at")
+            .first()
+        )
+    if job is None:
+        job = CatalogueImport.objects.create(source=source[:255], fingerprint=digest, format=fmt)
+    else:
+        job.status = "running"
+        job.last_error = ""
+        job.save(update_fields=["status", "last_error", "updated_at"])
+
+    skip = job.records_done
+    started = time.monotonic()
+    processed = 0
+    batch, errors, consumed = [], [], 0
+
+    def commit():
+        nonlocal batch, errors, consumed, processed
+        with transaction.atomic():
+            created, updated = apply_batch(batch) if batch else (0, 0)
+            job.records_done += consumed
+            job.created += created
+            job.updated += updated
+            job.rejected += len(errors)
+            job.errors = (job.errors + errors)[:MAX_STORED_ERRORS]
+            job.save(update_fields=[
+                "records_done", "created", "updated", "rejected", "errors", "updated_at",
+            ])
+        processed += consumed
+        batch, errors, consumed = [], [], 0
+        if progress:
+            progress(job, processed, time.monotonic() - started)
+
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        for position, raw in enumerate(PARSERS[fmt](text), start=1):
+            if position <= skip:
+                continue
+            consumed += 1
+            try:
+                batch.append(clean_record(raw))
+            except ValueError as exc:
+                errors.append({"record": position, "error": str(exc)})
+            if consumed >= batch_size:
+                commit()
+        commit()
+    except Exception as exc:
+        job.status = "failed"
+        job.last_error = str(exc)[:1000]
+        job.save(update_fields=["status", "last_error", "updated_at"])
+        raise
+    finally:
+        text.detach()
+
+    job.status = "completed"
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "finished_at", "updated_at"])
+    return job
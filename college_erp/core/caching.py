@@ -0,0 +1,153 @@
+# college_erp/core/caching.py
+"""
+Versioned cache for dashboard counters and popular-books lists.
+
+Every cached library value lives under a key that embeds the current
+library version. Issuing, returning, adding books and registering students
+bump the version (after the transaction commits), which makes all older
+entries unreachable at once: nothing is ever served stale and no key has to
+be deleted one by one. Old entries simply age out of the cache.
+
+Per-student values (cached_for_student) work the same way under a version
+of their own, so one student's loan does not invalidate everyone else's.
+
+Hits and misses are counted in the cache itself so the numbers are shared
+by every worker when the Redis backend is configured.
+"""
+from asgiref.sync import sync_to_async
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+VERSION_KEY = "erp:library:version"
+STATS_KEYS = {"hit": "erp:cache:hits", "miss": "erp:cache:misses"}
+DEFAULT_TIMEOUT = 300
+
+_MISSING = object()
+
+
+def _incr(key, delta=1):
+    # add() is a no-op when the key exists, so concurrent first calls are safe.
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # Evicted between add() and incr().
+        cache.set(key, delta, timeout=None)
+        return delta
+
+
+def library_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_library_version():
+    """Invalidate every cached library value once the current transaction commits."""
+    transaction.on_commit(lambda: _incr(VERSION_KEY))
+
+
+def versioned_key(name, *parts):
+    suffix = ":".join(str(part) for part in parts)
+    return f"erp:{name}:v{library_version()}:{suffix}"
+
+
+def _fetch(key, compute, timeout):
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        _incr(STATS_KEYS["miss"])
+        value = compute()
+        cache.set(key, value, timeout)
+    else:
+        _incr(STATS_KEYS["hit"])
+    return value
+
+
+def cached(name, compute, *parts, timeout=DEFAULT_TIMEOUT):
+    """Return compute() from the cache under a versioned key, filling it on a miss."""
+    return _fetch(versioned_key(name, *parts), compute, timeout)
+
+
+async def acached(name, compute, *parts, timeout=DEFAULT_TIMEOUT):
+    """Async cached(): `compute` is a coroutine function."""
+    key = await sync_to_async(versioned_key)(name, *parts)
+    value = await cache.aget(key, _MISSING)
+    if value is _MISSING:
+        await sync_to_async(_incr)(STATS_KEYS["miss"])
+        value = await compute()
+        await cache.aset(key, value, timeout)
+    else:
+        await sync_to_async(_incr)(STATS_KEYS["hit"])
+    return value
+
+
+def cache_stats():
+    hits = cache.get(STATS_KEYS["hit"], 0)
+    misses = cache.get(STATS_KEYS["miss"], 0)
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / lookups, 4) if lookups else None,
+        "version": library_version(),
+    }
+
+
+def reset_cache_stats():
+    cache.delete_many(list(STATS_KEYS.values()))
+
+
+def is_shared():
+    """
+    Whether every worker sees the same cache. With per-process local memory
+    (or the dummy cache) a version bump only reaches the worker that made it.
+    """
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+# Per-user versions: core.session_user keeps a copy of each signed-in user in
+# the session and trusts it only while the user's version is unchanged.
+USER_VERSION_KEY = "erp:user:{}:version"
+
+
+def user_version(user_id):
+    return cache.get(USER_VERSION_KEY.format(user_id), 0)
+
+
+def bump_user_version(user_id):
+    """Invalidate session copies of this user once the current transaction commits."""
+    transaction.on_commit(lambda: _incr(USER_VERSION_KEY.format(user_id)))
+
+
+# Per-student versions: core.student_summary caches each student's loan
+# summary under the student's version, bumped whenever they issue or return.
+STUDENT_VERSION_KEY = "erp:student:{}:version"
+
+
+def student_version(student_id):
+    return cache.get(STUDENT_VERSION_KEY.format(student_id), 0)
+
+
+def bump_student_versions(student_ids):
+    """Invalidate the cached summaries of these students once the current transaction commits."""
+    keys = [STUDENT_VERSION_KEY.format(student_id) for student_id in set(student_ids)]
+
+    def bump():
+        for key in keys:
+            _incr(key)
+
+    transaction.on_commit(bump)
+
+
+def student_key(name, student_id, *parts):
+    suffix = ":".join(str(part) for part in parts)
+    return f"erp:{name}:s{student_id}:v{student_version(student_id)}:{suffix}"
+
+
+def cached_for_student(name, student_id, compute, *parts, timeout=DEFAULT_TIMEOUT):
+    """cached() under the student's own version instead of the library's."""
+    return _fetch(student_key(name, student_id, *parts), compute, timeout)
@@ -0,0 +1,510 @@
+# college_erp/core/circulation.py
+"""
+Transactional issue/return engine.
+
+Copy counters are only ever changed with conditional F() updates inside a
+transaction, so two desks issuing the last copy at the same moment cannot
+both succeed: the database serialises the UPDATEs on the book row and the
+second one matches zero rows. The one-open-issue-per-(book, student) rule is
+enforced by the `unique_open_issue_per_book_student` constraint on BookIssue.
+
+Each loan also takes a physical copy (BookCopy) off the shelf and a return
+puts it back, in the same transaction as the counter update, so the
+counters on Book keep matching the copies (see core.copies). A returned
+copy goes to the first hold in line instead, if any (see core.holds).
+Fines on returned loans are charged to the fine ledger (core.ledger) in
+the return's transaction.
+
+Every change of a loan's state is also appended to the circulation log
+(core.events) in the same transaction; the daily rollup and the other read
+models are projected from there (core.projections).
+"""
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DecimalField, F, Q, Value, When
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from . import caching, events, ledger
+from .fines import NO_FINE, fine_for
+from .models import Book, BookCopy, BookIssue, Hold, User
+
+DEFAULT_LOAN_DAYS = 14
+# Days a copy waits on the hold shelf for the student it was set aside for.
+DEFAULT_PICKUP_DAYS = 3
+
+BULK_MAX_ROWS = 10000
+BULK_BATCH_SIZE = 500
+
+
+class CirculationError(Exception):
+    """Base class for issue/return failures that should be shown to the user."""
+
+
+class NoCopiesAvailable(CirculationError):
+    pass
+
+
+class AlreadyIssued(CirculationError):
+    pass
+
+
+class IssueNotOpen(CirculationError):
+    pass
+
+
+def default_due_date(today=None):
+    return (today or timezone.localdate()) + timedelta(days=DEFAULT_LOAN_DAYS)
+
+
+def pickup_days():
+    return getattr(settings, "HOLD_PICKUP_DAYS", DEFAULT_PICKUP_DAYS)
+
+
+def _shelve_uncopied(book_id, count):
+    # Returns of issues recorded without a copy only move the counter.
+    Book.objects.filter(pk=book_id).update(
+        copies_available=Least(F("copies_available") + count, F("copies_total"))
+    )
+
+
+def release_copies(book_id, copy_ids, now=None):
+    """
+    Put freed copies of a book back into circulation, inside the caller's
+    transaction. The first holds in line get one copy each, set aside on
+    the hold shelf until their pickup deadline; the rest go back on the
+    shelf. Returns the holds that became ready.
+    """
+    now = now or timezone.now()
+    # Every change to a book's queue holds the book row first.
+    list(Book.objects.select_for_update().filter(pk=book_id).values_list("pk", flat=True))
+    heads = list(Hold.objects.filter(book_id=book_id, status="waiting").order_by("ticket")[: len(copy_ids)])
+    if heads:
+        expires_at = now + timedelta(days=pickup_days())
+        for hold, copy_id in zip(heads, copy_ids):
+            hold.status, hold.copy_id, hold.ready_at, hold.expires_at = "ready", copy_id, now, expires_at
+        Hold.objects.bulk_update(heads, ["status", "copy", "ready_at", "expires_at"])
+        BookCopy.objects.filter(pk__in=copy_ids[: len(heads)]).update(status="on_hold")
+    shelved = copy_ids[len(heads):]
+    if shelved:
+        BookCopy.objects.filter(pk__in=shelved).update(status="available")
+        _shelve_uncopied(book_id, len(shelved))
+    return heads
+
+
+def _fulfil(*holds):
+    # Conditional, so a hold expired or cancelled meanwhile is left alone.
+    # The hold rows are locked here, after any book row lock, which is the
+    # order core.holds takes them in too.
+    return Hold.objects.filter(pk__in=[hold.pk for hold in holds], status="ready").update(
+        status="fulfilled", closed_at=timezone.now()
+    )
+
+
+def _take_copy(book_id, copy_id=None):
+    """
+    Mark an available copy of the book (`copy_id`, or the oldest on the
+    shelf) as on loan and return its id, or None if there is none. The
+    caller has already updated the book row, which serialises this.
+    """
+    shelf = BookCopy.objects.filter(book_id=book_id, status="available")
+    if copy_id is None:
+        copy_id = shelf.order_by("id").values_list("id", flat=True).first()
+    if copy_id is None or not shelf.filter(pk=copy_id).update(status="on_loan"):
+        return None
+    return copy_id
+
+
+def issue_book(book, student, due_date=None, copy=None):
+    """
+    Issue one copy of `book` to `student` and return the new BookIssue.
+    Pass `copy` (e.g. scanned at the desk) to hand out that copy. A student
+    whose hold is ready gets the copy set aside for them.
+
+    Raises NoCopiesAvailable or AlreadyIssued; in both cases nothing is
+    written.
+    """
+    book_id = getattr(book, "pk", book)
+    copy_id = getattr(copy, "pk", copy)
+    try:
+        with transaction.atomic():
+            hold = (
+                Hold.objects.filter(book_id=book_id, student=student, status="ready")
+                .exclude(copy=None)
+                .first()
+            )
+            if hold is not None and copy_id in (None, hold.copy_id) and _fulfil(hold):
+                # Off the hold shelf: the copy was never counted as available.
+                BookCopy.objects.filter(pk=hold.copy_id).update(status="on_loan")
+                taken = hold.copy_id
+            else:
+                taken = Book.objects.filter(pk=book_id, copies_available__gt=0).update(
+                    copies_available=F("copies_available") - 1
+                )
+                if taken:
+                    taken = _take_copy(book_id, copy_id)
+                if not taken:
+                    if copy_id is not None:
+                        raise NoCopiesAvailable("This copy is not available.")
+                    raise NoCopiesAvailable("No copies available for this book.")
+                if hold is not None and _fulfil(hold):
+                    # Took another copy: the one set aside goes to the next in line.
+                    release_copies(book_id, [hold.copy_id])
+            issue = BookIssue.objects.create(
+                book_id=book_id,
+                copy_id=taken,
+                student=student,
+                action="issued",
+                due_date=due_date or default_due_date(),
+            )
+            events.record([events.event("issued", issue, issue.issued_at)])
+            caching.bump_library_version()
+            caching.bump_student_versions([issue.student_id])
+            return issue
+    except IntegrityError as exc:
+        # The constraint fired, so the decrement above was rolled back too.
+        name = student.get_full_name() or student.username
+        raise AlreadyIssued(f"{name} already has this book issued.") from exc
+
+
+def return_book(issue, returned_at=None):
+    """
+    Mark an open issue as returned, charge any overdue fine to the student's
+    ledger and put the copy back on the shelf. Returns the updated BookIssue.
+    """
+    issue_id = getattr(issue, "pk", issue)
+    returned_at = returned_at or timezone.now()
+    with transaction.atomic():
+        try:
+            issue = (
+                BookIssue.objects.select_for_update(of=("self",))
+                .select_related("book", "student")
+                .get(pk=issue_id, action__in=BookIssue.OPEN_ACTIONS)
+            )
+        except BookIssue.DoesNotExist:
+            raise IssueNotOpen("Issue record not found or already returned.")
+
+        today = timezone.localdate(returned_at)
+        previous = issue.action
+        issue.fine_amount = fine_for(issue.due_date, today)
+        issue.action = "returned"
+        issue.returned_at = returned_at
+        issue.save(update_fields=["action", "returned_at", "fine_amount"])
+
+        if issue.copy_id:
+            release_copies(issue.book_id, [issue.copy_id], returned_at)
+        else:
+            _shelve_uncopied(issue.book_id, 1)
+        ledger.charge_returns([issue], returned_at)
+        events.record([events.event("returned", issue, returned_at, previous)])
+        caching.bump_library_version()
+        caching.bump_student_versions([issue.student_id])
+    return issue
+
+
+# ---------------------------
+# Bulk circulation
+# ---------------------------
+# Both bulk operations take plain dicts (parsed from CSV or JSON) and return
+# (issues, errors). Each error is {"row": n, "error": message} with 1-based
+# row numbers; rows with errors are skipped and the rest are still applied.
+# All lookups are set-based, so the query count depends on the number of
+# distinct books in the batch, not on the number of rows.
+
+def _parse_due_date(value):
+    if value in (None, ""):
+        return None
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value).strip(), "%Y-%m-%d").date()
+
+
+def _book_key(row):
+    """Return ("id", pk) or ("isbn", isbn) for a row, or None if neither is set."""
+    book_id = row.get("book_id")
+    if book_id not in (None, ""):
+        return ("id", int(book_id))
+    isbn = str(row.get("isbn") or "").strip()
+    if isbn:
+        return ("isbn", isbn)
+    return None
+
+
+def _student_email(row):
+    return str(row.get("student_email") or "").strip()
+
+
+def _resolve_books(keys, lock=False):
+    """Fetch every book referenced by `keys` in one query, keyed the same way."""
+    ids = {value for kind, value in keys if kind == "id"}
+    isbns = {value for kind, value in keys if kind == "isbn"}
+    books = Book.objects.filter(Q(pk__in=ids) | Q(isbn__in=isbns)).only(
+        "id", "isbn", "title", "copies_total", "copies_available"
+    )
+    if lock:
+        # Lock in primary-key order so concurrent batches cannot deadlock.
+        books = books.select_for_update().order_by("pk")
+    by_key = {}
+    for book in books:
+        by_key[("id", book.pk)] = book
+        if book.isbn in isbns:
+            # Book.isbn is unique, so this is the only match.
+            by_key[("isbn", book.isbn)] = book
+    return by_key
+
+
+def _resolve_students(emails):
+    students = User.objects.filter(role="student", username__in=emails).only(
+        "id", "username", "first_name", "last_name"
+    )
+    return {student.username: student for student in students}
+
+
+def _lookup_book(books, key):
+    book = books.get(key)
+    if book is None:
+        return None, "Book not found."
+    return book, None
+
+
+def _check_batch_size(rows):
+    if len(rows) > BULK_MAX_ROWS:
+        raise CirculationError(f"A batch can contain at most {BULK_MAX_ROWS} rows.")
+
+
+def bulk_issue(rows):
+    """
+    Issue many (book, student) pairs in one transaction.
+
+    Each row needs `book_id` or `isbn`, `student_email` and optionally
+    `due_date` (YYYY-MM-DD, defaults to the usual loan period). A student
+    whose hold is ready gets the copy set aside for them, as in issue_book.
+    Other copies are handed out in row order, so when a book runs out the
+    later rows for it are reported as errors.
+    """
+    _check_batch_size(rows)
+    errors = []
+    parsed = []
+    for index, row in enumerate(rows, start=1):
+        try:
+            key = _book_key(row)
+            due_date = _parse_due_date(row.get("due_date"))
+        except (TypeError, ValueError):
+            errors.append({"row": index, "error": "Invalid book_id or due_date."})
+            continue
+        email = _student_email(row)
+        if key is None or not email:
+            errors.append({"row": index, "error": "book_id or isbn and student_email are required."})
+            continue
+        parsed.append((index, key, email, due_date))
+
+    issues = []
+    if parsed:
+        students = _resolve_students({email for _, _, email, _ in parsed})
+        with transaction.atomic():
+            # Locking the books first serialises us against single-copy
+            # issue/return, so the availability we read below stays true.
+            books = _resolve_books({key for _, key, _, _ in parsed}, lock=True)
+            candidates = []
+            for index, key, email, due_date in parsed:
+                book, error = _lookup_book(books, key)
+                student = students.get(email)
+                if error is None and student is None:
+                    error = "Student not found."
+                if error:
+                    errors.append({"row": index, "error": error})
+                    continue
+                candidates.append((index, book, student, due_date))
+
+            open_pairs = set(
+                BookIssue.objects.filter(
+                    book_id__in={book.pk for _, book, _, _ in candidates},
+                    student_id__in={student.pk for _, _, student, _ in candidates},
+                    action__in=BookIssue.OPEN_ACTIONS,
+                ).values_list("book_id", "student_id").order_by()
+            )
+            # Ready holds keep their copy on the hold shelf, outside the
+            # available count; the books are locked, so they stay ready.
+            ready = {
+                (hold.book_id, hold.student_id): hold
+                for hold in Hold.objects.filter(
+                    book_id__in={book.pk for _, book, _, _ in candidates},
+                    student_id__in={student.pk for _, _, student, _ in candidates},
+                    status="ready",
+                ).exclude(copy=None)
+            }
+            # Copies come off the shelf oldest first (pop() from the end).
+            shelves = {}
+            for copy_id, book_id in (
+                BookCopy.objects.filter(
+                    book_id__in={book.pk for _, book, _, _ in candidates}, status="available"
+                ).order_by("book_id", "-id").values_list("id", "book_id")
+            ):
+                shelves.setdefault(book_id, []).append(copy_id)
+            remaining = {
+                book.pk: min(book.copies_available, len(shelves.get(book.pk, ())))
+                for _, book, _, _ in candidates
+            }
+            taken = Counter()
+            fulfilled = []
+            fallback_due = default_due_date()
+            for index, book, student, due_date in candidates:
+                if (book.pk, student.pk) in open_pairs:
+                    name = student.get_full_name() or student.username
+                    errors.append({"row": index, "error": f"{name} already has this book issued."})
+                    continue
+                hold = ready.get((book.pk, student.pk))
+                if hold is not None:
+                    fulfilled.append(hold)
+                    open_pairs.add((book.pk, student.pk))
+                    issues.append(BookIssue(
+                        book=book, copy_id=hold.copy_id, student=student, action="issued",
+                        due_date=due_date or fallback_due,
+                    ))
+                    continue
+                if remaining[book.pk] <= 0:
+                    errors.append({"row": index, "error": "No copies available for this book."})
+                    continue
+                remaining[book.pk] -= 1
+                taken[book.pk] += 1
+                open_pairs.add((book.pk, student.pk))
+                issues.append(BookIssue(
+                    book=book, copy_id=shelves[book.pk].pop(), student=student, action="issued",
+                    due_date=due_date or fallback_due,
+                ))
+
+            issues = BookIssue.objects.bulk_create(issues, batch_size=BULK_BATCH_SIZE)
+            if fulfilled:
+                _fulfil(*fulfilled)
+            if issues:
+                # Shelf copies and the ones off the hold shelf alike.
+                BookCopy.objects.filter(pk__in=[issue.copy_id for issue in issues]).update(status="on_loan")
+            for book_id, count in taken.items():
+                updated = Book.objects.filter(
+                    pk=book_id, copies_available__gte=count
+                ).update(copies_available=F("copies_available") - count)
+                if not updated:
+                    # Only reachable on databases without row locks.
+                    raise NoCopiesAvailable("Book availability changed during the batch; please retry.")
+            if issues:
+                events.record([events.event("issued", issue, issue.issued_at) for issue in issues])
+                caching.bump_library_version()
+                caching.bump_student_versions(issue.student_id for issue in issues)
+
+    errors.sort(key=lambda e: e["row"])
+    return issues, errors
+
+
+def bulk_return(rows, returned_at=None):
+    """
+    Return many open issues in one transaction, fining overdue ones.
+
+    Each row needs `issue_id`, or `book_id`/`isbn` plus `student_email`.
+    Statuses and fines are written with a single UPDATE and each book's
+    counter is bumped once by the number of copies coming back.
+    """
+    _check_batch_size(rows)
+    returned_at = returned_at or timezone.now()
+    today = timezone.localdate(returned_at)
+    errors = []
+    parsed = []
+    for index, row in enumerate(rows, start=1):
+        try:
+            issue_id = row.get("issue_id")
+            if issue_id not in (None, ""):
+                parsed.append((index, int(issue_id), None, None))
+                continue
+            key = _book_key(row)
+        except (TypeError, ValueError):
+            errors.append({"row": index, "error": "Invalid issue_id or book_id."})
+            continue
+        email = _student_email(row)
+        if key is None or not email:
+            errors.append({"row": index, "error": "issue_id, or book_id or isbn and student_email, is required."})
+            continue
+        parsed.append((index, None, key, email))
+
+    issues = []
+    if parsed:
+        pairs = [(key, email) for _, issue_id, key, email in parsed if issue_id is None]
+        books = _resolve_books({key for key, _ in pairs}) if pairs else {}
+        students = _resolve_students({email for _, email in pairs}) if pairs else {}
+        issue_ids = {issue_id for _, issue_id, _, _ in parsed if issue_id is not None}
+        pair_filter = Q(
+            book_id__in={b.pk for b in books.values()},
+            student_id__in={s.pk for s in students.values()},
+        )
+
+        with transaction.atomic():
+            open_issues = list(
+                BookIssue.objects.select_for_update(of=("self",))
+                .select_related("book", "student")
+                .filter(Q(pk__in=issue_ids) | pair_filter, action__in=BookIssue.OPEN_ACTIONS)
+            )
+            by_id = {issue.pk: issue for issue in open_issues}
+            by_pair = {(issue.book_id, issue.student_id): issue for issue in open_issues}
+
+            seen, previous = set(), {}
+            for index, issue_id, key, email in parsed:
+                if issue_id is not None:
+                    issue = by_id.get(issue_id)
+                else:
+                    book, error = _lookup_book(books, key)
+                    student = students.get(email)
+                    if error:
+                        errors.append({"row": index, "error": error})
+                        continue
+                    issue = by_pair.get((book.pk, student.pk)) if student else None
+                if issue is None:
+                    errors.append({"row": index, "error": "No open issue found."})
+                    continue
+                if issue.pk in seen:
+                    errors.append({"row": index, "error": "Issue listed more than once."})
+                    continue
+                seen.add(issue.pk)
+                previous[issue.pk] = issue.action
+                issue.action = "returned"
+                issue.returned_at = returned_at
+                issue.fine_amount = fine_for(issue.due_date, today)
+                issues.append(issue)
+
+            if issues:
+                # Fines take at most MAX_FINE + 1 distinct values, so group
+                # rows by amount to keep the CASE small.
+                by_fine = {}
+                for issue in issues:
+                    by_fine.setdefault(issue.fine_amount, []).append(issue.pk)
+                BookIssue.objects.filter(pk__in=seen).update(
+                    action="returned",
+                    returned_at=returned_at,
+                    fine_amount=Case(
+                        *[When(pk__in=pks, then=Value(fine)) for fine, pks in by_fine.items() if fine],
+                        default=Value(NO_FINE),
+                        output_field=DecimalField(max_digits=8, decimal_places=2),
+                    ),
+                )
+                returns = Counter(issue.book_id for issue in issues)
+                freed = {}
+                for issue in issues:
+                    if issue.copy_id:
+                        freed.setdefault(issue.book_id, []).append(issue.copy_id)
+                # Books in primary-key order, as in bulk_issue, so concurrent
+                # batches cannot deadlock on the row locks.
+                for book_id in sorted(returns):
+                    copy_ids = freed.get(book_id, [])
+                    if copy_ids:
+                        release_copies(book_id, copy_ids, returned_at)
+                    if returns[book_id] > len(copy_ids):
+                        _shelve_uncopied(book_id, returns[book_id] - len(copy_ids))
+                ledger.charge_returns(issues, returned_at)
+                events.record([
+                    events.event("returned", issue, returned_at, previous[issue.pk]) for issue in issues
+                ])
+                caching.bump_library_version()
+                caching.bump_student_versions(issue.student_id for issue in issues)
+
+    errors.sort(key=lambda e: e["row"])
+    return issues, errors
@@ -0,0 +1,164 @@
+# college_erp/core/copies.py
+"""
+Physical copies (BookCopy) and the per-book counters that summarise them.
+
+Every copy carries a unique barcode, so a desk scan is one lookup on the
+barcode's unique index. Book.copies_total counts a book's copies that have
+not been withdrawn and Book.copies_available the ones on the shelf.
+Whatever changes a copy's status adjusts those counters with F() updates in
+the same transaction (core.circulation for loans), so availability is read
+straight off the book row and never recounted. check_counters() lists the
+books whose counters disagree with their copies; sync_counters() rewrites
+them from the copies.
+
+A book saved for the first time gets the copies its counters describe from
+a post_save handler. bulk_create() sends no signals, so seeding and the
+catalogue import call create_copies() themselves. An existing book's copy
+count changes through set_copy_count() (the admin uses it), never by
+editing the counters.
+"""
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import caching
+from .models import Book, BookCopy, BookIssue
+
+BARCODE_FORMAT = "LIB-{book_id:06d}-{number:03d}"
+BATCH_SIZE = 500
+# Counted in copies_total; withdrawn copies have left the collection.
+HELD_STATUSES = ("available", "on_loan", "on_hold", "lost")
+
+
+def barcode(book_id, number):
+    return BARCODE_FORMAT.format(book_id=book_id, number=number)
+
+
+def scan(code):
+    """The copy with barcode `code`, its book joined, or None."""
+    try:
+        return BookCopy.objects.select_related("book").get(barcode=code.strip())
+    except BookCopy.DoesNotExist:
+        return None
+
+
+def open_issue(copy):
+    """The open loan of `copy` with its student, or None."""
+    try:
+        return BookIssue.objects.select_related("student").get(
+            copy=copy, action__in=BookIssue.OPEN_ACTIONS
+        )
+    except BookIssue.DoesNotExist:
+        return None
+
+
+def create_copies(counts, status="available", new_books=False, batch_size=BATCH_SIZE):
+    """
+    Add counts[book_id] copies with `status` to each book, numbering the
+    barcodes on from the book's existing copies (skip that lookup with
+    `new_books=True`). Keeping the counters in step is up to the caller,
+    who should hold the book rows locked.
+    """
+    used = {} if new_books else dict(
+        BookCopy.objects.filter(book_id__in=list(counts))
+        .values("book").annotate(n=Count("id")).values_list("book", "n").order_by()
+    )
+    copies = [
+        BookCopy(book_id=book_id, barcode=barcode(book_id, used.get(book_id, 0) + n), status=status)
+        for book_id, count in counts.items()
+        for n in range(1, count + 1)
+    ]
+    return BookCopy.objects.bulk_create(copies, batch_size=batch_size)
+
+
+def withdraw_copies(counts):
+    """
+    Withdraw up to counts[book_id] copies from each book's shelf, newest
+    first, and return how many went per book. Counters are the caller's job.
+    """
+    withdrawn = {}
+    for book_id, count in counts.items():
+        ids = list(
+            BookCopy.objects.filter(book_id=book_id, status="available")
+            .order_by("-id").values_list("id", flat=True)[:count]
+        )
+        withdrawn[book_id] = BookCopy.objects.filter(pk__in=ids, status="available").update(status="withdrawn")
+    return withdrawn
+
+
+def set_copy_count(book_id, total, now=None):
+    """
+    Add or withdraw copies so the book holds `total` of them, then rewrite
+    its counters from the copies. New copies go to waiting holds first
+    (core.circulation.release_copies). Only copies on the shelf can be
+    withdrawn, so a book with copies out may keep more than `total`.
+    Returns the book's copies_total afterwards.
+    """
+    from . import circulation
+
+    with transaction.atomic():
+        # Lock the book first, as everything that changes its copies does.
+        Book.objects.select_for_update().only("id").get(pk=book_id)
+        held = BookCopy.objects.filter(book_id=book_id, status__in=HELD_STATUSES).count()
+        if total > held:
+            added = create_copies({book_id: total - held})
+            circulation.release_copies(book_id, [copy.pk for copy in added], now)
+        elif total < held:
+            withdraw_copies({book_id: held - total})
+        Book.objects.filter(pk=book_id).update(**counter_expressions())
+        caching.bump_library_version()
+    return Book.objects.values_list("copies_total", flat=True).get(pk=book_id)
+
+
+def _count(statuses):
+    return Coalesce(
+        Subquery(
+            BookCopy.objects.filter(book=OuterRef("pk"), status__in=statuses)
+            .order_by().values("book").annotate(n=Count("id")).values("n"),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def counter_expressions():
+    """copies_total and copies_available recomputed from the copies, for update()/annotate()."""
+    return {"copies_total": _count(HELD_STATUSES), "copies_available": _count(("available",))}
+
+
+def check_counters(book_ids=None):
+    """Books whose counters disagree with their copies."""
+    expressions = counter_expressions()
+    books = Book.objects.all() if book_ids is None else Book.objects.filter(pk__in=book_ids)
+    return books.annotate(
+        held=expressions["copies_total"], on_shelf=expressions["copies_available"]
+    ).exclude(copies_total=F("held"), copies_available=F("on_shelf"))
+
+
+def sync_counters(book_ids=None):
+    """Rewrite the counters of out-of-step books from their copies; returns how many changed."""
+    with transaction.atomic():
+        stale = list(check_counters(book_ids).values_list("pk", flat=True))
+        if not stale:
+            return 0
+        Book.objects.filter(pk__in=stale).update(**counter_expressions())
+        caching.bump_library_version()
+    return len(stale)
+
+
+@receiver(post_save, sender=Book)
+def _create_copies_for_new_book(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    available = min(instance.copies_available, instance.copies_total)
+    # Copies counted as off the shelf have no loan to attach to: they start as lost.
+    BookCopy.objects.bulk_create(
+        BookCopy(
+            book=instance,
+            barcode=barcode(instance.pk, number),
+            status="available" if number <= available else "lost",
+        )
+        for number in range(1, instance.copies_total + 1)
+    )
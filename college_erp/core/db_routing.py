@@ -0,0 +1,158 @@
+# college_erp/core/db_routing.py
+"""
+Read replicas for reports.
+
+Every query goes to the primary (`default`) unless it runs in a replica
+scope: a view decorated with @reads_from_replica (the analytics, trends,
+issue history and export views) or a `replica_reads()` block (the export
+task). There ReplicaRouter sends reads to one of DATABASE_REPLICAS, picked
+at random when the scope starts so all of its reads see the same replica;
+writes always go to the primary, and migrations only run there.
+Desk transactions and anything reading under a row lock keep using the
+primary, so replication lag never reaches them.
+
+Read your writes: a request that is not GET/HEAD/OPTIONS reads from the
+primary throughout, and a successful POST (issuing or returning a book,
+say) sets a signed cookie that keeps the same browser's reads on the
+primary for REPLICA_PIN_SECONDS. The history page shown after an issue
+therefore already lists it, however far the replica is behind.
+
+With no replicas configured the router does nothing. To try it locally,
+point a second alias at the same SQLite file:
+
+    DATABASES["replica"] = {**DATABASES["default"], "TEST": {"MIRROR": "default"}}
+    DATABASE_REPLICAS = ["replica"]
+
+The TEST mirror makes the test runner use the primary's test database for
+the replica too.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = "erp_primary"
+PIN_SALT = "core.db_routing.pin"
+DEFAULT_PIN_SECONDS = 5
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_replica = contextvars.ContextVar("erp_replica", default=None)
+_pinned = contextvars.ContextVar("erp_pinned", default=False)
+
+
+def replicas():
+    return list(getattr(settings, "DATABASE_REPLICAS", []))
+
+
+def pin_seconds():
+    return getattr(settings, "REPLICA_PIN_SECONDS", DEFAULT_PIN_SECONDS)
+
+
+def read_alias():
+    """The alias reads go to right now: a replica inside a replica scope, unless pinned."""
+    replica = _replica.get()
+    return replica if replica and not _pinned.get() else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def replica_reads():
+    """Send reads in the block to a replica (unless the request is pinned to the primary)."""
+    aliases = replicas()
+    token = _replica.set(random.choice(aliases) if aliases else None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Keep reads in the block on the primary, even inside a replica scope."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def reads_from_replica(view_func):
+    """Decorator for read-only views (sync or async) whose queries may go to a replica."""
+    if iscoroutinefunction(view_func):
+        async def _wrapped(request, *args, **kwargs):
+            with replica_reads():
+                return await view_func(request, *args, **kwargs)
+    else:
+        def _wrapped(request, *args, **kwargs):
+            with replica_reads():
+                return view_func(request, *args, **kwargs)
+    return wraps(view_func)(_wrapped)
+
+
+class ReplicaRouter:
+    """Reads in a replica scope go to a replica; everything else is left on the primary."""
+
+    def db_for_read(self, model, **hints):
+        alias = read_alias()
+        return None if alias == DEFAULT_DB_ALIAS else alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        pool = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db in replicas() else None
+
+
+def _pinned_by(request):
+    if request.method not in SAFE_METHODS:
+        return True
+    return request.get_signed_cookie(PIN_COOKIE, default=None, salt=PIN_SALT, max_age=pin_seconds()) is not None
+
+
+class ReplicaPinMiddleware:
+    """Pins a request's reads to the primary after its browser's last write; see the module docstring."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = _pinned.set(_pinned_by(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        return self._finish(request, response)
+
+    async def __acall__(self, request):
+        token = _pinned.set(_pinned_by(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        return self._finish(request, response)
+
+    def _finish(self, request, response):
+        if request.method == "POST" and response.status_code < 400 and replicas():
+            response.set_signed_cookie(
+                PIN_COOKIE, "1", salt=PIN_SALT, max_age=pin_seconds(), httponly=True, samesite="Lax",
+                secure=request.is_secure(),
+            )
+        return response
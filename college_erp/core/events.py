@@ -0,0 +1,83 @@
+# college_erp/core/events.py
+"""
+The circulation event log.
+
+A BookIssue row is changed in place as a loan goes from issued to overdue
+to returned, so on its own it only knows the latest state. Every such
+change also appends a CirculationEvent, in the same transaction, naming
+the transition, the state it left and when it happened. Events are never
+changed or deleted: the log is the full history, and the read models in
+core.projections are built from it.
+
+Once the transaction commits, the projections catch up with the new events
+(see projections.catch_up_after_commit), so the read models normally trail
+the log by one request at most.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import projections
+from .fines import NO_FINE
+from .models import CirculationEvent
+
+
+def event(kind, issue, occurred_at=None, previous=""):
+    """An unsaved event for `issue`, its book, student and due date copied; returns carry the fine."""
+    return CirculationEvent(
+        kind=kind,
+        previous=previous,
+        issue_id=issue.pk,
+        book_id=issue.book_id,
+        student_id=issue.student_id,
+        due_date=issue.due_date,
+        fine=(issue.fine_amount or NO_FINE) if kind == "returned" else NO_FINE,
+        occurred_at=occurred_at or timezone.now(),
+    )
+
+
+def record(events, batch_size=None):
+    """Append `events` to the log inside the caller's transaction."""
+    if not events:
+        return []
+    events = CirculationEvent.objects.bulk_create(events, batch_size=batch_size)
+    transaction.on_commit(projections.catch_up_after_commit, robust=True)
+    return events
+
+
+def record_rows(kind, rows, occurred_at, previous):
+    """
+    Events for (issue_id, book_id, student_id, due_date) rows changed by a
+    set-based UPDATE, such as the overdue sweep's.
+    """
+    return record([
+        CirculationEvent(
+            kind=kind, previous=previous, issue_id=issue_id, book_id=book_id, student_id=student_id,
+            due_date=due_date, occurred_at=occurred_at,
+        )
+        for issue_id, book_id, student_id, due_date in rows
+    ])
+
+
+def history(issue):
+    """Every event of one issue, oldest first."""
+    return list(CirculationEvent.objects.filter(issue_id=getattr(issue, "pk", issue)).order_by("id"))
+
+
+def from_issues(issues):
+    """
+    Events reconstructing existing issues (seeded or imported without a
+    log): issued, overdue for open loans past their due date, returned.
+    Returned loans are taken as returned straight from "issued".
+    """
+    events = []
+    for issue in issues:
+        events.append(event("issued", issue, issue.issued_at))
+        if issue.action == "overdue":
+            # The first sweep after the due date would have marked it.
+            overdue_at = timezone.make_aware(datetime.combine(issue.due_date + timedelta(days=1), time.min))
+            events.append(event("overdue", issue, max(overdue_at, issue.issued_at), previous="issued"))
+        elif issue.action == "returned":
+            events.append(event("returned", issue, issue.returned_at or issue.issued_at, previous="issued"))
+    return events
@@ -0,0 +1,241 @@
+# college_erp/core/exports.py
+"""
+Streaming CSV/XLSX exports of the issue history and the book catalogue.
+
+Rows come from `values_list(...).iterator(chunk_size=...)`, which uses a
+server-side cursor on PostgreSQL, and are turned into bytes as they arrive,
+so memory stays flat and the first chunk leaves before the last row is read.
+XLSX is written directly as a zip of SpreadsheetML parts with inline
+strings. That keeps it streaming and needs no extra dependency.
+
+Large exports can also run as a background task (core.jobs), which writes
+the same bytes to a file in default_storage with save().
+"""
+import csv
+import tempfile
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .filters import clean_issue_filters, filter_issues
+from .models import Book, BookIssue
+
+CHUNK_SIZE = 2000
+# Rows per yielded chunk: large enough to avoid tiny writes, small enough
+# that the first bytes go out at once.
+ROWS_PER_CHUNK = 500
+FORMATS = ("csv", "xlsx")
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+EXPORT_NAMES = ("book-issues", "books")
+# Storage directory for exports written by background tasks.
+EXPORT_DIR = "exports"
+
+ISSUE_COLUMNS = [
+    ("id", "Issue ID"),
+    ("book_id", "Book ID"),
+    ("book__title", "Book"),
+    ("book__isbn", "ISBN"),
+    ("student_id", "Student ID"),
+    ("student__email", "Student Email"),
+    ("action", "Action"),
+    ("issued_at", "Issued At"),
+    ("due_date", "Due Date"),
+    ("returned_at", "Returned At"),
+    ("fine_amount", "Fine"),
+]
+BOOK_COLUMNS = [
+    ("id", "Book ID"),
+    ("title", "Title"),
+    ("author", "Author"),
+    ("isbn", "ISBN"),
+    ("publisher", "Publisher"),
+    ("year_published", "Year"),
+    ("copies_total", "Total Copies"),
+    ("copies_available", "Available"),
+    ("created_at", "Added At"),
+]
+
+
+def issue_rows(queryset=None):
+    """(header, rows) for BookIssue, newest first, in keyset-index order."""
+    queryset = BookIssue.objects.all() if queryset is None else queryset
+    fields = [field for field, _ in ISSUE_COLUMNS]
+    rows = queryset.order_by("-issued_at", "id").values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+    return [label for _, label in ISSUE_COLUMNS], rows
+
+
+def book_rows(queryset=None):
+    """(header, rows) for the catalogue in primary-key order."""
+    queryset = Book.objects.all() if queryset is None else queryset
+    fields = [field for field, _ in BOOK_COLUMNS]
+    rows = queryset.order_by("id").values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+    return [label for _, label in BOOK_COLUMNS], rows
+
+
+def rows_for(name, params=None, using=None):
+    """
+    (header, rows) of a named export: "book-issues" (filtered with the
+    history page's query-string filters in `params`) or "books". `using`
+    fixes the database alias, for rows read after the caller has returned.
+    """
+    if name == "book-issues":
+        return issue_rows(filter_issues(BookIssue.objects.using(using), clean_issue_filters(params or {})))
+    if name == "books":
+        return book_rows(Book.objects.using(using))
+    raise ValueError(f"Unknown export {name!r}.")
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return timezone.localtime(value).strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+class _Echo:
+    """File-like object whose write() hands the data straight back."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(header, rows):
+    writer = csv.writer(_Echo())
+    # BOM so Excel opens the UTF-8 file with the right encoding.
+    yield ("\ufeff" + writer.writerow(header)).encode()
+    chunk = []
+    for row in rows:
+        chunk.append(writer.writerow([_text(value) for value in row]))
+        if len(chunk) >= ROWS_PER_CHUNK:
+            yield "".join(chunk).encode()
+            chunk = []
+    yield "".join(chunk).encode()
+
+
+class _ZipSink:
+    """Write-only, unseekable sink for zipfile; drained after every write batch."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        "</Types>"
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        "</Relationships>"
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        "</Relationships>"
+    ),
+}
+
+
+def _workbook(sheet_name):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(sheet_name)}" sheetId="1" r:id="rId1"/></sheets>'
+        "</workbook>"
+    )
+
+
+def _cell(value):
+    if isinstance(value, bool) or value is None:
+        value = _text(value)
+    if isinstance(value, (int, float, Decimal)):
+        return f"<c><v>{value}</v></c>"
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(_text(value))}</t></is></c>'
+
+
+def _sheet_row(values):
+    return "<row>" + "".join(_cell(value) for value in values) + "</row>"
+
+
+def stream_xlsx(header, rows, sheet_name="Export"):
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        archive.writestr("xl/workbook.xml", _workbook(sheet_name))
+        yield sink.drain()
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b"<sheetData>" + _sheet_row(header).encode()
+            )
+            chunk = []
+            for row in rows:
+                chunk.append(_sheet_row(row))
+                if len(chunk) >= ROWS_PER_CHUNK:
+                    sheet.write("".join(chunk).encode())
+                    chunk = []
+                    data = sink.drain()
+                    if data:  # the compressor may still be buffering
+                        yield data
+            sheet.write("".join(chunk).encode() + b"</sheetData></worksheet>")
+    yield sink.drain()
+
+
+def stream(fmt, header, rows, sheet_name="Export"):
+    """Byte chunks of `rows` in `fmt` ("csv" or "xlsx")."""
+    if fmt == "xlsx":
+        return stream_xlsx(header, rows, sheet_name)
+    return stream_csv(header, rows)
+
+
+def save(name, fmt, params=None):
+    """
+    Write the export `name` to default_storage and return its storage path.
+    The file is spooled to a temporary file first, so a failed export
+    leaves nothing behind.
+    """
+    header, rows = rows_for(name, params)
+    with tempfile.TemporaryFile() as spool:
+        for chunk in stream(fmt, header, rows, sheet_name=name.replace("-", " ").title()):
+            spool.write(chunk)
+        spool.seek(0)
+        filename = f"{name}-{timezone.localdate():%Y%m%d}.{fmt}"
+        return default_storage.save(f"{EXPORT_DIR}/{filename}", File(spool, name=filename))
@@ -0,0 +1,72 @@
+# college_erp/core/filters.py
+"""Query-string filters shared by the issue history listings."""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .models import BookIssue
+
+ISSUE_FILTER_FIELDS = ("action", "issued_from", "issued_to", "book", "student")
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def clean_issue_filters(params):
+    """
+    Pick the supported filters out of a QueryDict (or plain dict).
+
+    Invalid values are dropped rather than raising, so a bad bookmark just
+    shows the unfiltered listing.
+    """
+    cleaned = {}
+    action = params.get("action")
+    if action in dict(BookIssue.ACTION_CHOICES):
+        cleaned["action"] = action
+    issued_from = _parse_date(params.get("issued_from"))
+    if issued_from:
+        cleaned["issued_from"] = issued_from
+    issued_to = _parse_date(params.get("issued_to"))
+    if issued_to:
+        cleaned["issued_to"] = issued_to
+    book = _parse_id(params.get("book"))
+    if book:
+        cleaned["book"] = book
+    student = _parse_id(params.get("student"))
+    if student:
+        cleaned["student"] = student
+    return cleaned
+
+
+def filter_issues(queryset, filters):
+    """Apply filters returned by clean_issue_filters to a BookIssue queryset."""
+    if "action" in filters:
+        queryset = queryset.filter(action=filters["action"])
+    # Compare against day boundaries instead of issued_at__date so the
+    # issued_at index can still be used for the range.
+    if "issued_from" in filters:
+        queryset = queryset.filter(issued_at__gte=_start_of_day(filters["issued_from"]))
+    if "issued_to" in filters:
+        queryset = queryset.filter(
+            issued_at__lt=_start_of_day(filters["issued_to"] + timedelta(days=1))
+        )
+    if "book" in filters:
+        queryset = queryset.filter(book_id=filters["book"])
+    if "student" in filters:
+        queryset = queryset.filter(student_id=filters["student"])
+    return queryset
@@ -0,0 +1,95 @@
+# college_erp/core/fines.py
+"""
+Overdue fines: the per-row rule and the set-based nightly sweep.
+
+The rule is $1 per day late, capped at $50. Because the fine only depends on
+how many days late an issue is, and stops changing after MAX_FINE_DAYS, the
+sweep can express it as a CASE over due_date and update every open issue in
+a single statement instead of looping in Python.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, Q, Value, When
+from django.utils import timezone
+
+from . import caching
+
+FINE_PER_DAY = Decimal("1.00")
+MAX_FINE = Decimal("50.00")
+MAX_FINE_DAYS = int(MAX_FINE / FINE_PER_DAY)
+NO_FINE = Decimal("0.00")
+
+
+def fine_for(due_date, on_date):
+    """Fine owed for returning on `on_date`: $1 per day late, capped at $50."""
+    if not due_date or on_date <= due_date:
+        return NO_FINE
+    return min((on_date - due_date).days * FINE_PER_DAY, MAX_FINE)
+
+
+def fine_expression(today):
+    """SQL equivalent of fine_for(due_date, today) for use in update()/annotate()."""
+    whens = [When(due_date__lte=today - timedelta(days=MAX_FINE_DAYS), then=Value(MAX_FINE))]
+    whens += [
+        When(due_date=today - timedelta(days=days), then=Value(days * FINE_PER_DAY))
+        for days in range(1, MAX_FINE_DAYS)
+    ]
+    return Case(
+        *whens,
+        default=Value(NO_FINE),
+        output_field=DecimalField(max_digits=8, decimal_places=2),
+    )
+
+
+def sweep_overdue(today=None, full=False):
+    """
+    Mark open issues past their due date as `overdue` and refresh their fines.
+
+    By default only rows whose state can have changed since the previous
+    sweep are considered: anything that fell due since then, anything still
+    inside the MAX_FINE_DAYS window where the fine keeps growing, and
+    anything issued since then without a fine yet, however long ago it fell
+    due (a bulk or admin-entered issue with a past due date). Rows
+    that already hold the right status and fine are skipped by the WHERE
+    clause, so running the sweep twice in a day writes nothing. Pass
+    `full=True` to re-check every open issue. Issues that go overdue, or
+    stop being overdue, are locked first and logged as circulation events
+    (core.events) in the same transaction.
+
+    Returns the OverdueSweep row recording this run.
+    """
+    from . import events
+    from .models import BookIssue, OverdueSweep
+
+    today = today or timezone.localdate()
+    fine = fine_expression(today)
+
+    open_issues = BookIssue.objects.filter(action__in=BookIssue.OPEN_ACTIONS)
+    overdue = open_issues.filter(due_date__lt=today)
+    if not full:
+        last = OverdueSweep.objects.order_by("-swept_through").first()
+        if last is not None and last.swept_through <= today:
+            # A day's overlap covers issues created while that sweep ran.
+            overdue = overdue.filter(
+                Q(due_date__gte=last.swept_through - timedelta(days=MAX_FINE_DAYS))
+                | Q(fine_amount=NO_FINE, issued_at__gte=last.ran_at - timedelta(days=1))
+            )
+
+    # Due date pushed back (e.g. a renewal) after the issue went overdue.
+    no_longer_due = BookIssue.objects.filter(action="overdue", due_date__gte=today)
+    fields = ("pk", "book_id", "student_id", "due_date")
+    with transaction.atomic():
+        went_overdue = list(overdue.filter(action="issued").select_for_update().values_list(*fields))
+        went_back = list(no_longer_due.select_for_update().values_list(*fields))
+        marked = overdue.exclude(Q(action="overdue") & Q(fine_amount=fine)).update(
+            action="overdue", fine_amount=fine
+        )
+        cleared = no_longer_due.update(action="issued", fine_amount=NO_FINE)
+        now = timezone.now()
+        events.record_rows("overdue", went_overdue, now, previous="issued")
+        events.record_rows("cleared", went_back, now, previous="overdue")
+        if marked or cleared:
+            caching.bump_library_version()
+        return OverdueSweep.objects.create(swept_through=today, marked=marked, cleared=cleared)
@@ -0,0 +1,128 @@
+# college_erp/core/holds.py
+"""
+Holds: a first-come, first-served queue of students per book.
+
+A hold can only be placed while no copy is on the shelf. When a copy comes
+back (core.circulation.release_copies), the first waiting hold becomes
+ready and the copy is set aside for it, in the same transaction as the
+return. Issuing the book to that student hands out the copy set aside. A
+ready hold that is not picked up within HOLD_PICKUP_DAYS expires
+(expire_holds, run by the background worker), and its copy goes to the next
+in line.
+
+Each waiting hold has a ticket, handed out under the book's row lock and
+kept contiguous: cancelling a waiting hold moves the tickets behind it up
+by one. The head of the queue, its tail and a hold's position are then all
+single-row reads on the (book, ticket) index of waiting holds, however long
+the queue gets. Everything that changes a book's queue locks the book row
+first.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import circulation
+from .circulation import AlreadyIssued, CirculationError
+from .models import Book, BookIssue, Hold
+
+
+class HoldError(CirculationError):
+    pass
+
+
+class BookNotFound(HoldError):
+    pass
+
+
+class CopiesAvailable(HoldError):
+    pass
+
+
+class AlreadyOnHold(HoldError):
+    pass
+
+
+class HoldNotOpen(HoldError):
+    pass
+
+
+def _lock_book(book_id):
+    try:
+        return Book.objects.select_for_update().only("id", "copies_available").get(pk=book_id)
+    except Book.DoesNotExist:
+        raise BookNotFound("Book not found.") from None
+
+
+def _waiting(book_id):
+    return Hold.objects.filter(book_id=book_id, status="waiting")
+
+
+def place_hold(book, student):
+    """
+    Queue `student` for `book` and return the new Hold.
+
+    Raises CopiesAvailable while a copy is on the shelf, AlreadyIssued if
+    the student has the book, AlreadyOnHold if they are already queued.
+    """
+    book_id = getattr(book, "pk", book)
+    name = student.get_full_name() or student.username
+    with transaction.atomic():
+        if _lock_book(book_id).copies_available > 0:
+            raise CopiesAvailable("Copies are available; issue one instead.")
+        if BookIssue.objects.filter(
+            book_id=book_id, student=student, action__in=BookIssue.OPEN_ACTIONS
+        ).exists():
+            raise AlreadyIssued(f"{name} already has this book issued.")
+        last = _waiting(book_id).order_by("-ticket").values_list("ticket", flat=True).first()
+        try:
+            with transaction.atomic():
+                return Hold.objects.create(book_id=book_id, student=student, ticket=(last or 0) + 1)
+        except IntegrityError:
+            raise AlreadyOnHold(f"{name} already has a hold on this book.") from None
+
+
+def queue_position(hold):
+    """1 for the next hold to be served, or None once the hold is no longer waiting."""
+    if hold.status != "waiting":
+        return None
+    head = _waiting(hold.book_id).order_by("ticket").values_list("ticket", flat=True).first()
+    return hold.ticket - head + 1 if head is not None else None
+
+
+def _close(hold_id, status, allowed, now):
+    """Lock an open hold, close it with `status` and pass its copy on. Returns the hold."""
+    book_id = Hold.objects.filter(pk=hold_id).values_list("book_id", flat=True).first()
+    if book_id is not None:
+        _lock_book(book_id)  # Book before hold, like the return path.
+    hold = Hold.objects.select_for_update().filter(pk=hold_id, status__in=allowed).first()
+    if hold is None:
+        raise HoldNotOpen("Hold not found or already closed.")
+    if hold.status == "waiting":
+        # Keep the tickets contiguous behind it.
+        _waiting(hold.book_id).filter(ticket__gt=hold.ticket).update(ticket=F("ticket") - 1)
+    elif hold.copy_id:
+        circulation.release_copies(hold.book_id, [hold.copy_id], now)
+    hold.status, hold.closed_at = status, now
+    hold.save(update_fields=["status", "closed_at"])
+    return hold
+
+
+def cancel_hold(hold, now=None):
+    """Cancel a waiting or ready hold; a copy set aside for it goes to the next in line."""
+    with transaction.atomic():
+        return _close(getattr(hold, "pk", hold), "cancelled", Hold.OPEN_STATUSES, now or timezone.now())
+
+
+def expire_holds(now=None):
+    """Expire ready holds whose pickup deadline has passed; returns how many expired."""
+    now = now or timezone.now()
+    expired = 0
+    due = Hold.objects.filter(status="ready", expires_at__lt=now).order_by("expires_at")
+    for hold_id in list(due.values_list("pk", flat=True)):
+        with transaction.atomic():
+            try:
+                _close(hold_id, "expired", ("ready",), now)
+            except HoldNotOpen:
+                continue  # Picked up or cancelled meanwhile.
+            expired += 1
+    return expired
@@ -0,0 +1,66 @@
+# college_erp/core/jobs.py
+"""
+The library's background tasks (see core.tasks). Keyword arguments and
+return values are stored as JSON, so dates travel as YYYY-MM-DD strings.
+
+The nightly ones (the overdue/fine sweep, reminder digests, pruning old
+task rows), the hourly hold expiry and the minutely projection catch-up
+are listed in TASK_SCHEDULE. Exports are enqueued by the export views and
+written to default_storage.
+"""
+from datetime import datetime
+
+from django.utils import timezone
+
+from . import db_routing, exports, fines, holds, projections, reminders, rollups, tasks
+
+
+def _date(value):
+    return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+
+
+@tasks.task("core.sweep_overdue")
+def sweep_overdue(date=None, full=False):
+    """Mark overdue issues and recalculate their fines (core.fines.sweep_overdue)."""
+    sweep = fines.sweep_overdue(today=_date(date), full=full)
+    return {"swept_through": sweep.swept_through, "marked": sweep.marked, "cleared": sweep.cleared}
+
+
+# Not retried: a second attempt would mail the students already reached.
+@tasks.task("core.send_reminders", max_attempts=1)
+def send_reminders(date=None, days=None):
+    """Email each student one digest of overdue and due-soon loans (core.reminders)."""
+    return reminders.send_reminders(today=_date(date), days=days)
+
+
+@tasks.task("core.rebuild_circulation_stats")
+def rebuild_circulation_stats(since=None, until=None):
+    """Recompute the daily circulation rollup (core.rollups.rebuild)."""
+    return {"rows": rollups.rebuild(since=_date(since), until=_date(until))}
+
+
+@tasks.task("core.export", max_attempts=2)
+def export(name, fmt="csv", params=None):
+    """Write a catalogue or issue-history export to default_storage, reading from a replica."""
+    started = timezone.now()
+    with db_routing.replica_reads():
+        path = exports.save(name, fmt, params)
+    return {"path": path, "format": fmt, "seconds": round((timezone.now() - started).total_seconds(), 2)}
+
+
+@tasks.task("core.prune_tasks")
+def prune_tasks(days=None):
+    """Delete old succeeded task rows (core.tasks.prune)."""
+    return {"deleted": tasks.prune(days)}
+
+
+@tasks.task("core.expire_holds")
+def expire_holds():
+    """Expire holds not picked up in time, passing their copies on (core.holds.expire_holds)."""
+    return {"expired": holds.expire_holds()}
+
+
+@tasks.task("core.project_circulation")
+def project_circulation():
+    """Apply circulation events the on-commit catch-up skipped (core.projections.catch_up)."""
+    return projections.catch_up()
@@ -0,0 +1,194 @@
+# college_erp/core/ledger.py
+"""
+The fine ledger: charges, payments and waivers per student.
+
+FineEntry rows are only ever added. Each one records the student's running
+balance after it, and the student's FineAccount carries the current
+balance, updated in the same transaction as the entry under the account's
+row lock. Reading a balance is therefore one primary-key lookup, however
+long the history, and the librarian's list of outstanding balances pages
+on a partial (-balance, student) index.
+
+A returned loan's fine is charged by core.circulation in the return's
+transaction; fines on loans still out are accruing and not in the ledger
+yet. reconcile() checks every balance against the ledger and can rewrite
+the ones that disagree.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import caching
+from .fines import NO_FINE
+from .models import FineAccount, FineEntry
+
+STATEMENT_LENGTH = 20
+
+
+class LedgerError(Exception):
+    pass
+
+
+class InvalidAmount(LedgerError):
+    pass
+
+
+class Overpayment(LedgerError):
+    pass
+
+
+def parse_amount(value):
+    """A positive amount in dollars and cents from user input; raises InvalidAmount."""
+    try:
+        amount = Decimal(str(value).strip())
+    except (InvalidOperation, ValueError):
+        raise InvalidAmount("Amount must be a number.") from None
+    if not amount.is_finite() or amount <= 0 or amount != amount.quantize(Decimal("0.01")):
+        raise InvalidAmount("Amount must be positive, in dollars and cents.")
+    return amount
+
+
+def balance(student):
+    """The student's outstanding balance (one primary-key lookup)."""
+    student_id = getattr(student, "pk", student)
+    found = FineAccount.objects.filter(pk=student_id).values_list("balance", flat=True).first()
+    return NO_FINE if found is None else found
+
+
+def statement(student, limit=STATEMENT_LENGTH):
+    """The student's latest ledger entries, newest first."""
+    return list(
+        FineEntry.objects.filter(student_id=getattr(student, "pk", student))
+        .order_by("-id")[:limit]
+    )
+
+
+def post(entries, now=None):
+    """
+    Append unsaved FineEntry rows (student, kind, signed amount set) to the
+    ledger, in the caller's transaction if any, filling in each running balance
+    and moving the accounts with them. Accounts are locked in student order,
+    so concurrent postings cannot deadlock. Returns the saved entries.
+    """
+    if not entries:
+        return []
+    now = now or timezone.now()
+    student_ids = sorted({entry.student_id for entry in entries})
+    with transaction.atomic():
+        # Open missing accounts; ignore_conflicts makes concurrent first postings safe.
+        FineAccount.objects.bulk_create(
+            [FineAccount(student_id=student_id, balance=NO_FINE) for student_id in student_ids],
+            ignore_conflicts=True,
+        )
+        accounts = {
+            account.pk: account
+            for account in FineAccount.objects.select_for_update().filter(pk__in=student_ids).order_by("pk")
+        }
+        for entry in entries:
+            account = accounts[entry.student_id]
+            account.balance += entry.amount
+            account.updated_at = entry.created_at = now
+            entry.balance = account.balance
+        FineEntry.objects.bulk_create(entries)
+        FineAccount.objects.bulk_update(accounts.values(), ["balance", "updated_at"])
+        caching.bump_student_versions(student_ids)
+    return entries
+
+
+def charge_returns(issues, now=None):
+    """Charge the fines of just-returned issues; call inside the return's transaction."""
+    return post(
+        [
+            FineEntry(student_id=issue.student_id, kind="charge", amount=issue.fine_amount, issue_id=issue.pk)
+            for issue in issues
+            if issue.fine_amount > 0
+        ],
+        now,
+    )
+
+
+def _credit(kind, student, amount, recorded_by=None, note=""):
+    amount = parse_amount(amount)
+    student_id = getattr(student, "pk", student)
+    with transaction.atomic():
+        # Checked under the account's row lock, so two desks cannot both take the last dollar.
+        owed = (
+            FineAccount.objects.select_for_update().filter(pk=student_id)
+            .values_list("balance", flat=True).first()
+        ) or NO_FINE
+        if amount > owed:
+            raise Overpayment(f"Only ${owed:.2f} is owed.")
+        (entry,) = post([FineEntry(
+            student_id=student_id, kind=kind, amount=-amount, recorded_by=recorded_by, note=note[:255],
+        )])
+    return entry
+
+
+def record_payment(student, amount, recorded_by=None, note=""):
+    """Record a payment of `amount` towards the student's balance; returns the entry."""
+    return _credit("payment", student, amount, recorded_by, note)
+
+
+def waive(student, amount, recorded_by=None, note=""):
+    """Write off `amount` of the student's balance; returns the entry."""
+    return _credit("waiver", student, amount, recorded_by, note)
+
+
+def outstanding():
+    """Accounts with a balance owed, students joined, for core.pagination.paginate_balances."""
+    return FineAccount.objects.filter(balance__gt=0).select_related("student")
+
+
+def _ledger_total():
+    return Coalesce(
+        Subquery(
+            FineEntry.objects.filter(student=OuterRef("pk"))
+            .order_by().values("student").annotate(total=Sum("amount")).values("total"),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ),
+        Value(NO_FINE),
+    )
+
+
+def check_balances():
+    """Accounts whose balance is not the sum of their ledger entries."""
+    return FineAccount.objects.annotate(ledger=_ledger_total()).exclude(balance=F("ledger"))
+
+
+def unaccounted_students():
+    """Students with ledger entries but no account."""
+    return (
+        FineEntry.objects.exclude(student__in=FineAccount.objects.values("pk"))
+        .values_list("student", flat=True).distinct().order_by("student")
+    )
+
+
+def reconcile(fix=False):
+    """
+    Compare every balance with the ledger. Returns the disagreements as
+    dicts (student, balance, ledger), with balance None for a missing
+    account; with `fix=True` those accounts are rewritten from the ledger
+    sums in the same transaction.
+    """
+    with transaction.atomic():
+        mismatched = [
+            {"student": row["pk"], "balance": row["balance"], "ledger": row["ledger"]}
+            for row in check_balances().order_by("pk").values("pk", "balance", "ledger")
+        ]
+        mismatched += [
+            {"student": student_id, "balance": None, "ledger": None}
+            for student_id in unaccounted_students()
+        ]
+        if fix and mismatched:
+            FineAccount.objects.bulk_create(
+                [FineAccount(student_id=row["student"]) for row in mismatched if row["balance"] is None],
+                ignore_conflicts=True,
+            )
+            FineAccount.objects.filter(pk__in=[row["student"] for row in mismatched]).update(
+                balance=_ledger_total(), updated_at=timezone.now()
+            )
+            caching.bump_student_versions(row["student"] for row in mismatched)
+    return mismatched
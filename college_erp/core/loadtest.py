@@ -0,0 +1,127 @@
+# college_erp/core/loadtest.py
+"""
+Closed-loop HTTP load generator for comparing servers (uvicorn vs gunicorn).
+
+`concurrency` keep-alive connections each send one GET, wait for the full
+response, and send the next, until `duration` seconds have passed. The
+report has requests per second, p50/p95/p99 latency and the status codes
+seen. It speaks just enough HTTP/1.1 for Django responses (Content-Length
+or chunked bodies) and needs nothing outside the standard library.
+"""
+import asyncio
+import statistics
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from .benchmark import percentile
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_DURATION = 10.0
+
+
+class LoadTestError(Exception):
+    pass
+
+
+async def _read_response(reader):
+    """(status, body length) of one HTTP/1.1 response."""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    if "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+        return status, len(body), headers
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        size = 0
+        while True:
+            chunk_size = int((await reader.readline()).split(b";")[0], 16)
+            if chunk_size == 0:
+                await reader.readline()
+                return status, size, headers
+            size += len(await reader.readexactly(chunk_size))
+            await reader.readline()
+    # No length: the body runs to the end of the connection.
+    body = await reader.read()
+    headers["connection"] = "close"
+    return status, len(body), headers
+
+
+async def _client(host, port, request, deadline, latencies, statuses):
+    reader = writer = None
+    try:
+        while time.perf_counter() < deadline:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            try:
+                status, _, headers = await _read_response(reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                statuses["error"] += 1
+                writer.close()
+                writer = None
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] += 1
+            if headers.get("connection", "").lower() == "close":
+                writer.close()
+                writer = None
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def _run(url, concurrency, duration, cookies):
+    parts = urlsplit(url)
+    if parts.scheme != "http":
+        raise LoadTestError("Only http:// URLs are supported.")
+    host, port = parts.hostname, parts.port or 80
+    path = parts.path or "/"
+    if parts.query:
+        path += f"?{parts.query}"
+    header_lines = [
+        f"GET {path} HTTP/1.1",
+        f"Host: {parts.netloc}",
+        "Connection: keep-alive",
+        "Accept: text/html,application/json",
+    ]
+    if cookies:
+        header_lines.append("Cookie: " + "; ".join(f"{k}={v}" for k, v in cookies.items()))
+    request = ("\r\n".join(header_lines) + "\r\n\r\n").encode("latin-1")
+
+    latencies, statuses = [], Counter()
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(
+        _client(host, port, request, deadline, latencies, statuses) for _ in range(concurrency)
+    ))
+    return latencies, statuses, time.perf_counter() - started
+
+
+def run(url, concurrency=DEFAULT_CONCURRENCY, duration=DEFAULT_DURATION, cookies=None):
+    """Load `url` for `duration` seconds; returns a JSON-serialisable report."""
+    try:
+        latencies, statuses, elapsed = asyncio.run(_run(url, concurrency, duration, cookies))
+    except OSError as exc:
+        raise LoadTestError(f"Could not connect to {url}: {exc}")
+    if not latencies:
+        raise LoadTestError(f"No responses from {url}.")
+    return {
+        "url": url,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "requests": len(latencies),
+        "requests_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2),
+        "statuses": {str(code): count for code, count in sorted(statuses.items(), key=str)},
+    }
@@ -0,0 +1,69 @@
+import json
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every core URL through the test client against the current "
+        "database and print a JSON report (query counts, p50/p95, peak memory)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=benchmark.DEFAULT_ITERATIONS)
+        parser.add_argument("--route", action="append", dest="routes", help="Only this route name (repeatable).")
+        parser.add_argument("--output", help="Write the report to this file instead of stdout.")
+        parser.add_argument("--compare", help="Earlier report to check for regressions; fails if any.")
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=benchmark.DEFAULT_TOLERANCE,
+            help="Allowed p95 growth factor when comparing (default %(default)s).",
+        )
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 1:
+            raise CommandError("--iterations must be at least 1.")
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as handle:
+                    baseline = json.load(handle)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Could not read {options['compare']}: {exc}")
+
+        started = time.monotonic()
+        # Allows the 'testserver' host and the locmem email backend.
+        setup_test_environment()
+        # Failing routes are reported by status; skip a traceback per request.
+        request_log = logging.getLogger("django.request")
+        level = request_log.level
+        request_log.setLevel(logging.CRITICAL)
+        try:
+            report = benchmark.run(iterations=options["iterations"], names=options["routes"])
+        except benchmark.MissingData as exc:
+            raise CommandError(str(exc))
+        finally:
+            request_log.setLevel(level)
+            teardown_test_environment()
+        elapsed = time.monotonic() - started
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                handle.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+        if baseline is not None:
+            regressions = benchmark.compare(baseline, report, tolerance=options["tolerance"])
+            if regressions:
+                raise CommandError("Regressions:\n  " + "\n  ".join(regressions))
+        self.stderr.write(self.style.SUCCESS(
+            f"Benchmarked {len(report['results'])} routes in {elapsed:.2f}s."
+        ))
@@ -0,0 +1,63 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure login throughput (login POST plus the dashboard it redirects "
+        "to) for each session backend and password hasher profile."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--attempts", type=int, default=benchmark.LOGIN_ATTEMPTS)
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            dest="scenarios",
+            metavar="SESSION_BACKEND:HASHER_PROFILE",
+            help="Only this combination, e.g. cached_db:fast (repeatable).",
+        )
+        parser.add_argument("--output", help="Write the report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        if options["attempts"] < 1:
+            raise CommandError("--attempts must be at least 1.")
+        scenarios = benchmark.LOGIN_SCENARIOS
+        if options["scenarios"]:
+            scenarios = []
+            for value in options["scenarios"]:
+                session_backend, _, hasher_profile = value.partition(":")
+                if (session_backend, hasher_profile) not in benchmark.LOGIN_SCENARIOS:
+                    raise CommandError(f"Unknown scenario {value!r}.")
+                scenarios.append((session_backend, hasher_profile))
+
+        started = time.monotonic()
+        setup_test_environment()
+        try:
+            report = benchmark.login_throughput(attempts=options["attempts"], scenarios=scenarios)
+        except benchmark.MissingData as exc:
+            raise CommandError(str(exc))
+        finally:
+            teardown_test_environment()
+        elapsed = time.monotonic() - started
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                handle.write(output + "\n")
+        else:
+            self.stdout.write(output)
+        for row in report["results"]:
+            self.stderr.write(
+                f"{row['session_backend']:>14} {row['hasher_profile']:>7}: "
+                f"{row['logins_per_s']:8.2f} logins/s, p95 {row['p95_ms']:8.2f} ms, "
+                f"{row['queries']} queries"
+            )
+        self.stderr.write(self.style.SUCCESS(
+            f"Benchmarked {len(report['results'])} login scenarios in {elapsed:.2f}s."
+        ))
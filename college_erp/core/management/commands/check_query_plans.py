@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.query_plans import NoSampleData, check_plans, hot_queries
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN ANALYZE the circulation hot-path queries (PostgreSQL) and fail "
+        "if any of them reads a large table with a sequential scan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--as-planned",
+            action="store_true",
+            help="Keep the planner's own choices instead of discouraging sequential "
+                 "scans. Only meaningful on a production-sized database.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Query plan checks need PostgreSQL.")
+        started = time.monotonic()
+        try:
+            queries = hot_queries()
+        except NoSampleData as exc:
+            raise CommandError(str(exc))
+        results = check_plans(queries, discourage_seqscan=not options["as_planned"])
+
+        failures = []
+        for name, scanned, ms, nodes in results:
+            status = "SEQ SCAN" if scanned else "ok"
+            self.stdout.write(f"{status:<8} {name:<28} {ms or 0:8.2f} ms  {' > '.join(nodes)}")
+            if scanned:
+                failures.append(f"{name} ({', '.join(scanned)})")
+
+        elapsed = time.monotonic() - started
+        if failures:
+            raise CommandError("Sequential scans on hot queries: " + "; ".join(failures))
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {len(results)} queries, no sequential scans, in {elapsed:.2f}s."
+        ))
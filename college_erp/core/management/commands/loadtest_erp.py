@@ -0,0 +1,56 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from core import loadtest
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a running server (uvicorn or gunicorn) with concurrent keep-alive "
+        "GETs and print requests/s and latency percentiles as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="Full URL, e.g. http://127.0.0.1:8000/analytics/")
+        parser.add_argument("--concurrency", type=int, default=loadtest.DEFAULT_CONCURRENCY)
+        parser.add_argument("--duration", type=float, default=loadtest.DEFAULT_DURATION)
+        parser.add_argument(
+            "--as",
+            dest="role",
+            help="Sign in as the first active user with this role (the server must share this database).",
+        )
+        parser.add_argument("--output", help="Append the report as one JSON line to this file.")
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1 or options["duration"] <= 0:
+            raise CommandError("--concurrency and --duration must be positive.")
+        cookies = {}
+        if options["role"]:
+            user = User.objects.filter(role=options["role"], is_active=True).order_by("pk").first()
+            if user is None:
+                raise CommandError(f"No active {options['role']} user; run seed_erp first.")
+            client = Client()
+            client.force_login(user)
+            cookies[settings.SESSION_COOKIE_NAME] = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        try:
+            report = loadtest.run(
+                options["url"],
+                concurrency=options["concurrency"],
+                duration=options["duration"],
+                cookies=cookies,
+            )
+        except loadtest.LoadTestError as exc:
+            raise CommandError(str(exc))
+        report["role"] = options["role"]
+        if options["output"]:
+            with open(options["output"], "a") as handle:
+                handle.write(json.dumps(report) + "\n")
+        self.stdout.write(json.dumps(report, indent=2))
+        self.stderr.write(self.style.SUCCESS(
+            f"{report['requests_per_s']} req/s, p95 {report['p95_ms']} ms over {report['requests']} requests."
+        ))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import ledger
+
+
+class Command(BaseCommand):
+    help = "Check every student's fine balance against the sum of their ledger entries."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Rewrite the balances that disagree from the ledger.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        mismatched = ledger.reconcile(fix=options["fix"])
+        elapsed = time.monotonic() - started
+        for row in mismatched:
+            if row["balance"] is None:
+                self.stdout.write(f"Student {row['student']}: ledger entries but no account")
+            else:
+                self.stdout.write(f"Student {row['student']}: balance {row['balance']}, ledger {row['ledger']}")
+        if mismatched and not options["fix"]:
+            raise CommandError(f"{len(mismatched)} balances disagree with the ledger; rerun with --fix to repair.")
+        verb = "Fixed" if mismatched else "Checked"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} fine balances: {len(mismatched)} out of step, in {elapsed:.2f}s."
+        ))
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import projections
+
+
+class Command(BaseCommand):
+    help = "Rebuild circulation read models from the event log, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "names",
+            nargs="*",
+            metavar="projection",
+            help=f"Projections to rebuild: {', '.join(sorted(projections.PROJECTORS))}.",
+        )
+        parser.add_argument("--all", action="store_true", help="Rebuild every projection.")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=projections.BATCH_SIZE,
+            help="Events applied per transaction (default: %(default)s).",
+        )
+
+    def handle(self, *args, **options):
+        names = list(projections.PROJECTORS) if options["all"] else options["names"]
+        if not names:
+            raise CommandError("Name a projection to rebuild, or pass --all.")
+        unknown = sorted(set(names) - set(projections.PROJECTORS))
+        if unknown:
+            raise CommandError(f"Unknown projection: {', '.join(unknown)}.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+        for name in names:
+            started = time.monotonic()
+            applied = projections.replay(name, batch_size=options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(
+                f"Replayed {name}: {applied} events in {time.monotonic() - started:.2f}s."
+            ))
@@ -0,0 +1,52 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import tasks
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background tasks (core.jobs) from the database queue: retries failed "
+        "tasks with backoff and enqueues the TASK_SCHEDULE entries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=1, help="Tasks run at the same time (threads).")
+        parser.add_argument("--poll-interval", type=float, default=tasks.POLL_INTERVAL)
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run what is due now (including scheduled tasks), then exit; for cron.",
+        )
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1 or options["poll_interval"] <= 0:
+            raise CommandError("--concurrency and --poll-interval must be positive.")
+        worker = tasks.Worker(
+            concurrency=options["concurrency"],
+            poll_interval=options["poll_interval"],
+            once=options["once"],
+        )
+
+        def stop(signum, frame):
+            # Finish the running tasks, then exit.
+            self.stderr.write("Stopping after the running tasks...")
+            worker.stop()
+
+        previous = {signum: signal.signal(signum, stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+        if not options["once"]:
+            self.stdout.write(f"Worker {worker.name} running {options['concurrency']} task(s) at a time.")
+
+        started = time.monotonic()
+        try:
+            processed = worker.run()
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Ran {sum(processed.values())} tasks ({processed.get('succeeded', 0)} succeeded, "
+            f"{processed.get('queued', 0)} to retry, {processed.get('failed', 0)} failed) in {elapsed:.2f}s."
+        ))
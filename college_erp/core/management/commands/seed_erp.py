@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from core import seeding
+
+
+class Command(BaseCommand):
+    help = "Generate deterministic synthetic users, books and issue records."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000, help="Users to create (mostly students).")
+        parser.add_argument("--books", type=int, default=500, help="Books to create.")
+        parser.add_argument("--issues", type=int, default=5000, help="Issue records to create.")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed; the same seed gives the same data.")
+        parser.add_argument("--batch-size", type=int, default=seeding.DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            "--flush",
+            action="store_true",
+            help="Delete previously seeded users and books first.",
+        )
+
+    def handle(self, *args, **options):
+        for name in ("users", "books", "issues", "batch_size"):
+            if options[name] < 0 or (name == "batch_size" and options[name] == 0):
+                raise CommandError(f"--{name.replace('_', '-')} must be a positive number.")
+
+        started = time.monotonic()
+        if options["flush"]:
+            deleted = seeding.flush()
+            self.stdout.write(f"Deleted {deleted} previously seeded rows.")
+        try:
+            created = seeding.seed(
+                users=options["users"],
+                books=options["books"],
+                issues=options["issues"],
+                seed=options["seed"],
+                batch_size=options["batch_size"],
+            )
+        except IntegrityError as exc:
+            raise CommandError(f"Seed data already present ({exc}); rerun with --flush.")
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {created['users']} users, {created['books']} books and "
+            f"{created['issues']} issues in {elapsed:.2f}s."
+        ))
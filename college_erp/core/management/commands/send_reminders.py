@@ -0,0 +1,43 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import reminders
+
+
+class Command(BaseCommand):
+    help = (
+        "Email every student one digest of overdue and due-soon loans, in batches "
+        "over a single connection of the configured email backend."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="Remind as of this date (YYYY-MM-DD). Defaults to today.")
+        parser.add_argument(
+            "--days",
+            type=int,
+            help="Include loans due within this many days (default REMINDER_DAYS_AHEAD).",
+        )
+        parser.add_argument("--batch-size", type=int, default=reminders.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        today = None
+        if options["date"]:
+            try:
+                today = datetime.strptime(options["date"], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("--date must be in YYYY-MM-DD format.")
+        if options["days"] is not None and options["days"] < 0:
+            raise CommandError("--days must not be negative.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        started = time.monotonic()
+        stats = reminders.send_reminders(today=today, days=options["days"], batch_size=options["batch_size"])
+        elapsed = time.monotonic() - started
+        rate = stats["loans"] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {stats['sent']} digests covering {stats['loans']} loans to {stats['students']} students "
+            f"in {stats['batches']} batches, {elapsed:.2f}s ({rate:.0f} loans/s)."
+        ))
@@ -0,0 +1,37 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.fines import sweep_overdue
+
+
+class Command(BaseCommand):
+    help = "Mark overdue open issues and refresh their fines ($1/day, $50 cap)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--date",
+            help="Sweep as of this date (YYYY-MM-DD). Defaults to today.",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Re-check every open issue instead of only those changed since the last sweep.",
+        )
+
+    def handle(self, *args, **options):
+        today = None
+        if options["date"]:
+            try:
+                today = datetime.strptime(options["date"], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("--date must be in YYYY-MM-DD format.")
+
+        started = time.monotonic()
+        sweep = sweep_overdue(today=today, full=options["full"])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Swept through {sweep.swept_through}: {sweep.marked} marked overdue, "
+            f"{sweep.cleared} cleared in {elapsed:.2f}s."
+        ))
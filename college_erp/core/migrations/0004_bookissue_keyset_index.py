@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_bookissue_fine_amount_alter_bookissue_action'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookissue',
+            index=models.Index(fields=['-issued_at', 'id'], name='bookissue_issued_at_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_bookissue_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='bookissue',
+            constraint=models.UniqueConstraint(condition=models.Q(('action__in', ['issued', 'overdue'])), fields=('book', 'student'), name='unique_open_issue_per_book_student'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_bookissue_unique_open_issue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OverdueSweep',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('swept_through', models.DateField(db_index=True)),
+                ('marked', models.PositiveIntegerField(default=0)),
+                ('cleared', models.PositiveIntegerField(default=0)),
+                ('ran_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Overdue Sweep',
+                'verbose_name_plural': 'Overdue Sweeps',
+                'ordering': ['-ran_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_overduesweep'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CirculationDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('issues', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('overdue', models.PositiveIntegerField(default=0)),
+                ('fines', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='core.book')),
+            ],
+            options={
+                'verbose_name': 'Circulation Daily Stat',
+                'verbose_name_plural': 'Circulation Daily Stats',
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'book'), name='unique_daily_stat_per_book')],
+            },
+        ),
+    ]
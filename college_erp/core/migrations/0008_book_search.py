@@ -0,0 +1,72 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:11
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Title and ISBN weigh most, then author, then publisher.
+BOOK_VECTOR = """
+    setweight(to_tsvector('english', coalesce({row}title, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce({row}isbn, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce({row}author, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce({row}publisher, '')), 'C')
+"""
+
+CREATE_SEARCH_SQL = [
+    f"""
+    CREATE OR REPLACE FUNCTION core_book_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {BOOK_VECTOR.format(row="NEW.")};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER core_book_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, author, isbn, publisher ON core_book
+    FOR EACH ROW EXECUTE FUNCTION core_book_search_vector_update();
+    """,
+    f"UPDATE core_book SET search_vector = {BOOK_VECTOR.format(row='')};",
+    "CREATE INDEX core_book_search_vector_gin ON core_book USING gin (search_vector);",
+    "CREATE INDEX core_book_title_trgm ON core_book USING gin (title gin_trgm_ops);",
+    "CREATE INDEX core_book_author_trgm ON core_book USING gin (author gin_trgm_ops);",
+]
+
+DROP_SEARCH_SQL = [
+    "DROP INDEX IF EXISTS core_book_author_trgm;",
+    "DROP INDEX IF EXISTS core_book_title_trgm;",
+    "DROP INDEX IF EXISTS core_book_search_vector_gin;",
+    "DROP TRIGGER IF EXISTS core_book_search_vector_trigger ON core_book;",
+    "DROP FUNCTION IF EXISTS core_book_search_vector_update();",
+]
+
+
+def _run_on_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "postgresql":
+            # SQLite (tests) uses the in-process index in core/search.py.
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_circulationdailystat'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            _run_on_postgres(CREATE_SEARCH_SQL),
+            _run_on_postgres(DROP_SEARCH_SQL),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:14
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def normalise_isbns(apps, schema_editor):
+    Book = apps.get_model('core', 'Book')
+    Book.objects.filter(isbn='').update(isbn=None)
+    duplicates = list(
+        Book.objects.exclude(isbn=None)
+        .values('isbn')
+        .annotate(n=Count('id'))
+        .filter(n__gt=1)
+        .values_list('isbn', flat=True)[:20]
+    )
+    if duplicates:
+        # Merging books would have to move their issues; leave that to a person.
+        raise RuntimeError(
+            "Cannot make Book.isbn unique, these ISBNs are shared by several books: "
+            + ", ".join(duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_book_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalise_isbns, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='book',
+            name='isbn',
+            field=models.CharField(blank=True, max_length=20, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_book_isbn_unique'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bookissue',
+            name='book',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='issues', to='core.book'),
+        ),
+        migrations.AlterField(
+            model_name='bookissue',
+            name='student',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='book_issues', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='role',
+            field=models.CharField(choices=[('student', 'Student'), ('teacher', 'Teacher'), ('admin', 'Admin'), ('clerk', 'Clerk'), ('librarian', 'Librarian')], db_index=True, default='student', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='bookissue',
+            index=models.Index(fields=['book', 'student', 'action'], name='bookissue_book_stu_action_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookissue',
+            index=models.Index(fields=['student', 'action'], name='bookissue_student_action_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookissue',
+            index=models.Index(condition=models.Q(('action__in', ['issued', 'overdue'])), fields=['action'], name='bookissue_open_action_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookissue',
+            index=models.Index(condition=models.Q(('action__in', ['issued', 'overdue'])), fields=['due_date'], name='bookissue_open_due_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookissue',
+            index=models.Index(condition=models.Q(('returned_at__isnull', False)), fields=['returned_at'], name='bookissue_returned_at_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:40
+
+from django.db import migrations
+
+# Django's istartswith on PostgreSQL is `UPPER("col"::text) LIKE UPPER(%s)`,
+# so the trigram indexes are on that expression. They only cover students,
+# which is all the picker searches.
+PICKER_FIELDS = ["username", "email", "first_name", "last_name"]
+
+CREATE_INDEX_SQL = [
+    f"""
+    CREATE INDEX core_user_student_{field}_trgm ON core_user
+    USING gin ((UPPER({field}::text)) gin_trgm_ops) WHERE role = 'student';
+    """
+    for field in PICKER_FIELDS
+]
+
+DROP_INDEX_SQL = [f"DROP INDEX IF EXISTS core_user_student_{field}_trgm;" for field in PICKER_FIELDS]
+
+
+def _run_on_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "postgresql":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_catalogueimport'),
+    ]
+
+    operations = [
+        # pg_trgm is installed by 0008.
+        migrations.RunPython(
+            _run_on_postgres(CREATE_INDEX_SQL),
+            _run_on_postgres(DROP_INDEX_SQL),
+        ),
+    ]
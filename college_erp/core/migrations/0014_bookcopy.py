@@ -0,0 +1,108 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+OPEN_ACTIONS = ('issued', 'overdue')
+# core.copies.BARCODE_FORMAT at the time of this migration.
+BARCODE_FORMAT = 'LIB-{book_id:06d}-{number:03d}'
+CHUNK = 500
+
+
+def backfill_copies(apps, schema_editor):
+    """
+    Create the copies each book's counters describe. Every open issue gets a
+    copy of its own, on loan; the rest of copies_total is on the shelf. The
+    counters are then rewritten from the copies, which also corrects any
+    drift between copies_available and the open issues.
+    """
+    Book = apps.get_model('core', 'Book')
+    BookCopy = apps.get_model('core', 'BookCopy')
+    BookIssue = apps.get_model('core', 'BookIssue')
+
+    book_ids = list(Book.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(book_ids), CHUNK):
+        books = list(Book.objects.filter(pk__in=book_ids[start:start + CHUNK]).only('copies_total'))
+        open_issues = {}
+        for book_id, issue_id in (
+            BookIssue.objects.filter(book__in=books, action__in=OPEN_ACTIONS)
+            .order_by('book_id', 'pk')
+            .values_list('book_id', 'pk')
+        ):
+            open_issues.setdefault(book_id, []).append(issue_id)
+
+        copies = []
+        for book in books:
+            on_loan = len(open_issues.get(book.pk, ()))
+            copies += [
+                BookCopy(
+                    book_id=book.pk,
+                    barcode=BARCODE_FORMAT.format(book_id=book.pk, number=number),
+                    status='on_loan' if number <= on_loan else 'available',
+                )
+                for number in range(1, max(book.copies_total, on_loan) + 1)
+            ]
+        BookCopy.objects.bulk_create(copies, batch_size=CHUNK)
+
+        # The n-th open issue of a book takes its n-th copy on loan: one
+        # UPDATE per rank rather than a CASE over every issue.
+        by_rank = {}
+        for issue_ids in open_issues.values():
+            for rank, issue_id in enumerate(issue_ids):
+                by_rank.setdefault(rank, []).append(issue_id)
+        for rank, issue_ids in by_rank.items():
+            BookIssue.objects.filter(pk__in=issue_ids).update(copy=Subquery(
+                BookCopy.objects.filter(book=OuterRef('book'), status='on_loan')
+                .order_by('pk').values('pk')[rank:rank + 1]
+            ))
+
+    # One statement for the counters, counting on the (book, status) index.
+    def count(statuses):
+        return Coalesce(Subquery(
+            BookCopy.objects.filter(book=OuterRef('pk'), status__in=statuses)
+            .order_by().values('book').annotate(n=Count('id')).values('n'),
+            output_field=models.IntegerField(),
+        ), 0)
+
+    Book.objects.update(copies_total=count(['available', 'on_loan']), copies_available=count(['available']))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_backgroundtask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookCopy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('barcode', models.CharField(max_length=32, unique=True)),
+                ('status', models.CharField(choices=[('available', 'Available'), ('on_loan', 'On loan'), ('lost', 'Lost'), ('withdrawn', 'Withdrawn')], default='available', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('book', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='copies', to='core.book')),
+            ],
+            options={
+                'verbose_name': 'Book Copy',
+                'verbose_name_plural': 'Book Copies',
+                'ordering': ['book', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='bookissue',
+            name='copy',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='issues', to='core.bookcopy'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookissue',
+            constraint=models.UniqueConstraint(condition=models.Q(('action__in', ['issued', 'overdue'])), fields=('copy',), name='unique_open_issue_per_copy'),
+        ),
+        migrations.AddIndex(
+            model_name='bookcopy',
+            index=models.Index(fields=['book', 'status'], name='bookcopy_book_status_idx'),
+        ),
+        migrations.RunPython(backfill_copies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_bookcopy'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bookcopy',
+            name='status',
+            field=models.CharField(choices=[('available', 'Available'), ('on_loan', 'On loan'), ('on_hold', 'On the hold shelf'), ('lost', 'Lost'), ('withdrawn', 'Withdrawn')], default='available', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='Hold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('waiting', 'Waiting'), ('ready', 'Ready for pickup'), ('fulfilled', 'Fulfilled'), ('cancelled', 'Cancelled'), ('expired', 'Expired')], default='waiting', max_length=10)),
+                ('ticket', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ready_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('closed_at', models.DateTimeField(blank=True, null=True)),
+                ('book', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='core.book')),
+                ('copy', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='holds', to='core.bookcopy')),
+                ('student', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='holds', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Hold',
+                'verbose_name_plural': 'Holds',
+                'ordering': ['book', 'ticket'],
+                'indexes': [models.Index(condition=models.Q(('status', 'waiting')), fields=['book', 'ticket'], name='hold_waiting_queue_idx'), models.Index(condition=models.Q(('status', 'ready')), fields=['expires_at'], name='hold_ready_expires_at_idx'), models.Index(fields=['student', 'status'], name='hold_student_status_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['waiting', 'ready'])), fields=('book', 'student'), name='unique_open_hold_per_book_student')],
+            },
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+CHUNK = 2000
+
+
+def backfill_charges(apps, schema_editor):
+    """
+    Post a charge for every fine already recorded on a returned issue, in
+    return order per student, and open an account with the running total.
+    Fines on open issues are still accruing and are charged on return.
+    """
+    BookIssue = apps.get_model('core', 'BookIssue')
+    FineAccount = apps.get_model('core', 'FineAccount')
+    FineEntry = apps.get_model('core', 'FineEntry')
+
+    rows = (
+        BookIssue.objects.filter(action='returned', fine_amount__gt=0)
+        .order_by('student_id', 'returned_at', 'pk')
+        .values_list('student_id', 'pk', 'fine_amount', 'returned_at')
+        .iterator(chunk_size=CHUNK)
+    )
+    balances, entries = {}, []
+    for student_id, issue_id, fine, returned_at in rows:
+        balances[student_id] = balances.get(student_id, 0) + fine
+        entries.append(FineEntry(
+            student_id=student_id, kind='charge', amount=fine, balance=balances[student_id],
+            issue_id=issue_id, created_at=returned_at,
+        ))
+        if len(entries) >= CHUNK:
+            FineEntry.objects.bulk_create(entries)
+            entries = []
+    FineEntry.objects.bulk_create(entries)
+    FineAccount.objects.bulk_create(
+        (FineAccount(student_id=student_id, balance=balance) for student_id, balance in balances.items()),
+        batch_size=CHUNK,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_hold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FineAccount',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fine_account', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('balance', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Fine Account',
+                'verbose_name_plural': 'Fine Accounts',
+                'ordering': ['-balance', 'student'],
+                'indexes': [models.Index(condition=models.Q(('balance__gt', 0)), fields=['-balance', 'student'], name='fineaccount_outstanding_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='FineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('charge', 'Charge'), ('payment', 'Payment'), ('waiver', 'Waiver')], max_length=10)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('issue', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='fine_entries', to='core.bookissue')),
+                ('recorded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('student', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='fine_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Fine Entry',
+                'verbose_name_plural': 'Fine Entries',
+                'ordering': ['student', '-id'],
+                'indexes': [models.Index(fields=['student', '-id'], name='fineentry_student_id_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('kind', 'charge')), fields=('issue',), name='unique_charge_per_issue')],
+            },
+        ),
+        migrations.RunPython(backfill_charges, migrations.RunPython.noop),
+    ]
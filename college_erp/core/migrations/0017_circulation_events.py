@@ -0,0 +1,145 @@
+# Generated by Django 5.2.6 on 2026-10-18 01:21
+
+from datetime import datetime, time, timedelta
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+CHUNK = 2000
+PROJECTIONS = ('current_loans', 'daily_stats', 'student_stats')
+
+
+def backfill_log(apps, schema_editor):
+    """
+    Reconstruct the log from existing issues (issued, overdue for open
+    loans past due, returned) and build the read models from the same pass.
+    The daily rollup is already current, so every projection starts at the
+    end of the backfilled log.
+    """
+    BookIssue = apps.get_model('core', 'BookIssue')
+    CirculationEvent = apps.get_model('core', 'CirculationEvent')
+    CurrentLoan = apps.get_model('core', 'CurrentLoan')
+    ProjectionOffset = apps.get_model('core', 'ProjectionOffset')
+    StudentCirculationStat = apps.get_model('core', 'StudentCirculationStat')
+
+    rows = BookIssue.objects.order_by('pk').values_list(
+        'pk', 'book_id', 'student_id', 'action', 'issued_at', 'returned_at', 'due_date', 'fine_amount',
+    ).iterator(chunk_size=CHUNK)
+    events, loans, stats = [], [], {}
+    for pk, book_id, student_id, action, issued_at, returned_at, due_date, fine in rows:
+        ids = {'issue_id': pk, 'book_id': book_id, 'student_id': student_id, 'due_date': due_date}
+        stat = stats.setdefault(student_id, StudentCirculationStat(student_id=student_id, fines=0))
+        stat.loans += 1
+        events.append(CirculationEvent(kind='issued', occurred_at=issued_at, **ids))
+        last = issued_at
+        if action == 'returned':
+            last = returned_at or issued_at
+            events.append(CirculationEvent(
+                kind='returned', previous='issued', fine=fine or 0, occurred_at=last, **ids
+            ))
+            stat.returns += 1
+            stat.late_returns += int(bool(due_date and timezone.localdate(last) > due_date))
+            stat.fines += fine or 0
+        else:
+            overdue = action == 'overdue'
+            if overdue:
+                overdue_at = timezone.make_aware(datetime.combine(due_date + timedelta(days=1), time.min))
+                last = max(overdue_at, issued_at)
+                events.append(CirculationEvent(kind='overdue', previous='issued', occurred_at=last, **ids))
+            loans.append(CurrentLoan(
+                issue_id=pk, book_id=book_id, student_id=student_id, issued_at=issued_at,
+                due_date=due_date, overdue=overdue,
+            ))
+            stat.current += 1
+            stat.overdue += int(overdue)
+        stat.last_event_at = max(filter(None, (stat.last_event_at, last)))
+        if len(events) >= CHUNK:
+            CirculationEvent.objects.bulk_create(events)
+            events = []
+        if len(loans) >= CHUNK:
+            CurrentLoan.objects.bulk_create(loans)
+            loans = []
+    CirculationEvent.objects.bulk_create(events)
+    CurrentLoan.objects.bulk_create(loans)
+    StudentCirculationStat.objects.bulk_create(stats.values(), batch_size=CHUNK)
+    position = CirculationEvent.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    ProjectionOffset.objects.bulk_create(ProjectionOffset(name=name, position=position) for name in PROJECTIONS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_fine_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectionOffset',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('position', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Projection Offset',
+                'verbose_name_plural': 'Projection Offsets',
+            },
+        ),
+        migrations.CreateModel(
+            name='StudentCirculationStat',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='circulation_stat', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('current', models.PositiveIntegerField(default=0)),
+                ('overdue', models.PositiveIntegerField(default=0)),
+                ('loans', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+                ('late_returns', models.PositiveIntegerField(default=0)),
+                ('fines', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('last_event_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Student Circulation Stat',
+                'verbose_name_plural': 'Student Circulation Stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='CurrentLoan',
+            fields=[
+                ('issue', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='current_loan', serialize=False, to='core.bookissue')),
+                ('issued_at', models.DateTimeField()),
+                ('due_date', models.DateField(blank=True, null=True)),
+                ('overdue', models.BooleanField(default=False)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.book')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Current Loan',
+                'verbose_name_plural': 'Current Loans',
+            },
+        ),
+        migrations.CreateModel(
+            name='CirculationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('issued', 'Issued'), ('overdue', 'Went overdue'), ('cleared', 'No longer overdue'), ('returned', 'Returned')], max_length=10)),
+                ('previous', models.CharField(blank=True, max_length=10)),
+                ('due_date', models.DateField(blank=True, null=True)),
+                ('fine', models.DecimalField(decimal_places=2, default=0.0, max_digits=8)),
+                ('occurred_at', models.DateTimeField()),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('book', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.book')),
+                ('issue', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='events', to='core.bookissue')),
+                ('student', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Circulation Event',
+                'verbose_name_plural': 'Circulation Events',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['issue', 'id'], name='circevent_issue_id_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_log, migrations.RunPython.noop),
+    ]
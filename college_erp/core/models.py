@@ -1,4 +1,6 @@
 from django.contrib.auth.models import AbstractUser, Group, Permission
+from django.contrib.postgres.search import SearchVectorField
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
@@ -12,7 +14,7 @@ class User(AbstractUser):
         ("clerk", "Clerk"),
         ("librarian", "Librarian"),
     ]
-    role = models.CharField(max_length=20, choices=ROLE_CHOICES, default="student")
+    role = models.CharField(max_length=20, choices=ROLE_CHOICES, default="student", db_index=True)
 
     # Avoid clashes with auth.User
     groups = models.ManyToManyField(
@@ -39,12 +41,19 @@ class Book(models.Model):
 
     title = models.CharField(max_length=255)
     author = models.CharField(max_length=255, blank=True)
-    isbn = models.CharField(max_length=20, blank=True, null=True)
+    # Unique when set; store NULL rather than "" for books without one.
+    isbn = models.CharField(max_length=20, blank=True, null=True, unique=True)
     publisher = models.CharField(max_length=255, blank=True)
     year_published = models.PositiveSmallIntegerField(null=True, blank=True)
+    # Summary of the book's BookCopy rows, kept in step by core.copies and
+    # core.circulation: copies held (all but withdrawn ones) and copies on
+    # the shelf.
     copies_total = models.PositiveIntegerField(default=1)
     copies_available = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Filled by a PostgreSQL trigger from title/author/isbn/publisher; the GIN
+    # and trigram indexes are created in migration 0008 (PostgreSQL only).
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         ordering = ["title"]
@@ -54,6 +63,36 @@ class Book(models.Model):
     def __str__(self):
         return f"{self.title} — {self.author}"
 
+class BookCopy(models.Model):
+    """One physical copy of a book, identified at the desk by its barcode."""
+
+    STATUS_CHOICES = [
+        ("available", "Available"),
+        ("on_loan", "On loan"),
+        ("on_hold", "On the hold shelf"),
+        ("lost", "Lost"),
+        ("withdrawn", "Withdrawn"),
+    ]
+
+    # Covered by the (book, status) index below.
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="copies", db_index=False)
+    barcode = models.CharField(max_length=32, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="available")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["book", "id"]
+        verbose_name = "Book Copy"
+        verbose_name_plural = "Book Copies"
+        indexes = [
+            # Picking a copy off the shelf and recounting a book's copies.
+            models.Index(fields=["book", "status"], name="bookcopy_book_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.barcode} ({self.status})"
+
+
 class BookIssue(models.Model):
     """Tracks which user has which book and its status."""
 
@@ -63,10 +102,28 @@ class BookIssue(models.Model):
         ("lost", "Lost"),
         ("overdue", "Overdue"),
     ]
+    # Actions for which the copy is still out with the student.
+    OPEN_ACTIONS = ("issued", "overdue")
 
-    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="issues")
+    # The composite indexes below lead with book and student, so the plain
+    # foreign key indexes would only slow down writes.
+    book = models.ForeignKey(
+        Book, on_delete=models.CASCADE, related_name="issues", db_index=False
+    )
     student = models.ForeignKey(
-        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="book_issues"
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="book_issues",
+        db_index=False,
+    )
+    # The physical copy handed out; indexed by the open-issue constraint below.
+    copy = models.ForeignKey(
+        BookCopy,
+        on_delete=models.SET_NULL,
+        related_name="issues",
+        null=True,
+        blank=True,
+        db_index=False,
     )
     action = models.CharField(max_length=10, choices=ACTION_CHOICES, default="issued")
     issued_at = models.DateTimeField(default=timezone.now)
@@ -79,25 +136,447 @@ class BookIssue(models.Model):
         ordering = ["-issued_at"]
         verbose_name = "Book Issue"
         verbose_name_plural = "Book Issues"
+        indexes = [
+            # Matches the keyset order used by core.pagination.paginate_issues.
+            models.Index(fields=["-issued_at", "id"], name="bookissue_issued_at_id_idx"),
+            # Duplicate checks and per-book/per-student history.
+            models.Index(fields=["book", "student", "action"], name="bookissue_book_stu_action_idx"),
+            models.Index(fields=["student", "action"], name="bookissue_student_action_idx"),
+            # Open issues are a small slice of the table; the counters and the
+            # overdue sweep only ever look at them.
+            models.Index(
+                fields=["action"],
+                condition=models.Q(action__in=["issued", "overdue"]),
+                name="bookissue_open_action_idx",
+            ),
+            models.Index(
+                fields=["due_date"],
+                condition=models.Q(action__in=["issued", "overdue"]),
+                name="bookissue_open_due_date_idx",
+            ),
+            # Returned-on-day ranges (rollup rebuild, reports).
+            models.Index(
+                fields=["returned_at"],
+                condition=models.Q(returned_at__isnull=False),
+                name="bookissue_returned_at_idx",
+            ),
+        ]
+        constraints = [
+            # A student can hold at most one open copy of the same book.
+            models.UniqueConstraint(
+                fields=["book", "student"],
+                condition=models.Q(action__in=["issued", "overdue"]),
+                name="unique_open_issue_per_book_student",
+            ),
+            # A copy can only be out on one loan at a time.
+            models.UniqueConstraint(
+                fields=["copy"],
+                condition=models.Q(action__in=["issued", "overdue"]),
+                name="unique_open_issue_per_copy",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.book.title} -> {self.student.username} ({self.action})"
     
     def is_overdue(self):
         """Check if the book is overdue."""
-        if self.action == 'returned':
+        if self.action not in self.OPEN_ACTIONS:
             return False
         if self.due_date:
-            from datetime import date
-            return date.today() > self.due_date
+            return timezone.localdate() > self.due_date
         return False
     
     def calculate_fine(self):
-        """Calculate fine for overdue books."""
+        """Calculate fine for overdue books ($1 per day, max $50)."""
         if not self.is_overdue():
             return 0.00
         
-        from datetime import date
-        days_overdue = (date.today() - self.due_date).days
-        # Fine: $1 per day overdue
-        return min(days_overdue * 1.00, 50.00)  # Max $50 fine
+        from .fines import fine_for
+        return fine_for(self.due_date, timezone.localdate())
+
+
+class Hold(models.Model):
+    """
+    A student's place in the queue for a book (see core.holds).
+
+    Waiting holds are served in `ticket` order. Tickets are handed out per
+    book under the book's row lock and kept contiguous, so a hold's queue
+    position is its ticket minus the first waiting ticket.
+    """
+
+    STATUS_CHOICES = [
+        ("waiting", "Waiting"),
+        ("ready", "Ready for pickup"),
+        ("fulfilled", "Fulfilled"),
+        ("cancelled", "Cancelled"),
+        ("expired", "Expired"),
+    ]
+    OPEN_STATUSES = ("waiting", "ready")
+
+    # Covered by the queue index and the open-hold constraint below.
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="holds", db_index=False)
+    student = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="holds", db_index=False
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="waiting")
+    ticket = models.PositiveIntegerField()
+    # The copy set aside on the hold shelf once the hold is ready.
+    copy = models.ForeignKey(
+        BookCopy, on_delete=models.SET_NULL, related_name="holds", null=True, blank=True
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    closed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["book", "ticket"]
+        verbose_name = "Hold"
+        verbose_name_plural = "Holds"
+        indexes = [
+            # The queue: head, tail and position are single-row reads.
+            models.Index(
+                fields=["book", "ticket"],
+                condition=models.Q(status="waiting"),
+                name="hold_waiting_queue_idx",
+            ),
+            models.Index(
+                fields=["expires_at"],
+                condition=models.Q(status="ready"),
+                name="hold_ready_expires_at_idx",
+            ),
+            models.Index(fields=["student", "status"], name="hold_student_status_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["book", "student"],
+                condition=models.Q(status__in=["waiting", "ready"]),
+                name="unique_open_hold_per_book_student",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} #{self.ticket} -> {self.student_id} ({self.status})"
+
+
+class CirculationEvent(models.Model):
+    """
+    One state change of a loan, appended to the circulation log in the same
+    transaction as the change (see core.events). BookIssue keeps only the
+    latest state; the log keeps every transition. The id is the offset
+    projections read from (core.projections).
+    """
+
+    KIND_CHOICES = [
+        ("issued", "Issued"),
+        ("overdue", "Went overdue"),
+        ("cleared", "No longer overdue"),
+        ("returned", "Returned"),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # The issue's action before this event; blank for "issued".
+    previous = models.CharField(max_length=10, blank=True)
+    # Covered by the (issue, id) index below.
+    issue = models.ForeignKey(
+        BookIssue, on_delete=models.CASCADE, related_name="events", db_index=False
+    )
+    # Copied from the issue so projections never join back to it.
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="+", db_index=False)
+    student = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+", db_index=False
+    )
+    due_date = models.DateField(null=True, blank=True)
+    fine = models.DecimalField(max_digits=8, decimal_places=2, default=0.00)
+    occurred_at = models.DateTimeField()
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name = "Circulation Event"
+        verbose_name_plural = "Circulation Events"
+        indexes = [
+            models.Index(fields=["issue", "id"], name="circevent_issue_id_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Circulation events are append-only.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} issue {self.issue_id}"
+
+
+class ProjectionOffset(models.Model):
+    """The last CirculationEvent id a projection has applied (see core.projections)."""
+
+    name = models.CharField(max_length=50, primary_key=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Projection Offset"
+        verbose_name_plural = "Projection Offsets"
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+
+class CurrentLoan(models.Model):
+    """Read model: one row per loan still out, projected from the circulation log."""
+
+    issue = models.OneToOneField(
+        BookIssue, on_delete=models.CASCADE, primary_key=True, related_name="current_loan"
+    )
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="+")
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    issued_at = models.DateTimeField()
+    due_date = models.DateField(null=True, blank=True)
+    overdue = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name = "Current Loan"
+        verbose_name_plural = "Current Loans"
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.student_id}"
+
+
+class StudentCirculationStat(models.Model):
+    """Read model: a student's loan counters, projected from the circulation log."""
+
+    student = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name="circulation_stat"
+    )
+    current = models.PositiveIntegerField(default=0)
+    overdue = models.PositiveIntegerField(default=0)
+    loans = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    late_returns = models.PositiveIntegerField(default=0)
+    fines = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    last_event_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Student Circulation Stat"
+        verbose_name_plural = "Student Circulation Stats"
+
+    def __str__(self):
+        return f"{self.student_id}: {self.current} out, {self.loans} loans"
+
+
+class FineEntry(models.Model):
+    """
+    One line of the append-only fine ledger (see core.ledger).
+
+    `amount` is signed: charges are positive, payments and waivers
+    negative. `balance` is the student's running balance after this entry.
+    """
+
+    KIND_CHOICES = [
+        ("charge", "Charge"),
+        ("payment", "Payment"),
+        ("waiver", "Waiver"),
+    ]
+
+    # Covered by the (student, id) index below.
+    student = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="fine_entries", db_index=False
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    amount = models.DecimalField(max_digits=8, decimal_places=2)
+    balance = models.DecimalField(max_digits=10, decimal_places=2)
+    # The loan a charge is for; indexed by the one-charge-per-issue constraint.
+    issue = models.ForeignKey(
+        BookIssue, on_delete=models.SET_NULL, related_name="fine_entries",
+        null=True, blank=True, db_index=False,
+    )
+    recorded_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, related_name="+", null=True, blank=True
+    )
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["student", "-id"]
+        verbose_name = "Fine Entry"
+        verbose_name_plural = "Fine Entries"
+        indexes = [
+            # A student's statement, newest first, and the last running balance.
+            models.Index(fields=["student", "-id"], name="fineentry_student_id_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["issue"], condition=models.Q(kind="charge"), name="unique_charge_per_issue"
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Fine entries are append-only; post a new entry instead.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.kind} {self.amount} -> {self.student_id} (balance {self.balance})"
+
+
+class FineAccount(models.Model):
+    """
+    A student's fine balance: the sum of their FineEntry amounts, updated
+    by core.ledger in the same transaction as each entry, so reading it is
+    one primary-key lookup.
+    """
+
+    student = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name="fine_account"
+    )
+    balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["-balance", "student"]
+        verbose_name = "Fine Account"
+        verbose_name_plural = "Fine Accounts"
+        indexes = [
+            # Outstanding balances, largest first: the librarian's list pages on it.
+            models.Index(
+                fields=["-balance", "student"],
+                condition=models.Q(balance__gt=0),
+                name="fineaccount_outstanding_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.student_id}: {self.balance}"
+
+
+class CirculationDailyStat(models.Model):
+    """
+    Per-day, per-book circulation rollup (see core.rollups).
+
+    `overdue` counts returns that came back after their due date and
+    `fines` is the total fined on that day's returns.
+    """
+
+    date = models.DateField()
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="daily_stats")
+    issues = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    overdue = models.PositiveIntegerField(default=0)
+    fines = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+
+    class Meta:
+        ordering = ["-date"]
+        verbose_name = "Circulation Daily Stat"
+        verbose_name_plural = "Circulation Daily Stats"
+        constraints = [
+            models.UniqueConstraint(fields=["date", "book"], name="unique_daily_stat_per_book"),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.book_id}: +{self.issues} / -{self.returns}"
+
+
+class OverdueSweep(models.Model):
+    """One run of the overdue/fine sweep (see core.fines.sweep_overdue)."""
+
+    swept_through = models.DateField(db_index=True)
+    marked = models.PositiveIntegerField(default=0)
+    cleared = models.PositiveIntegerField(default=0)
+    ran_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-ran_at"]
+        verbose_name = "Overdue Sweep"
+        verbose_name_plural = "Overdue Sweeps"
+
+    def __str__(self):
+        return f"Sweep through {self.swept_through} ({self.marked} marked)"
+
+
+class CatalogueImport(models.Model):
+    """
+    One catalogue import run (see core.book_import). `records_done` is
+    committed together with each batch, so a failed run resumes from there.
+    """
+
+    STATUS_CHOICES = [
+        ("running", "Running"),
+        ("failed", "Failed"),
+        ("completed", "Completed"),
+    ]
+
+    source = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, db_index=True)
+    format = models.CharField(max_length=20)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="running")
+    records_done = models.PositiveIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    last_error = models.TextField(blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-started_at"]
+        verbose_name = "Catalogue Import"
+        verbose_name_plural = "Catalogue Imports"
+
+    def __str__(self):
+        return f"{self.source} ({self.status}, {self.records_done} records)"
+
+
+class BackgroundTask(models.Model):
+    """
+    One queued run of a registered task (see core.tasks). Workers claim due
+    rows, so `run_at` doubles as the retry and schedule time.
+    """
+
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("succeeded", "Succeeded"),
+        ("failed", "Failed"),
+    ]
+
+    name = models.CharField(max_length=100, db_index=True)
+    kwargs = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    # At most one row per key: de-duplicates enqueues and schedule periods.
+    key = models.CharField(max_length=200, null=True, blank=True, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    locked_by = models.CharField(max_length=100, blank=True)
+    # Lease start, renewed by the worker while the task runs.
+    locked_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = "Background Task"
+        verbose_name_plural = "Background Tasks"
+        indexes = [
+            # Claiming: due queued rows in run_at order.
+            models.Index(
+                fields=["run_at", "id"],
+                condition=models.Q(status="queued"),
+                name="task_queued_run_at_idx",
+            ),
+            # Expired leases.
+            models.Index(
+                fields=["locked_at"],
+                condition=models.Q(status="running"),
+                name="task_running_locked_at_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
@@ -0,0 +1,122 @@
+# college_erp/core/pagination.py
+"""
+Keyset (cursor) pagination for BookIssue listings and fine balances.
+
+Issues are paged by (-issued_at, id), fine accounts by (-balance, student).
+Instead of OFFSET, each page remembers the sort key and primary key of its
+first and last row and the next query continues from there, so page 5,000
+costs the same index range scan as page 1.
+"""
+import base64
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _encode(value, pk):
+    raw = f"{value}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(token, parse):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        value, pk_str = base64.urlsafe_b64decode(padded).decode().split("|")
+        return parse(value), int(pk_str)
+    except (TypeError, ValueError, UnicodeDecodeError, InvalidOperation) as exc:
+        raise ValueError("Invalid cursor.") from exc
+
+
+def encode_cursor(issued_at, pk):
+    """Encode a row position as an opaque, URL-safe token."""
+    return _encode(issued_at.isoformat(), pk)
+
+
+def decode_cursor(token):
+    """Decode a token produced by encode_cursor. Raises ValueError if invalid."""
+    return _decode(token, datetime.fromisoformat)
+
+
+def clamp_page_size(value, default=DEFAULT_PAGE_SIZE):
+    """Parse a page size from user input and keep it within bounds."""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+class KeysetPage:
+    """One bounded page of rows plus the cursors needed to move around."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _paginate(queryset, field, parse, after, before, page_size):
+    """
+    A KeysetPage of `queryset` ordered by (-field, pk).
+
+    `after` continues forward from a cursor, `before` walks back from one.
+    Only page_size + 1 rows are ever fetched; the extra row tells us whether
+    another page exists in that direction.
+    """
+    def cursor(row):
+        value = getattr(row, field)
+        return _encode(value.isoformat() if isinstance(value, datetime) else value, row.pk)
+
+    if before:
+        value, pk = _decode(before, parse)
+        rows = list(
+            queryset.filter(Q(**{f"{field}__gt": value}) | Q(**{field: value, "pk__lt": pk}))
+            .order_by(field, "-pk")[: page_size + 1]
+        )
+        has_more = len(rows) > page_size
+        items = rows[:page_size][::-1]
+        # We came from a later page, so there is always a next one.
+        next_cursor = cursor(items[-1]) if items else before
+        prev_cursor = cursor(items[0]) if has_more else None
+        return KeysetPage(items, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+    if after:
+        value, pk = _decode(after, parse)
+        queryset = queryset.filter(Q(**{f"{field}__lt": value}) | Q(**{field: value, "pk__gt": pk}))
+
+    rows = list(queryset.order_by(f"-{field}", "pk")[: page_size + 1])
+    has_more = len(rows) > page_size
+    items = rows[:page_size]
+    next_cursor = cursor(items[-1]) if has_more else None
+    prev_cursor = None
+    if after:
+        prev_cursor = cursor(items[0]) if items else after
+    return KeysetPage(items, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+def paginate_issues(queryset, after=None, before=None, page_size=DEFAULT_PAGE_SIZE):
+    """Return a KeysetPage of `queryset` ordered by (-issued_at, id)."""
+    return _paginate(queryset, "issued_at", datetime.fromisoformat, after, before, page_size)
+
+
+def paginate_balances(queryset, after=None, before=None, page_size=DEFAULT_PAGE_SIZE):
+    """Return a KeysetPage of FineAccounts ordered by (-balance, student), largest first."""
+    return _paginate(queryset, "balance", Decimal, after, before, page_size)
@@ -0,0 +1,293 @@
+# college_erp/core/profiling.py
+"""
+Per-request cost instrumentation.
+
+ProfilingMiddleware times a sample of requests (PROFILING_SAMPLE_RATE) and
+records, per URL name, the number of SQL queries, time spent in SQL, time
+spent rendering templates and total time. Every database connection gets
+one execute wrapper when it is created, which reports to the profile of
+the request in progress (a context variable). So queries are counted for
+sync and async views alike, including those run on other threads by
+core.async_queries. DEBUG does not have to be on, and nothing is stored per
+query except a counter per SQL string. Since Django sends SQL
+with placeholders, the same string run many times in one request is the
+signature of an N+1 loop (a template reading `issue.book.title` row by
+row); those requests are logged and counted.
+
+`capture()` counts the queries of a block the same way, across threads;
+the benchmark (core.benchmark) uses it, so its query counts include the
+async views' pool-thread queries too.
+
+Sampled responses carry a Server-Timing header, which browsers show in the
+network panel. Aggregates live in this process and can be read at the
+staff-only `ops/profiling/` endpoint.
+"""
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_RATE = 1.0
+# The same SQL this many times in one request is reported as N+1.
+DEFAULT_DUPLICATE_THRESHOLD = 5
+MAX_PATTERNS = 10
+
+# Histogram upper bounds; the last bucket is open-ended.
+MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_current = contextvars.ContextVar("erp_request_profile", default=None)
+
+
+class RequestProfile:
+    __slots__ = ("queries", "sql_ms", "render_ms", "rendering", "statements", "parent", "_lock")
+
+    def __init__(self, parent=None):
+        # Queries also count towards the enclosing profile, if any (capture()).
+        self.parent = parent
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.render_ms = 0.0
+        self.rendering = False
+        self.statements = Counter()
+        # Queries of one request may run on several threads at once.
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            profile = self
+            while profile is not None:
+                with profile._lock:
+                    profile.sql_ms += elapsed
+                    profile.queries += 1
+                    profile.statements[sql] += 1
+                profile = profile.parent
+
+    def duplicates(self, threshold):
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+
+def _bucket(value, bounds):
+    for bound in bounds:
+        if value <= bound:
+            return f"<={bound}"
+    return f">{bounds[-1]}"
+
+
+class ProfileStore:
+    """Thread-safe per-view aggregates and histograms for this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+            self._since = time.time()
+
+    def add(self, view, total_ms, profile, duplicates):
+        with self._lock:
+            stats = self._views.get(view)
+            if stats is None:
+                stats = self._views[view] = {
+                    "requests": 0,
+                    "n_plus_one_requests": 0,
+                    "queries": 0,
+                    "max_queries": 0,
+                    "total_ms": 0.0,
+                    "max_total_ms": 0.0,
+                    "sql_ms": 0.0,
+                    "render_ms": 0.0,
+                    "histograms": {"total_ms": Counter(), "sql_ms": Counter(), "queries": Counter()},
+                    "duplicate_sql": Counter(),
+                }
+            stats["requests"] += 1
+            stats["queries"] += profile.queries
+            stats["max_queries"] = max(stats["max_queries"], profile.queries)
+            stats["total_ms"] += total_ms
+            stats["max_total_ms"] = max(stats["max_total_ms"], total_ms)
+            stats["sql_ms"] += profile.sql_ms
+            stats["render_ms"] += profile.render_ms
+            histograms = stats["histograms"]
+            histograms["total_ms"][_bucket(total_ms, MS_BUCKETS)] += 1
+            histograms["sql_ms"][_bucket(profile.sql_ms, MS_BUCKETS)] += 1
+            histograms["queries"][_bucket(profile.queries, QUERY_BUCKETS)] += 1
+            if duplicates:
+                stats["n_plus_one_requests"] += 1
+                for sql, count in duplicates:
+                    stats["duplicate_sql"][sql] = max(stats["duplicate_sql"][sql], count)
+
+    def snapshot(self):
+        """JSON-ready aggregates, slowest views (by total time) first."""
+        with self._lock:
+            views = []
+            for view, stats in self._views.items():
+                requests = stats["requests"]
+                views.append({
+                    "view": view,
+                    "requests": requests,
+                    "n_plus_one_requests": stats["n_plus_one_requests"],
+                    "avg_queries": round(stats["queries"] / requests, 2),
+                    "max_queries": stats["max_queries"],
+                    "avg_total_ms": round(stats["total_ms"] / requests, 3),
+                    "max_total_ms": round(stats["max_total_ms"], 3),
+                    "avg_sql_ms": round(stats["sql_ms"] / requests, 3),
+                    "avg_render_ms": round(stats["render_ms"] / requests, 3),
+                    "histograms": {
+                        name: dict(counter) for name, counter in stats["histograms"].items()
+                    },
+                    "duplicate_sql": [
+                        {"sql": sql, "max_per_request": count}
+                        for sql, count in stats["duplicate_sql"].most_common(MAX_PATTERNS)
+                    ],
+                    "_total": stats["total_ms"],
+                })
+            since = self._since
+        views.sort(key=lambda row: -row.pop("_total"))
+        return {
+            "pid": os.getpid(),
+            "since": since,
+            "sample_rate": sample_rate(),
+            "ms_buckets": list(MS_BUCKETS),
+            "query_buckets": list(QUERY_BUCKETS),
+            "views": views,
+        }
+
+
+store = ProfileStore()
+
+
+def sample_rate():
+    return getattr(settings, "PROFILING_SAMPLE_RATE", DEFAULT_SAMPLE_RATE)
+
+
+def _install_render_timer():
+    """Time template rendering by wrapping the Django template backend once."""
+    from django.template.backends.django import Template
+
+    if getattr(Template.render, "_erp_profiled", False):
+        return
+    original = Template.render
+
+    def render(self, context=None, request=None):
+        profile = _current.get()
+        if profile is None or profile.rendering:
+            return original(self, context, request)
+        profile.rendering = True
+        started = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            profile.render_ms += (time.perf_counter() - started) * 1000
+            profile.rendering = False
+
+    render._erp_profiled = True
+    Template.render = render
+
+
+def _observe(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile(execute, sql, params, many, context)
+
+
+def install_query_observer(sender=None, connection=None, **kwargs):
+    """Add the profiling wrapper to a connection (once; runs on connection_created)."""
+    if _observe not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_observe)
+
+
+connection_created.connect(install_query_observer, dispatch_uid="core.profiling")
+
+
+@contextmanager
+def capture():
+    """A RequestProfile counting every query run in the block, on any thread it reaches."""
+    # Connections opened before this module was imported missed the signal.
+    for conn in connections.all(initialized_only=True):
+        install_query_observer(connection=conn)
+    profile = RequestProfile(parent=_current.get())
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+
+
+def server_timing(profile, total_ms):
+    return (
+        f'sql;dur={profile.sql_ms:.1f};desc="{profile.queries} queries", '
+        f"render;dur={profile.render_ms:.1f}, "
+        f"total;dur={total_ms:.1f}"
+    )
+
+
+class ProfilingMiddleware:
+    """Sampled SQL/render/total timing per URL name; see the module docstring."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        _install_render_timer()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if random.random() >= sample_rate():
+            return self.get_response(request)
+        profile = RequestProfile(parent=_current.get())
+        token = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, profile, started)
+
+    async def __acall__(self, request):
+        if random.random() >= sample_rate():
+            return await self.get_response(request)
+        profile = RequestProfile(parent=_current.get())
+        token = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, profile, started)
+
+    def _finish(self, request, response, profile, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "<unresolved>"
+        threshold = getattr(settings, "PROFILING_DUPLICATE_THRESHOLD", DEFAULT_DUPLICATE_THRESHOLD)
+        duplicates = profile.duplicates(threshold)
+        if duplicates:
+            sql, count = duplicates[0]
+            logger.warning("Possible N+1 in %s: %d× %s", view, count, sql[:300])
+        store.add(view, total_ms, profile, duplicates)
+        response["Server-Timing"] = server_timing(profile, total_ms)
+        return response
@@ -0,0 +1,261 @@
+# college_erp/core/projections.py
+"""
+Read models built from the circulation log (core.events).
+
+Each projector turns batches of CirculationEvents into one read model:
+
+    current_loans  CurrentLoan, one row per loan still out
+    daily_stats    CirculationDailyStat, the per-day, per-book rollup
+    student_stats  StudentCirculationStat, each student's loan counters
+
+A projector remembers the last event id it applied in its ProjectionOffset
+row. catch_up() locks that row, applies the next batch of events and moves
+the offset in one transaction, so a batch is applied exactly once however
+many processes catch up at the same time. It runs after every circulation
+commit (catch_up_after_commit, one batch, skipping a projection another
+process is already advancing) and from the worker (core.jobs), which
+picks up anything those skipped. replay() empties a read model and
+rebuilds it from the first event, in batches.
+
+Event ids are handed out when the row is inserted but become visible at
+commit, so a lower id can appear after a higher one. A batch therefore
+stops at the first gap in the ids, unless the event after the gap was
+recorded more than PROJECTION_SETTLE_SECONDS ago: by then the gap is an
+id whose transaction rolled back, and it is skipped for good.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import caching, rollups
+from .fines import NO_FINE
+from .models import (
+    CirculationDailyStat, CirculationEvent, CurrentLoan, ProjectionOffset, StudentCirculationStat,
+)
+
+BATCH_SIZE = 1000
+DEFAULT_SETTLE_SECONDS = 30
+
+PROJECTORS = {}
+
+
+def settle_seconds():
+    return getattr(settings, "PROJECTION_SETTLE_SECONDS", DEFAULT_SETTLE_SECONDS)
+
+
+def projector(cls):
+    """Register a Projector subclass under its name."""
+    PROJECTORS[cls.name] = cls()
+    return cls
+
+
+class Projector:
+    name = None
+
+    def reset(self):
+        """Empty the read model before a replay."""
+        raise NotImplementedError
+
+    def apply(self, events):
+        """Apply events, in id order, inside the caller's transaction."""
+        raise NotImplementedError
+
+
+@projector
+class CurrentLoans(Projector):
+    name = "current_loans"
+
+    def reset(self):
+        CurrentLoan.objects.all().delete()
+
+    def apply(self, events):
+        opened, changed, closed = {}, {}, set()
+        for event in events:
+            if event.kind == "issued":
+                opened[event.issue_id] = CurrentLoan(
+                    issue_id=event.issue_id, book_id=event.book_id, student_id=event.student_id,
+                    issued_at=event.occurred_at, due_date=event.due_date,
+                )
+            elif event.kind == "returned":
+                opened.pop(event.issue_id, None)
+                changed.pop(event.issue_id, None)
+                closed.add(event.issue_id)
+            else:
+                loan = opened.get(event.issue_id) or changed.setdefault(
+                    event.issue_id, CurrentLoan(issue_id=event.issue_id)
+                )
+                loan.overdue, loan.due_date = event.kind == "overdue", event.due_date
+        CurrentLoan.objects.bulk_create(opened.values(), ignore_conflicts=True, batch_size=BATCH_SIZE)
+        if changed:
+            CurrentLoan.objects.bulk_update(changed.values(), ["overdue", "due_date"], batch_size=BATCH_SIZE)
+        if closed:
+            CurrentLoan.objects.filter(issue_id__in=closed).delete()
+        caching.bump_library_version()
+
+
+@projector
+class DailyStats(Projector):
+    name = "daily_stats"
+
+    def reset(self):
+        CirculationDailyStat.objects.all().delete()
+
+    def apply(self, events):
+        days = {}
+        for event in events:
+            if event.kind not in ("issued", "returned"):
+                continue
+            day = timezone.localdate(event.occurred_at)
+            deltas = days.setdefault(day, {}).setdefault(
+                event.book_id, {"issues": 0, "returns": 0, "overdue": 0, "fines": NO_FINE}
+            )
+            if event.kind == "issued":
+                deltas["issues"] += 1
+            else:
+                deltas["returns"] += 1
+                deltas["overdue"] += int(bool(event.due_date and day > event.due_date))
+                deltas["fines"] += event.fine
+        for day, deltas_by_book in days.items():
+            rollups.record_many(day, deltas_by_book)
+        if days:
+            caching.bump_library_version()
+
+
+@projector
+class StudentStats(Projector):
+    name = "student_stats"
+    COUNTERS = ("current", "overdue", "loans", "returns", "late_returns", "fines")
+
+    def reset(self):
+        StudentCirculationStat.objects.all().delete()
+
+    def apply(self, events):
+        deltas = {}
+        for event in events:
+            counters = deltas.setdefault(event.student_id, dict.fromkeys(self.COUNTERS, 0))
+            counters["last_event_at"] = event.occurred_at
+            if event.kind == "issued":
+                counters["loans"] += 1
+                counters["current"] += 1
+            elif event.kind == "overdue":
+                counters["overdue"] += 1
+            elif event.kind == "cleared":
+                counters["overdue"] -= 1
+            else:
+                day = timezone.localdate(event.occurred_at)
+                counters["current"] -= 1
+                counters["overdue"] -= int(event.previous == "overdue")
+                counters["returns"] += 1
+                counters["late_returns"] += int(bool(event.due_date and day > event.due_date))
+                counters["fines"] += event.fine
+        StudentCirculationStat.objects.bulk_create(
+            [StudentCirculationStat(student_id=student_id) for student_id in deltas],
+            ignore_conflicts=True, batch_size=BATCH_SIZE,
+        )
+        # The offset lock makes this projector the only writer, so a plain
+        # read-modify-write is safe.
+        stats = list(StudentCirculationStat.objects.filter(student_id__in=list(deltas)))
+        for stat in stats:
+            counters = deltas[stat.student_id]
+            for field in self.COUNTERS:
+                setattr(stat, field, getattr(stat, field) + counters[field])
+            stat.last_event_at = max(filter(None, (stat.last_event_at, counters["last_event_at"])))
+        StudentCirculationStat.objects.bulk_update(
+            stats, [*self.COUNTERS, "last_event_at"], batch_size=BATCH_SIZE
+        )
+        caching.bump_student_versions(deltas)
+
+
+def _lock(name, wait):
+    """The projection's offset row, locked; None if another process holds it and not `wait`."""
+    skip = not wait and connection.features.has_select_for_update_skip_locked
+    rows = ProjectionOffset.objects.select_for_update(skip_locked=skip).filter(name=name)
+    offset = rows.first()
+    if offset is None:
+        ProjectionOffset.objects.bulk_create([ProjectionOffset(name=name)], ignore_conflicts=True)
+        offset = rows.first()
+    return offset
+
+
+def ready(events, position, now):
+    """The leading events (ordered by id, all after `position`) that are safe to apply."""
+    cutoff = now - timedelta(seconds=settle_seconds())
+    expected = position + 1
+    for index, event in enumerate(events):
+        if event.pk != expected and event.recorded_at > cutoff:
+            # A lower id may belong to a transaction that has not committed yet.
+            return events[:index]
+        expected = event.pk + 1
+    return events
+
+
+def _step(name, batch_size, wait, now):
+    with transaction.atomic():
+        offset = _lock(name, wait)
+        if offset is None:
+            return 0
+        events = ready(
+            list(CirculationEvent.objects.filter(pk__gt=offset.position).order_by("pk")[:batch_size]),
+            offset.position,
+            now or timezone.now(),
+        )
+        if not events:
+            return 0
+        PROJECTORS[name].apply(events)
+        offset.position = events[-1].pk
+        offset.save(update_fields=["position", "updated_at"])
+    return len(events)
+
+
+def catch_up(names=None, batch_size=BATCH_SIZE, max_batches=None, wait=True, now=None):
+    """
+    Apply new events to each projection (all by default), one batch per
+    transaction, until none are ready or `max_batches` have been applied.
+    With wait=False a projection another process is advancing is skipped.
+    Returns the number of events applied per projection.
+    """
+    applied = {}
+    for name in names or PROJECTORS:
+        applied[name] = batches = 0
+        while max_batches is None or batches < max_batches:
+            count = _step(name, batch_size, wait, now)
+            if not count:
+                break
+            applied[name] += count
+            batches += 1
+    return applied
+
+
+def catch_up_after_commit():
+    """One batch for every projection, never waiting on another process (see core.events)."""
+    catch_up(max_batches=1, wait=False)
+
+
+def replay(name, batch_size=BATCH_SIZE):
+    """Empty a projection's read model and rebuild it from the first event; returns events applied."""
+    projector = PROJECTORS[name]
+    with transaction.atomic():
+        offset = _lock(name, wait=True)
+        projector.reset()
+        offset.position = 0
+        offset.save(update_fields=["position", "updated_at"])
+    return catch_up([name], batch_size)[name]
+
+
+def skip_to(name, position):
+    """Mark a projection as up to date with the log through `position` (after a rebuild elsewhere)."""
+    with transaction.atomic():
+        offset = _lock(name, wait=True)
+        offset.position = max(offset.position, position)
+        offset.save(update_fields=["position", "updated_at"])
+
+
+def lag():
+    """Events in the log not yet applied, per projection."""
+    positions = dict(ProjectionOffset.objects.values_list("name", "position"))
+    return {
+        name: CirculationEvent.objects.filter(pk__gt=positions.get(name, 0)).count()
+        for name in PROJECTORS
+    }
@@ -0,0 +1,145 @@
+# college_erp/core/query_plans.py
+"""
+EXPLAIN ANALYZE checks for the queries behind the circulation hot paths.
+
+`hot_queries` rebuilds the querysets the views, the sweep and the rollups
+run, using real ids from the database. `check_plans` explains each one on
+PostgreSQL and reports any sequential scan over the large tables, which
+means an index is missing or not usable for that query. Run it through the
+`check_query_plans` command against a seeded database.
+"""
+import json
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from . import copies, ledger, projections, reminders, search, student_summary
+from .models import (
+    Book, BookCopy, BookIssue, CirculationDailyStat, CirculationEvent, FineAccount, FineEntry, Hold, User,
+)
+from .pagination import DEFAULT_PAGE_SIZE
+
+# Tables large enough that a sequential scan on a hot path is a bug.
+HOT_TABLES = {
+    BookIssue._meta.db_table,
+    Book._meta.db_table,
+    BookCopy._meta.db_table,
+    User._meta.db_table,
+    CirculationDailyStat._meta.db_table,
+    Hold._meta.db_table,
+    FineEntry._meta.db_table,
+    FineAccount._meta.db_table,
+    CirculationEvent._meta.db_table,
+}
+
+
+class NoSampleData(Exception):
+    pass
+
+
+def hot_queries(today=None):
+    """[(name, queryset)] for the hot queries, parameterised with existing rows."""
+    today = today or timezone.localdate()
+    issue = BookIssue.objects.order_by("-id").first()
+    book = Book.objects.exclude(isbn=None).order_by("-id").first()
+    if issue is None or book is None:
+        raise NoSampleData("Seed the database with books (with ISBNs) and issues first.")
+    student = issue.student
+    week_ago = timezone.now() - timedelta(days=7)
+    page = DEFAULT_PAGE_SIZE + 1
+    keyset = ("-issued_at", "id")
+
+    return [
+        ("history_first_page",
+         BookIssue.objects.select_related("book", "student").order_by(*keyset)[:page]),
+        ("history_issued_range",
+         BookIssue.objects.filter(issued_at__gte=week_ago).order_by(*keyset)[:page]),
+        ("history_returned_range",
+         BookIssue.objects.filter(returned_at__gte=week_ago).order_by("returned_at")[:page]),
+        ("student_open_issues",
+         BookIssue.objects.filter(student_id=issue.student_id, action__in=BookIssue.OPEN_ACTIONS)
+         .select_related("book")),
+        ("student_history",
+         BookIssue.objects.filter(student_id=issue.student_id, action="returned")),
+        ("open_issue_for_book_student",
+         BookIssue.objects.filter(
+             book_id=issue.book_id, student_id=issue.student_id,
+             action__in=BookIssue.OPEN_ACTIONS,
+         )),
+        ("open_issue_counters",
+         BookIssue.objects.filter(action__in=BookIssue.OPEN_ACTIONS)
+         .values("action").annotate(n=Count("id")).order_by()),
+        ("overdue_sweep_candidates",
+         BookIssue.objects.filter(action__in=BookIssue.OPEN_ACTIONS, due_date__lt=today)),
+        ("reminder_digests", reminders.reminder_queryset(today)),
+        ("student_summary_loans",
+         student_summary.loan_queryset(student.pk)[:student_summary.RECENT_RETURNS]),
+        ("users_by_role", User.objects.filter(role="librarian")),
+        ("book_by_isbn", Book.objects.filter(isbn=book.isbn)),
+        ("copy_by_barcode", BookCopy.objects.filter(barcode=copies.barcode(book.pk, 1))),
+        ("hold_queue_head",
+         Hold.objects.filter(book_id=book.pk, status="waiting").order_by("ticket")[:1]),
+        ("outstanding_fines", ledger.outstanding().order_by("-balance", "pk")[:page]),
+        ("student_fine_statement",
+         FineEntry.objects.filter(student_id=student.pk).order_by("-id")[:ledger.STATEMENT_LENGTH]),
+        ("projection_next_events",
+         CirculationEvent.objects.filter(pk__gt=0).order_by("pk")[:projections.BATCH_SIZE]),
+        ("issue_events", CirculationEvent.objects.filter(issue_id=issue.pk).order_by("id")),
+        ("holds_past_pickup",
+         Hold.objects.filter(status="ready", expires_at__lt=timezone.now()).order_by("expires_at")),
+        ("daily_stats_range",
+         CirculationDailyStat.objects.filter(date__gte=today - timedelta(days=30), date__lte=today)),
+        ("catalogue_search", search.postgres_queryset(book.title.split()[0])[:20]),
+        ("student_autocomplete",
+         search.student_queryset((student.last_name or student.username)[:3])[:search.STUDENT_LIMIT]),
+    ]
+
+
+def plan_nodes(plan):
+    """Yield every node of a FORMAT JSON plan tree."""
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from plan_nodes(child)
+
+
+def seq_scans(plan, tables=HOT_TABLES):
+    """Names of hot tables read with a sequential scan somewhere in `plan`."""
+    return sorted({
+        node["Relation Name"]
+        for node in plan_nodes(plan)
+        if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") in tables
+    })
+
+
+def explain(queryset):
+    """EXPLAIN (ANALYZE, FORMAT JSON) of `queryset`: the top-level result object."""
+    result = queryset.explain(format="json", analyze=True)
+    return (json.loads(result) if isinstance(result, str) else result)[0]
+
+
+def check_plans(queries, discourage_seqscan=True):
+    """
+    Explain each (name, queryset) and return [(name, seq-scanned tables,
+    execution ms, node types)]. With `discourage_seqscan` the planner is told
+    to avoid sequential scans (enable_seqscan = off), so a small seeded
+    database gives the same answer as production: if a query still scans
+    the table, no index can serve it.
+    """
+    if connection.vendor != "postgresql":
+        raise NotImplementedError("Query plan checks need PostgreSQL.")
+    results = []
+    with transaction.atomic():
+        if discourage_seqscan:
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        for name, queryset in queries:
+            explained = explain(queryset)
+            nodes = [node["Node Type"] for node in plan_nodes(explained["Plan"])]
+            results.append(
+                (name, seq_scans(explained["Plan"]), explained.get("Execution Time"), nodes)
+            )
+        # Nothing above writes, but never keep the session setting around.
+        transaction.set_rollback(True)
+    return results
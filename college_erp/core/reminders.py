@@ -0,0 +1,129 @@
+# college_erp/core/reminders.py
+"""
+Overdue and due-soon reminder emails, one digest per student.
+
+One query streams every open issue due within REMINDER_DAYS_AHEAD days
+(overdue ones included), using the partial due_date index on open issues.
+Rows come back ordered by student and are grouped as they arrive. Each
+student gets a single digest rendered from emails/reminder_digest.txt.
+Messages go out in batches over one connection of the configured email
+backend (see EMAIL_DELIVERY in config/settings.py), so SMTP logs in once
+per run instead of once per message.
+"""
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .fines import NO_FINE, fine_for
+from .models import BookIssue
+
+DEFAULT_DAYS_AHEAD = 3
+BATCH_SIZE = 500
+CHUNK_SIZE = 2000
+TEMPLATE = "emails/reminder_digest.txt"
+
+_FIELDS = (
+    "student_id", "student__email", "student__first_name", "student__username",
+    "book__title", "book__author", "due_date",
+)
+
+
+def days_ahead():
+    return getattr(settings, "REMINDER_DAYS_AHEAD", DEFAULT_DAYS_AHEAD)
+
+
+def reminder_queryset(today, days=None):
+    """
+    Open issues of active students with an email address that are overdue
+    or due within `days` days, ordered by student then due date.
+    """
+    horizon = today + timedelta(days=days_ahead() if days is None else days)
+    return (
+        BookIssue.objects.filter(
+            action__in=BookIssue.OPEN_ACTIONS,
+            due_date__lte=horizon,
+            student__is_active=True,
+        )
+        .exclude(student__email="")
+        .order_by("student_id", "due_date", "id")
+        .values_list(*_FIELDS)
+    )
+
+
+def reminder_rows(today, days=None):
+    """reminder_queryset() streamed in chunks (a server-side cursor on PostgreSQL)."""
+    return reminder_queryset(today, days).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _days(n):
+    return f"{n} day" if n == 1 else f"{n} days"
+
+
+def build_digests(rows, today):
+    """Yield (email, context) per student from rows ordered by student."""
+    for _, group in groupby(rows, key=itemgetter(0)):
+        overdue, due_soon = [], []
+        total_fine = NO_FINE
+        for _, email, first_name, username, title, author, due_date in group:
+            # Values are formatted here: localising them in the template
+            # costs more than the rest of the pipeline together.
+            loan = {"book": f"{title} by {author}" if author else title, "due": due_date.isoformat()}
+            if due_date < today:
+                fine = fine_for(due_date, today)
+                total_fine += fine
+                loan["when"] = _days((today - due_date).days) + " late"
+                loan["fine"] = f"{fine:.2f}"
+                overdue.append(loan)
+            else:
+                days = (due_date - today).days
+                loan["when"] = f"in {_days(days)}" if days else "today"
+                due_soon.append(loan)
+        yield email, {
+            "name": first_name or username,
+            "overdue": overdue,
+            "due_soon": due_soon,
+            "total_fine": f"{total_fine:.2f}",
+        }
+
+
+def subject(context):
+    parts = []
+    if context["overdue"]:
+        parts.append(f"{len(context['overdue'])} overdue")
+    if context["due_soon"]:
+        parts.append(f"{len(context['due_soon'])} due soon")
+    return f"Library reminder: {', '.join(parts)}"
+
+
+def send_reminders(today=None, days=None, batch_size=BATCH_SIZE, connection=None):
+    """
+    Send one digest to every student with overdue or due-soon loans.
+    Returns counts: students, loans, messages sent and batches.
+    """
+    today = today or timezone.localdate()
+    template = get_template(TEMPLATE)
+    stats = {"students": 0, "loans": 0, "sent": 0, "batches": 0}
+    connection = connection or get_connection()
+    batch = []
+
+    def flush():
+        stats["sent"] += connection.send_messages(batch) or 0
+        stats["batches"] += 1
+        batch.clear()
+
+    # Opened once for the whole run; send_messages reuses it.
+    with connection:
+        for email, context in build_digests(reminder_rows(today, days), today):
+            stats["students"] += 1
+            stats["loans"] += len(context["overdue"]) + len(context["due_soon"])
+            batch.append(EmailMessage(subject(context), template.render(context), to=[email]))
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    return stats
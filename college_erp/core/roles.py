@@ -0,0 +1,76 @@
+# college_erp/core/roles.py
+"""
+Role registry.
+
+One entry per role in `User.ROLE_CHOICES`, with the dashboard a user of
+that role lands on and the permissions the role grants. Views dispatch
+through this table instead of if/elif chains over role strings, so adding a
+role means adding it to the choices and here (a role missing from
+DASHBOARDS fails at import time rather than at login).
+"""
+from .models import User
+
+DASHBOARDS = {
+    "student": "core:student_dashboard",
+    "teacher": "core:teacher_dashboard",
+    "admin": "core:admin_dashboard",
+    "clerk": "core:clerk_dashboard",
+    "librarian": "core:librarian_dashboard",
+}
+
+PERMISSIONS = {
+    "student": {"search_catalogue", "view_own_loans", "place_holds"},
+    "teacher": {"search_catalogue"},
+    "admin": set(),
+    "clerk": set(),
+    "librarian": {
+        "search_catalogue",
+        "issue_books",
+        "place_holds",
+        "manage_catalogue",
+        "view_circulation",
+        "view_analytics",
+    },
+}
+
+
+class Role:
+    __slots__ = ("name", "label", "dashboard", "permissions")
+
+    def __init__(self, name, label, dashboard, permissions):
+        self.name = name
+        self.label = label
+        self.dashboard = dashboard
+        self.permissions = frozenset(permissions)
+
+    def __repr__(self):
+        return f"<Role {self.name}>"
+
+
+ROLES = {
+    name: Role(name, label, DASHBOARDS[name], PERMISSIONS.get(name, ()))
+    for name, label in User.ROLE_CHOICES
+}
+
+
+def role_of(user):
+    """The Role of an authenticated user, or None."""
+    if not getattr(user, "is_authenticated", False):
+        return None
+    return ROLES.get(getattr(user, "role", None))
+
+
+def has_role(user, name):
+    role = role_of(user)
+    return role is not None and role.name == name
+
+
+def has_permission(user, permission):
+    role = role_of(user)
+    return role is not None and permission in role.permissions
+
+
+def dashboard_for(user, default="core:home"):
+    """URL name of the user's dashboard."""
+    role = role_of(user)
+    return role.dashboard if role else default
@@ -0,0 +1,164 @@
+# college_erp/core/rollups.py
+"""
+Daily circulation rollup (CirculationDailyStat).
+
+The daily_stats projection (core.projections) bumps one row per (day,
+book) as issue and return events reach it, so dashboards can sum a few
+thousand rollup rows instead of scanning the whole BookIssue history.
+`rebuild` recomputes the table from BookIssue instead (see the
+`rebuild_circulation_stats` command); replaying the projection rebuilds it
+from the circulation log.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+from django.utils import timezone
+
+from .fines import NO_FINE
+from .models import BookIssue, CirculationDailyStat, CirculationEvent
+
+REBUILD_CHUNK_DAYS = 31
+REBUILD_BATCH_SIZE = 1000
+
+
+def record_many(day, deltas_by_book):
+    """
+    Add deltas to the (day, book) rows of several books: {book_id: {"issues":
+    n, "returns": n, "overdue": n, "fines": amount}}. Missing rows are
+    created with one INSERT, then each book gets one UPDATE. Call inside the
+    transaction making the change.
+    """
+    if not deltas_by_book:
+        return
+    CirculationDailyStat.objects.bulk_create(
+        [CirculationDailyStat(date=day, book_id=book_id) for book_id in deltas_by_book],
+        ignore_conflicts=True,
+    )
+    for book_id, deltas in deltas_by_book.items():
+        changes = {field: F(field) + value for field, value in deltas.items() if value}
+        if changes:
+            CirculationDailyStat.objects.filter(date=day, book_id=book_id).update(**changes)
+
+
+def _aware(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _compute(start, end):
+    """Rollup rows for days in [start, end), built from BookIssue."""
+    stats = {}
+
+    def row(day, book_id):
+        key = (day, book_id)
+        if key not in stats:
+            stats[key] = CirculationDailyStat(date=day, book_id=book_id)
+        return stats[key]
+
+    issued = (
+        BookIssue.objects.filter(issued_at__gte=_aware(start), issued_at__lt=_aware(end))
+        .annotate(day=TruncDate("issued_at"))
+        .values("day", "book_id")
+        .annotate(n=Count("id"))
+        .order_by()
+    )
+    for item in issued:
+        row(item["day"], item["book_id"]).issues = item["n"]
+
+    returned = (
+        BookIssue.objects.filter(
+            action="returned", returned_at__gte=_aware(start), returned_at__lt=_aware(end)
+        )
+        .annotate(day=TruncDate("returned_at"))
+        .values("day", "book_id")
+        .annotate(
+            n=Count("id"),
+            late=Count("id", filter=Q(due_date__lt=F("day"))),
+            fined=Coalesce(Sum("fine_amount"), NO_FINE),
+        )
+        .order_by()
+    )
+    for item in returned:
+        stat = row(item["day"], item["book_id"])
+        stat.returns = item["n"]
+        stat.overdue = item["late"]
+        stat.fines = item["fined"]
+    return list(stats.values())
+
+
+def rebuild(since=None, until=None):
+    """
+    Recompute rollup rows for days in [since, until] from BookIssue, one
+    month-sized chunk per transaction. Returns the number of rows written.
+
+    The daily_stats projection is then marked as up to date with the log as
+    it stood when the rebuild began, so events already counted here are not
+    applied again. Run it while circulation is quiet.
+    """
+    from . import projections
+
+    logged = CirculationEvent.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+    until = until or timezone.localdate()
+    if since is None:
+        first = BookIssue.objects.order_by("issued_at").values_list("issued_at", flat=True).first()
+        if first is None:
+            CirculationDailyStat.objects.filter(date__lte=until).delete()
+            projections.skip_to(projections.DailyStats.name, logged)
+            return 0
+        since = timezone.localdate(first)
+
+    written = 0
+    start = since
+    while start <= until:
+        end = min(start + timedelta(days=REBUILD_CHUNK_DAYS), until + timedelta(days=1))
+        with transaction.atomic():
+            CirculationDailyStat.objects.filter(date__gte=start, date__lt=end).delete()
+            rows = _compute(start, end)
+            CirculationDailyStat.objects.bulk_create(rows, batch_size=REBUILD_BATCH_SIZE)
+        written += len(rows)
+        start = end
+    projections.skip_to(projections.DailyStats.name, logged)
+    return written
+
+
+def totals(start=None, end=None):
+    """Summed counters over an optional inclusive date range."""
+    rows = CirculationDailyStat.objects.all()
+    if start:
+        rows = rows.filter(date__gte=start)
+    if end:
+        rows = rows.filter(date__lte=end)
+    return rows.aggregate(
+        issues=Coalesce(Sum("issues"), 0),
+        returns=Coalesce(Sum("returns"), 0),
+        overdue=Coalesce(Sum("overdue"), 0),
+        fines=Coalesce(Sum("fines"), NO_FINE),
+    )
+
+
+def trend(start, end, book_id=None, period="day"):
+    """
+    Counters per day (or per month with period="month") between start and end
+    inclusive, optionally for one book. Days without activity are omitted.
+    """
+    return list(trend_queryset(start, end, book_id, period))
+
+
+def trend_queryset(start, end, book_id=None, period="day"):
+    """The unevaluated query behind trend(), for async callers."""
+    rows = CirculationDailyStat.objects.filter(date__gte=start, date__lte=end)
+    if book_id:
+        rows = rows.filter(book_id=book_id)
+    bucket = TruncMonth("date") if period == "month" else F("date")
+    return (
+        rows.annotate(period=bucket)
+        .values("period")
+        .annotate(
+            issues=Sum("issues"),
+            returns=Sum("returns"),
+            overdue=Sum("overdue"),
+            fines=Sum("fines"),
+        )
+        .order_by("period")
+    )
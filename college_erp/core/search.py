@@ -0,0 +1,223 @@
+# college_erp/core/search.py
+"""
+Catalogue search over Book.
+
+On PostgreSQL the query runs against `Book.search_vector` (kept current by a
+trigger, GIN-indexed) for ranked full-text matches, OR-ed with pg_trgm
+similarity on title and author (also GIN-indexed) so misspelt words still
+find the book. Every branch of the WHERE clause can use an index, so the
+planner answers with bitmap index scans rather than reading the table.
+
+SQLite has neither, so tests and local runs use a small in-process inverted
+index with the same weighting and trigram matching. It is rebuilt whenever
+the library cache version or the number of books changes.
+
+`search_students` backs the student picker on the issue form: a bounded
+prefix search that never loads the whole student list.
+"""
+import re
+import threading
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Count, F, Max, Q
+from django.db.models.functions import Greatest
+
+from . import caching
+from .models import Book, User
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+# Same default as pg_trgm.similarity_threshold.
+MIN_SIMILARITY = 0.3
+# Field weights matching setweight() A/B/C in migration 0008.
+FIELD_WEIGHTS = {"title": 1.0, "isbn": 1.0, "author": 0.4, "publisher": 0.2}
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def clamp_limit(value):
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_LIMIT
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def search_books(query, limit=DEFAULT_LIMIT):
+    """Books matching `query`, best first, each annotated with a `rank`."""
+    query = (query or "").strip()
+    if not query:
+        return []
+    if connection.vendor == "postgresql":
+        return _search_postgres(query, limit)
+    return _memory_index().search(query, limit)
+
+
+def postgres_queryset(query):
+    """The ranked PostgreSQL search as an unevaluated queryset."""
+    from django.contrib.postgres.search import (
+        SearchQuery,
+        SearchRank,
+        TrigramSimilarity,
+    )
+
+    ts_query = SearchQuery(query, search_type="websearch", config="english")
+    similarity = Greatest(TrigramSimilarity("title", query), TrigramSimilarity("author", query))
+    return (
+        Book.objects.annotate(rank=SearchRank(F("search_vector"), ts_query) + similarity)
+        .filter(
+            Q(search_vector=ts_query)
+            | Q(title__trigram_similar=query)
+            | Q(author__trigram_similar=query)
+            | Q(isbn=query)
+        )
+        .order_by("-rank", "title")
+    )
+
+
+def _search_postgres(query, limit):
+    return list(postgres_queryset(query)[:limit])
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def trigrams(word):
+    """pg_trgm style trigrams: the word padded with two spaces before, one after."""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    ta, tb = trigrams(a), trigrams(b)
+    return len(ta & tb) / len(ta | tb)
+
+
+class InvertedIndex:
+    """Token -> {book_id: weight} postings plus a trigram index of the vocabulary."""
+
+    def __init__(self, books=()):
+        self.postings = defaultdict(dict)
+        self.vocabulary = defaultdict(set)
+        for book in books:
+            self.add(book)
+
+    def add(self, book):
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(getattr(book, field)):
+                postings = self.postings[token]
+                postings[book.pk] = max(postings.get(book.pk, 0), weight)
+                for gram in trigrams(token):
+                    self.vocabulary[gram].add(token)
+
+    def _matches(self, token):
+        """(indexed token, score factor) pairs: exact, prefix, then fuzzy."""
+        if token in self.postings:
+            yield token, 1.0
+        candidates = set()
+        for gram in trigrams(token):
+            candidates |= self.vocabulary.get(gram, set())
+        candidates.discard(token)
+        for candidate in candidates:
+            if candidate.startswith(token):
+                yield candidate, 0.8
+                continue
+            score = similarity(token, candidate)
+            if score >= MIN_SIMILARITY:
+                yield candidate, score
+
+    def rank(self, query):
+        """{book_id: score}; every query word must match something in the book."""
+        scores = None
+        for token in set(tokenize(query)):
+            token_scores = defaultdict(float)
+            for match, factor in self._matches(token):
+                for book_id, weight in self.postings[match].items():
+                    token_scores[book_id] = max(token_scores[book_id], weight * factor)
+            if scores is None:
+                scores = dict(token_scores)
+            else:
+                scores = {
+                    book_id: score + token_scores[book_id]
+                    for book_id, score in scores.items()
+                    if book_id in token_scores
+                }
+            if not scores:
+                return {}
+        return scores or {}
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        scores = self.rank(query)
+        best = sorted(scores, key=lambda book_id: -scores[book_id])[: limit * 2]
+        books = Book.objects.in_bulk(best)
+        results = []
+        for book_id in best:
+            book = books.get(book_id)
+            if book is not None:
+                book.rank = scores[book_id]
+                results.append(book)
+        results.sort(key=lambda book: (-book.rank, book.title))
+        return results[:limit]
+
+
+_index_lock = threading.Lock()
+_index = {"version": None, "index": None}
+
+
+def _memory_index():
+    # The row count and highest id catch books added outside a committed
+    # transaction (tests) or without a version bump (admin).
+    fingerprint = Book.objects.aggregate(count=Count("id"), last=Max("id"))
+    version = (caching.library_version(), fingerprint["count"], fingerprint["last"])
+    with _index_lock:
+        if _index["version"] != version:
+            books = Book.objects.only(*FIELD_WEIGHTS).order_by().iterator()
+            _index["index"] = InvertedIndex(books)
+            _index["version"] = version
+        return _index["index"]
+
+
+def clear_index():
+    """Drop the in-process index so the next search rebuilds it."""
+    with _index_lock:
+        _index.update(version=None, index=None)
+
+
+# ---------------------------
+# Student picker
+# ---------------------------
+STUDENT_FIELDS = ("username", "email", "first_name", "last_name")
+STUDENT_LIMIT = 10
+MAX_STUDENT_LIMIT = 50
+# Shorter queries match too much of the table to be worth sending.
+MIN_STUDENT_QUERY = 2
+MAX_STUDENT_WORDS = 4
+
+
+def student_queryset(query):
+    """
+    Active students with every word of `query` as a case-insensitive prefix
+    of their username, email, first or last name (each word may match a
+    different field), in name order.
+
+    On PostgreSQL `istartswith` becomes `UPPER(col) LIKE 'X%'`, which the
+    partial trigram indexes from migration 0012 serve, so the cost depends
+    on the number of matches rather than on enrollment.
+    """
+    queryset = User.objects.filter(role="student", is_active=True)
+    for word in query.split()[:MAX_STUDENT_WORDS]:
+        matches = Q()
+        for field in STUDENT_FIELDS:
+            matches |= Q(**{f"{field}__istartswith": word})
+        queryset = queryset.filter(matches)
+    return queryset.only("id", *STUDENT_FIELDS).order_by("first_name", "last_name", "username")
+
+
+def search_students(query, limit=STUDENT_LIMIT):
+    """Up to `limit` students for the issue form's autocomplete."""
+    query = (query or "").strip()
+    if len(query) < MIN_STUDENT_QUERY:
+        return []
+    return list(student_queryset(query)[:limit])
@@ -0,0 +1,227 @@
+# college_erp/core/seeding.py
+"""
+Deterministic synthetic data for benchmarks and local testing.
+
+The same seed always produces the same users, books and issues. The
+distributions are close to a real college library: mostly students, a few
+staff, book popularity following a long tail (Zipf), a year of circulation
+with most loans returned, some of them late, and a small set of open and
+overdue loans. Rows go in with bulk_create in batches, fines on returned
+loans are charged to the fine ledger, their history goes into the
+circulation log, and the read models catch up with it at the end.
+"""
+import random
+from datetime import datetime, time, timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import caching, copies, events, ledger, projections
+from .circulation import DEFAULT_LOAN_DAYS
+from .fines import NO_FINE, fine_for
+from .models import Book, BookCopy, BookIssue, User
+
+SEED_DOMAIN = "seed.example"
+# 979-0 is the ISMN (printed music) prefix, so no catalogue ISBN collides
+# with seeded ones and `flush` can find them again.
+SEED_ISBN_PREFIX = "9790"
+SEED_PASSWORD = "seed-password"
+DEFAULT_BATCH_SIZE = 1000
+HISTORY_DAYS = 365
+
+ROLE_WEIGHTS = {"student": 0.90, "teacher": 0.06, "clerk": 0.02, "librarian": 0.01, "admin": 0.01}
+# Share of issue records that are still out, and how many of those are late.
+OPEN_SHARE = 0.12
+LATE_RETURN_SHARE = 0.15
+
+FIRST_NAMES = [
+    "Aarav", "Aditi", "Ananya", "Arjun", "Diya", "Ishaan", "Kavya", "Meera",
+    "Neha", "Nikhil", "Priya", "Rahul", "Riya", "Rohan", "Sanjana", "Vikram",
+]
+LAST_NAMES = [
+    "Bhat", "Desai", "Dhekane", "Gupta", "Iyer", "Joshi", "Kulkarni", "Mehta",
+    "Nair", "Patil", "Rao", "Reddy", "Shah", "Sharma", "Singh", "Verma",
+]
+TITLE_WORDS = [
+    "Advanced", "Algorithms", "Analysis", "Applied", "Calculus", "Chemistry",
+    "Circuits", "Data", "Design", "Economics", "Engineering", "Fluid", "History",
+    "Introduction", "Linear", "Machine", "Mechanics", "Modern", "Networks",
+    "Organic", "Physics", "Principles", "Signals", "Statistics", "Structures",
+    "Systems", "Theory", "Thermodynamics",
+]
+PUBLISHERS = [
+    "Pearson", "McGraw Hill", "Wiley", "Oxford University Press",
+    "Cambridge University Press", "Springer", "Tata McGraw Hill", "PHI Learning",
+]
+
+
+def _isbn(n):
+    """A valid ISBN-13 in the seed range."""
+    digits = f"{SEED_ISBN_PREFIX}{n:08d}"
+    check = (10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10) % 10
+    return f"{digits}{check}"
+
+
+def _role_counts(total):
+    """Users per role; at least one of every role when there is room."""
+    counts = {role: int(total * weight) for role, weight in ROLE_WEIGHTS.items()}
+    for role in ROLE_WEIGHTS:
+        if counts[role] == 0 and total > len(ROLE_WEIGHTS):
+            counts[role] = 1
+    counts["student"] = total - sum(count for role, count in counts.items() if role != "student")
+    return counts
+
+
+def _make_users(rng, total, password):
+    users = []
+    for role, count in _role_counts(total).items():
+        for n in range(1, count + 1):
+            email = f"{role}{n:06d}@{SEED_DOMAIN}"
+            users.append(User(
+                username=email,
+                email=email,
+                password=password,
+                first_name=rng.choice(FIRST_NAMES),
+                last_name=rng.choice(LAST_NAMES),
+                role=role,
+                is_staff=role == "admin",
+            ))
+    return users
+
+
+def _make_books(rng, total):
+    books = []
+    for n in range(1, total + 1):
+        copies = rng.choices([1, 2, 3, 5, 10], weights=[30, 30, 20, 15, 5])[0]
+        books.append(Book(
+            title=" ".join(rng.sample(TITLE_WORDS, rng.randint(2, 4))) + f" {n}",
+            author=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            isbn=_isbn(n),
+            publisher=rng.choice(PUBLISHERS),
+            year_published=rng.randint(1980, 2025),
+            copies_total=copies,
+            copies_available=copies,
+        ))
+    return books
+
+
+def _make_issues(rng, total, books, students, today):
+    """
+    Issue records over the last HISTORY_DAYS days. A copy only stays out if
+    the book has one left and the student does not already hold it, so the
+    result satisfies the circulation invariants.
+    """
+    # Zipf-like popularity: the n-th most popular book is borrowed ~1/n as often.
+    cumulative = list(accumulate(1 / (rank + 1) ** 1.1 for rank in range(len(books))))
+    now = timezone.now()
+    out = {book.pk: 0 for book in books}
+    held = set()
+    issues = []
+    for _ in range(total):
+        book = rng.choices(books, cum_weights=cumulative)[0]
+        student = rng.choice(students)
+        issued_on = today - timedelta(days=int(rng.triangular(0, HISTORY_DAYS, 0)))
+        issued_at = timezone.make_aware(
+            datetime.combine(issued_on, time(rng.randint(8, 18), rng.randint(0, 59)))
+        )
+        if issued_at > now:
+            issued_at = now
+        due_date = issued_on + timedelta(days=DEFAULT_LOAN_DAYS)
+        issue = BookIssue(book=book, student=student, issued_at=issued_at, due_date=due_date)
+
+        key = (book.pk, student.pk)
+        stays_out = (
+            rng.random() < OPEN_SHARE
+            and out[book.pk] < book.copies_total
+            and key not in held
+        )
+        if stays_out:
+            out[book.pk] += 1
+            held.add(key)
+            issue.action = "overdue" if due_date < today else "issued"
+            issue.fine_amount = fine_for(due_date, today)
+        else:
+            late = rng.random() < LATE_RETURN_SHARE
+            if late:
+                days_out = rng.randint(DEFAULT_LOAN_DAYS + 1, DEFAULT_LOAN_DAYS + 40)
+            else:
+                days_out = rng.randint(1, DEFAULT_LOAN_DAYS)
+            returned_on = min(issued_on + timedelta(days=days_out), today)
+            issue.action = "returned"
+            returned_at = timezone.make_aware(datetime.combine(returned_on, time(rng.randint(8, 18))))
+            issue.returned_at = min(max(returned_at, issued_at), now)
+            issue.fine_amount = fine_for(due_date, returned_on) if late else NO_FINE
+        issues.append(issue)
+
+    for book in books:
+        book.copies_available = book.copies_total - out[book.pk]
+    return issues
+
+
+def _lend_copies(issues, batch_size):
+    """Give every open issue a copy of its book and mark those copies on loan."""
+    shelves = {}
+    for copy_id, book_id in (
+        BookCopy.objects.filter(book__isbn__startswith=SEED_ISBN_PREFIX)
+        .order_by("book_id", "-id").values_list("id", "book_id")
+    ):
+        shelves.setdefault(book_id, []).append(copy_id)
+    lent = []
+    for issue in issues:
+        if issue.action in BookIssue.OPEN_ACTIONS:
+            issue.copy_id = shelves[issue.book_id].pop()
+            lent.append(issue.copy_id)
+    for start in range(0, len(lent), batch_size):
+        BookCopy.objects.filter(pk__in=lent[start:start + batch_size]).update(status="on_loan")
+
+
+def flush():
+    """Delete previously seeded users and books (and their issues)."""
+    with transaction.atomic():
+        books, _ = Book.objects.filter(isbn__startswith=SEED_ISBN_PREFIX).delete()
+        users, _ = User.objects.filter(email__endswith=f"@{SEED_DOMAIN}").delete()
+        caching.bump_library_version()
+    return books + users
+
+
+def seed(users=1000, books=500, issues=5000, seed=42, batch_size=DEFAULT_BATCH_SIZE, today=None):
+    """
+    Create `users`, `books` and `issues` rows from `seed`. Returns the number
+    of rows created per model.
+    """
+    rng = random.Random(seed)
+    today = today or timezone.localdate()
+    # One hash for everybody: hashing per user would dominate the run.
+    password = make_password(SEED_PASSWORD)
+
+    with transaction.atomic():
+        new_users = User.objects.bulk_create(_make_users(rng, users, password), batch_size=batch_size)
+        Book.objects.bulk_create(_make_books(rng, books), batch_size=batch_size)
+        # Re-read to get primary keys on every backend.
+        seeded_books = list(Book.objects.filter(isbn__startswith=SEED_ISBN_PREFIX).order_by("isbn"))
+        copies.create_copies(
+            {book.pk: book.copies_total for book in seeded_books}, new_books=True, batch_size=batch_size
+        )
+        students = list(User.objects.filter(role="student", email__endswith=f"@{SEED_DOMAIN}").order_by("username"))
+        records = []
+        if seeded_books and students:
+            records = _make_issues(rng, issues, seeded_books, students, today)
+            _lend_copies(records, batch_size)
+            BookIssue.objects.bulk_create(records, batch_size=batch_size)
+            Book.objects.bulk_update(seeded_books, ["copies_available"], batch_size=batch_size)
+            # Re-read for primary keys, in return order for the running balances.
+            ledger.charge_returns(
+                BookIssue.objects.filter(
+                    book__in=seeded_books, action="returned", fine_amount__gt=0
+                ).order_by("returned_at", "pk").only("student_id", "fine_amount")
+            )
+            events.record(
+                events.from_issues(BookIssue.objects.filter(book__in=seeded_books).order_by("issued_at", "pk")),
+                batch_size=batch_size,
+            )
+        caching.bump_library_version()
+    if records:
+        projections.catch_up(batch_size=batch_size)
+    return {"users": len(new_users), "books": len(seeded_books), "issues": len(records)}
@@ -0,0 +1,163 @@
+# college_erp/core/session_user.py
+"""
+Signed-in user from the session instead of the user table.
+
+Django's AuthenticationMiddleware loads the whole User row on every request
+and checks the session hash against the password. SessionUserMiddleware
+does that full check once (at login, or on the first request after it),
+keeps a small projection of the user (id, role, names, flags) in the
+session itself and rebuilds `request.user` from it on later requests. Nothing here depends on the session engine: with
+`db` sessions a page costs the session read and no user query, with
+`cache`/`cached_db` sessions it usually costs no query at all.
+
+`request.user` is still a real User instance. Fields outside the projection
+are deferred, so reading one (say `last_login`) loads the row as usual.
+
+The copy is trusted only while:
+- it belongs to the session's user id, backend and auth hash
+- it was checked against the user row less than SESSION_USER_TTL seconds
+  ago. The check time is kept as a cache entry per session, not in the
+  session, so a check that finds the user unchanged does not rewrite the
+  session.
+- the user's cache version is unchanged. Every save of a User bumps that
+  version.
+
+With a shared cache (Redis), the version bump reaches every worker. A
+password change, role change or deactivation then takes effect on the
+next request of every session. With per-process local memory, only the
+worker that saved the user sees the bump. Other workers notice the change
+once their copy's TTL runs out, so the TTL is capped at LOCAL_CACHE_TTL
+seconds there.
+
+Changes made with `QuerySet.update()` send no signal and show up within
+the TTL.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.signals import user_logged_in
+from django.core.cache import cache
+from django.db import router
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.functional import SimpleLazyObject
+
+from . import caching
+from .models import User
+
+SESSION_USER_KEY = "_erp_user"
+# When a session's copy was last checked against the user row.
+CHECKED_KEY = "erp:session:{}:user-checked"
+DEFAULT_TTL = 300
+# Ceiling on the TTL when the cache is not shared between workers.
+LOCAL_CACHE_TTL = 5
+PROJECTION_FIELDS = (
+    "id", "username", "email", "first_name", "last_name", "role",
+    "is_active", "is_staff", "is_superuser",
+)
+
+
+def ttl():
+    configured = getattr(settings, "SESSION_USER_TTL", DEFAULT_TTL)
+    return configured if caching.is_shared() else min(configured, LOCAL_CACHE_TTL)
+
+
+def project(user, session):
+    """Session-storable copy of `user`, bound to this session's login."""
+    data = {field: getattr(user, field) for field in PROJECTION_FIELDS}
+    data.update(
+        backend=session.get(auth.BACKEND_SESSION_KEY),
+        hash=session.get(auth.HASH_SESSION_KEY),
+        version=caching.user_version(user.pk),
+    )
+    return data
+
+
+def store(user, session):
+    """Keep a checked copy of `user` in the session, writing it only if it changed."""
+    data = project(user, session)
+    if session.get(SESSION_USER_KEY) != data:
+        session[SESSION_USER_KEY] = data
+    if session.session_key:
+        cache.set(CHECKED_KEY.format(session.session_key), time.time(), timeout=ttl())
+
+
+def is_fresh(data, session):
+    if not (
+        session.session_key
+        and str(data.get("id")) == str(session.get(auth.SESSION_KEY))
+        and data.get("backend") == session.get(auth.BACKEND_SESSION_KEY)
+        and data.get("hash") == session.get(auth.HASH_SESSION_KEY)
+    ):
+        return False
+    # One cache round trip for the check time and the user's version.
+    checked_key = CHECKED_KEY.format(session.session_key)
+    version_key = caching.USER_VERSION_KEY.format(data["id"])
+    found = cache.get_many([checked_key, version_key])
+    return (
+        time.time() - found.get(checked_key, 0) < ttl()
+        and data.get("version") == found.get(version_key, 0)
+    )
+
+
+def from_projection(data):
+    """A User with the projected fields loaded and every other field deferred."""
+    names = [f.attname for f in User._meta.concrete_fields if f.attname in PROJECTION_FIELDS]
+    user = User.from_db(router.db_for_read(User), names, [data[name] for name in names])
+    user.backend = data["backend"]
+    return user
+
+
+def get_user(request):
+    session = request.session
+    if session.get(auth.SESSION_KEY) is None:
+        return AnonymousUser()
+    data = session.get(SESSION_USER_KEY)
+    if data and is_fresh(data, session):
+        return from_projection(data)
+    # Full check: loads the row and verifies the session hash.
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        store(user, session)
+    return user
+
+
+def _cached_user(request):
+    if not hasattr(request, "_cached_user"):
+        request._cached_user = get_user(request)
+    return request._cached_user
+
+
+async def _acached_user(request):
+    # Once awaited, `request.user` resolves without touching the session
+    # again, so async views can render templates that read it.
+    if not hasattr(request, "_cached_user"):
+        request._cached_user = await sync_to_async(get_user)(request)
+    return request._cached_user
+
+
+class SessionUserMiddleware(AuthenticationMiddleware):
+    """Drop-in replacement for AuthenticationMiddleware; see the module docstring."""
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: _cached_user(request))
+        request.auser = lambda: _acached_user(request)
+
+
+@receiver(user_logged_in)
+def _store_on_login(sender, request, user, **kwargs):
+    # Saves the first request after login from a full check and session write.
+    session = getattr(request, "session", None)
+    if session is not None and isinstance(user, User):
+        store(user, session)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def _user_changed(sender, instance, **kwargs):
+    caching.bump_user_version(instance.pk)
@@ -0,0 +1,76 @@
+# college_erp/core/student_summary.py
+"""
+One student's library summary, shown on the student dashboard and My Books.
+
+The student's StudentCirculationStat row, kept by the student_stats
+projection (core.projections), gives the counts of current loans and of
+books borrowed with one primary-key lookup. One query on the (student,
+action) index then reads the current loans plus the latest returns with
+their books joined, and the due-soon and overdue counts are taken from
+those loans against today's date. Fines owed are the student's ledger balance (core.ledger, one row) plus
+the fines still accruing on overdue loans, added in Python with
+core.fines.fine_for so the total does not wait for the nightly sweep.
+
+The result is cached per student (caching.cached_for_student). Issuing,
+returning and the projection catching up bump that student's version, so
+the summary is never stale and other students' cached summaries are left
+alone.
+"""
+from datetime import timedelta
+
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from . import caching, ledger
+from .fines import NO_FINE, fine_for
+from .models import BookIssue, StudentCirculationStat
+from .reminders import days_ahead
+
+RECENT_RETURNS = 10
+
+_OPEN = Q(action__in=BookIssue.OPEN_ACTIONS)
+
+
+def loan_queryset(student_id):
+    """The student's issues with books joined: open ones first, then newest first."""
+    return (
+        BookIssue.objects.filter(student_id=student_id)
+        .select_related("book")
+        .annotate(closed=Case(When(_OPEN, then=Value(0)), default=Value(1), output_field=IntegerField()))
+        .order_by("closed", "-issued_at", "-id")
+    )
+
+
+def compute_summary(student_id, today=None):
+    """Build the summary dict from the database (three queries, two if there is no history)."""
+    today = today or timezone.localdate()
+    horizon = today + timedelta(days=days_ahead())
+    stat = StudentCirculationStat.objects.filter(pk=student_id).first() or StudentCirculationStat()
+    summary = {"history": stat.loans, "fine_balance": ledger.balance(student_id)}
+
+    loans, returns = [], []
+    if stat.loans:
+        for issue in loan_queryset(student_id)[: stat.current + RECENT_RETURNS]:
+            if issue.closed:
+                returns.append(issue)
+                continue
+            issue.days_late = max((today - issue.due_date).days, 0) if issue.due_date else 0
+            issue.fine_due = fine_for(issue.due_date, today)
+            loans.append(issue)
+        loans.sort(key=lambda issue: (issue.due_date is None, issue.due_date))
+
+    summary["current"] = len(loans)
+    summary["due_soon"] = sum(1 for issue in loans if issue.due_date and today <= issue.due_date <= horizon)
+    summary["overdue"] = sum(1 for issue in loans if issue.due_date and issue.due_date < today)
+    summary["fines_owed"] = summary["fine_balance"] + sum((issue.fine_due for issue in loans), NO_FINE)
+    summary["loans"] = loans
+    summary["recent_returns"] = returns
+    return summary
+
+
+def student_summary(student_id, today=None):
+    """compute_summary() through the per-student cache."""
+    today = today or timezone.localdate()
+    return caching.cached_for_student(
+        "student_summary", student_id, lambda: compute_summary(student_id, today), today
+    )
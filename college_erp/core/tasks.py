@@ -0,0 +1,347 @@
+# college_erp/core/tasks.py
+"""
+Database-backed background tasks.
+
+A task is a function registered with @task (the library's tasks live in
+core.jobs) and run by `python manage.py run_tasks`. enqueue() only inserts
+a BackgroundTask row, so it is part of the caller's transaction: a request
+that rolls back never leaves a task behind. Nothing is needed beyond the
+database, PostgreSQL or SQLite.
+
+Claiming a row is a SELECT ... FOR UPDATE SKIP LOCKED (PostgreSQL) followed
+by a conditional UPDATE from queued to running. SQLite has no row locks,
+but the conditional UPDATE alone still stops two workers from taking the
+same row.
+
+A failed attempt goes back to the queue with exponential backoff until the
+task's max_attempts is reached. A running row holds a lease that its worker
+renews. When the lease runs out (the worker died), the row is queued again.
+
+TASK_SCHEDULE lists periodic tasks. Each period's run is keyed by its slot,
+so it is enqueued once however many workers are up.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, IntegrityError, OperationalError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 3
+# Seconds before the first retry; doubled after every further failure.
+DEFAULT_RETRY_DELAY = 30
+DEFAULT_LEASE = 300
+DEFAULT_RESULT_DAYS = 7
+POLL_INTERVAL = 1.0
+# Seconds between schedule and expired-lease checks in a worker.
+HOUSEKEEPING_INTERVAL = 30
+RECORD_RETRIES = 5
+
+
+class TaskError(Exception):
+    pass
+
+
+class UnknownTask(TaskError):
+    pass
+
+
+class TaskType:
+    """A registered task function and its retry policy."""
+
+    __slots__ = ("name", "func", "max_attempts", "retry_delay")
+
+    def __init__(self, name, func, max_attempts, retry_delay):
+        self.name = name
+        self.func = func
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def __repr__(self):
+        return f"<TaskType {self.name}>"
+
+
+REGISTRY = {}
+
+
+def task(name, max_attempts=DEFAULT_MAX_ATTEMPTS, retry_delay=DEFAULT_RETRY_DELAY):
+    """Register the decorated function as task `name`; it is called with the task's kwargs."""
+    def decorator(func):
+        REGISTRY[name] = TaskType(name, func, max_attempts, retry_delay)
+        return func
+    return decorator
+
+
+def get_type(name):
+    try:
+        return REGISTRY[name]
+    except KeyError:
+        raise UnknownTask(f"No task named {name!r}.") from None
+
+
+def lease():
+    return getattr(settings, "TASK_LEASE_SECONDS", DEFAULT_LEASE)
+
+
+def enqueue(name, kwargs=None, *, run_at=None, delay=None, key=None):
+    """
+    Queue task `name` with `kwargs` (JSON-serialisable) and return its row.
+
+    `run_at` or `delay` (seconds) postpones it. With a `key`, at most one
+    row exists per key: enqueueing the same key again returns that row.
+    """
+    task_type = get_type(name)
+    if delay is not None:
+        run_at = timezone.now() + timedelta(seconds=delay)
+    fields = {
+        "name": name,
+        "kwargs": kwargs or {},
+        "run_at": run_at or timezone.now(),
+        "max_attempts": task_type.max_attempts,
+    }
+    if key is None:
+        return BackgroundTask.objects.create(**fields)
+    try:
+        with transaction.atomic():
+            return BackgroundTask.objects.create(key=key, **fields)
+    except IntegrityError:
+        return BackgroundTask.objects.get(key=key)
+
+
+def claim(worker, limit=1, now=None):
+    """Mark up to `limit` due tasks as running for `worker` and return them."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        due = (
+            BackgroundTask.objects.filter(status="queued", run_at__lte=now)
+            .order_by("run_at", "id")
+            .select_for_update(skip_locked=True)
+        )
+        ids = list(due.values_list("id", flat=True)[:limit])
+        if not ids:
+            return []
+        BackgroundTask.objects.filter(pk__in=ids, status="queued").update(
+            status="running", locked_by=worker, locked_at=now, attempts=F("attempts") + 1
+        )
+    return list(
+        BackgroundTask.objects.filter(pk__in=ids, status="running", locked_by=worker).order_by("run_at", "id")
+    )
+
+
+def _record(row, **fields):
+    """Save the outcome of a claimed row, unless its lease was lost meanwhile."""
+    outcome = BackgroundTask.objects.filter(pk=row.pk, status="running", locked_by=row.locked_by)
+    # The task has already run: retry a locked database (SQLite) rather
+    # than let the lease expire and run it again.
+    for attempt in range(RECORD_RETRIES):
+        try:
+            updated = outcome.update(locked_by="", locked_at=None, **fields)
+            break
+        except OperationalError:
+            if attempt == RECORD_RETRIES - 1:
+                raise
+            time.sleep(0.1 * (attempt + 1))
+    if not updated:
+        logger.warning("Task %s #%s lost its lease; outcome not recorded.", row.name, row.pk)
+        return
+    for field, value in fields.items():
+        setattr(row, field, value)
+    row.locked_by, row.locked_at = "", None
+
+
+def execute(row):
+    """Run one claimed task and record success, a retry or the failure. Returns the row."""
+    try:
+        task_type = get_type(row.name)
+        result = task_type.func(**row.kwargs)
+        # Stored as the JSON it will be read back as.
+        result = json.loads(json.dumps(result, cls=DjangoJSONEncoder))
+    except Exception as exc:
+        error = traceback.format_exc()
+        now = timezone.now()
+        if row.attempts < row.max_attempts and not isinstance(exc, UnknownTask):
+            delay = task_type.retry_delay * 2 ** (row.attempts - 1)
+            logger.warning("Task %s #%s failed, retrying in %ss: %s", row.name, row.pk, delay, exc)
+            _record(row, status="queued", run_at=now + timedelta(seconds=delay), last_error=error)
+        else:
+            logger.error("Task %s #%s failed: %s", row.name, row.pk, exc)
+            _record(row, status="failed", finished_at=now, last_error=error)
+    else:
+        _record(row, status="succeeded", result=result, finished_at=timezone.now())
+    return row
+
+
+def run_pending(worker="inline", now=None):
+    """Run every due task in this thread until none is left; returns how many ran."""
+    count = 0
+    while True:
+        rows = claim(worker, now=now)
+        if not rows:
+            return count
+        for row in rows:
+            execute(row)
+            count += 1
+
+
+def renew(ids, now=None):
+    """Extend the lease of running tasks `ids`."""
+    return BackgroundTask.objects.filter(pk__in=ids, status="running").update(
+        locked_at=now or timezone.now()
+    )
+
+
+def requeue_expired(now=None):
+    """
+    Queue running tasks whose lease ran out again, or fail them if that was
+    their last attempt. Returns how many rows changed.
+    """
+    now = now or timezone.now()
+    expired = BackgroundTask.objects.filter(status="running", locked_at__lt=now - timedelta(seconds=lease()))
+    lost = {"locked_by": "", "locked_at": None, "last_error": "The worker stopped renewing its lease."}
+    failed = expired.filter(attempts__gte=F("max_attempts")).update(status="failed", finished_at=now, **lost)
+    requeued = expired.update(status="queued", run_at=now, **lost)
+    return failed + requeued
+
+
+def schedule(now=None):
+    """
+    Enqueue the current period of every TASK_SCHEDULE entry, due at the
+    period's start. Returns the rows (new or existing) of those periods.
+    """
+    now = now or timezone.now()
+    rows = []
+    for entry, spec in getattr(settings, "TASK_SCHEDULE", {}).items():
+        every, offset = spec["every"], spec.get("offset", 0)
+        slot = int((now.timestamp() - offset) // every)
+        run_at = datetime.fromtimestamp(slot * every + offset, tz=dt_timezone.utc)
+        rows.append(enqueue(spec["task"], spec.get("kwargs"), run_at=run_at, key=f"schedule:{entry}:{slot}"))
+    return rows
+
+
+def prune(days=None, now=None):
+    """Delete tasks that succeeded over `days` (TASK_RESULT_DAYS) ago; failed ones are kept."""
+    if days is None:
+        days = getattr(settings, "TASK_RESULT_DAYS", DEFAULT_RESULT_DAYS)
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    deleted, _ = BackgroundTask.objects.filter(status="succeeded", finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def _drop_broken_connections():
+    # Unlike close_old_connections(), keeps healthy connections open between
+    # tasks even with CONN_MAX_AGE = 0; a worker is not a request.
+    for conn in connections.all(initialized_only=True):
+        if conn.connection is not None and conn.errors_occurred:
+            if conn.is_usable():
+                conn.errors_occurred = False
+            else:
+                conn.close()
+
+
+class Worker:
+    """
+    Runs due tasks on `concurrency` threads, each with its own database
+    connection, until stop() is called. With `once=True` the threads stop
+    as soon as nothing is due. The calling thread renews leases, enqueues
+    scheduled tasks and requeues expired ones.
+    """
+
+    def __init__(self, concurrency=1, poll_interval=POLL_INTERVAL, once=False):
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.once = once
+        self.processed = Counter()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._running = set()
+        self._next_housekeeping = None
+
+    def stop(self):
+        self._stop.set()
+
+    def _work(self, index):
+        worker = f"{self.name}:{index}"
+        try:
+            while not self._stop.is_set():
+                _drop_broken_connections()
+                try:
+                    rows = claim(worker)
+                except DatabaseError as exc:
+                    # E.g. SQLite's "database is locked" when two threads
+                    # claim at once; try again on the next poll.
+                    logger.warning("Worker %s could not claim tasks: %s", worker, exc)
+                    self._stop.wait(self.poll_interval)
+                    continue
+                if not rows:
+                    if self.once:
+                        return
+                    self._stop.wait(self.poll_interval)
+                    continue
+                for row in rows:
+                    with self._lock:
+                        self._running.add(row.pk)
+                    try:
+                        execute(row)
+                    except DatabaseError:
+                        # The outcome could not be saved; the lease runs
+                        # out and the task is queued again.
+                        logger.exception("Worker %s could not record task #%s.", worker, row.pk)
+                    finally:
+                        with self._lock:
+                            self._running.discard(row.pk)
+                            # "queued" here means it will be retried.
+                            self.processed[row.status] += 1
+        finally:
+            connections.close_all()
+
+    def housekeeping(self, now=None):
+        now = now or timezone.now()
+        with self._lock:
+            running = list(self._running)
+        if running:
+            renew(running, now)
+        if self._next_housekeeping is None or now >= self._next_housekeeping:
+            schedule(now)
+            requeue_expired(now)
+            self._next_housekeeping = now + timedelta(seconds=HOUSEKEEPING_INTERVAL)
+
+    def run(self):
+        """Work until stopped (or drained, with once=True); returns task counts by outcome."""
+        self.housekeeping()
+        threads = [
+            threading.Thread(target=self._work, args=(index,), name=f"erp-task-{index}", daemon=True)
+            for index in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                alive = [thread for thread in threads if thread.is_alive()]
+                if not alive:
+                    break
+                alive[0].join(self.poll_interval)
+                _drop_broken_connections()
+                try:
+                    self.housekeeping()
+                except DatabaseError as exc:
+                    logger.warning("Worker %s housekeeping failed: %s", self.name, exc)
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            connections.close_all()
+        return dict(self.processed)
@@ -1,3 +1,1966 @@
-from django.test import TestCase
+import contextvars
+import csv
+import json
+import http.server
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import (
+    AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    analytics, async_queries, benchmark, book_import, caching, circulation, copies, db_routing, events, exports,
+    holds, jobs, ledger, loadtest, profiling, projections, query_plans, reminders, roles, rollups, search,
+    seeding, session_user, student_summary, tasks, views,
+)
+from .fines import fine_expression, fine_for, sweep_overdue
+from .models import (
+    User, Book, BookCopy, BookIssue, BackgroundTask, CatalogueImport, CirculationDailyStat, CirculationEvent,
+    CurrentLoan, FineAccount, FineEntry, Hold, ProjectionOffset, StudentCirculationStat,
+)
+from .pagination import decode_cursor, encode_cursor, paginate_balances, paginate_issues
+from .urls import urlpatterns
+
+
+def make_user(username, role="student", **extra):
+    return User.objects.create_user(
+        username=username, email=username, password="pass12345", role=role, **extra
+    )
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = make_user("lib@example.com", role="librarian")
+        cls.student = make_user("stu@example.com", first_name="Stu", last_name="Dent")
+        cls.other = make_user("other@example.com")
+        cls.book = Book.objects.create(title="Dune", copies_total=5, copies_available=5)
+        cls.other_book = Book.objects.create(title="Emma", copies_total=5, copies_available=5)
+        now = timezone.now()
+        issues = []
+        for n in range(25):
+            issues.append(BookIssue(
+                book=cls.book if n % 2 else cls.other_book,
+                student=cls.student if n % 3 else cls.other,
+                # Only the first four (book, student) pairs are still open.
+                action="issued" if n < 4 else "returned",
+                # Pairs share a timestamp so the id tiebreaker is exercised.
+                issued_at=now - timedelta(hours=n // 2),
+            ))
+        BookIssue.objects.bulk_create(issues)
+
+    def walk(self, page_size):
+        ids, after = [], None
+        while True:
+            page = paginate_issues(BookIssue.objects.all(), after=after, page_size=page_size)
+            ids.extend(i.pk for i in page)
+            if not page.has_next:
+                return ids
+            after = page.next_cursor
+
+    def test_cursor_round_trip(self):
+        at = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(at, 42)), (at, 42))
+        with self.assertRaises(ValueError):
+            decode_cursor("not-a-cursor")
+
+    def test_walk_matches_full_ordering(self):
+        expected = list(
+            BookIssue.objects.order_by("-issued_at", "id").values_list("id", flat=True)
+        )
+        self.assertEqual(self.walk(page_size=4), expected)
+
+    def test_previous_page_mirrors_next(self):
+        first = paginate_issues(BookIssue.objects.all(), page_size=5)
+        second = paginate_issues(BookIssue.objects.all(), after=first.next_cursor, page_size=5)
+        back = paginate_issues(BookIssue.objects.all(), before=second.prev_cursor, page_size=5)
+        self.assertEqual([i.pk for i in back], [i.pk for i in first])
+        self.assertFalse(back.has_previous)
+
+    def test_history_query_count_is_constant(self):
+        self.client.force_login(self.librarian)
+        url = reverse("core:all_book_issue_history")
+        first = paginate_issues(BookIssue.objects.all(), page_size=5)
+        # session + page; the user comes from the session and rows add nothing.
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {"page_size": 5})
+        self.assertEqual(len(response.context["issues"]), 5)
+        with self.assertNumQueries(2):
+            self.client.get(url, {"page_size": 5, "after": first.next_cursor})
+
+    def test_history_filters(self):
+        self.client.force_login(self.librarian)
+        response = self.client.get(
+            reverse("core:all_book_issue_history"),
+            {"action": "issued", "book": self.book.pk, "student": self.student.pk},
+        )
+        rows = list(response.context["issues"])
+        self.assertTrue(rows)
+        for issue in rows:
+            self.assertEqual(
+                (issue.action, issue.book_id, issue.student_id),
+                ("issued", self.book.pk, self.student.pk),
+            )
+
+    def test_manage_issues_uses_same_page(self):
+        self.client.force_login(self.librarian)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("core:issues_manage"), {"page_size": 10})
+        self.assertContains(response, "Dune")
+
+
+class CirculationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = make_user("stu@example.com")
+        cls.other = make_user("other@example.com")
+        cls.book = Book.objects.create(title="Dune", copies_total=1, copies_available=1)
+
+    def test_issue_and_return_adjust_counter(self):
+        issue = circulation.issue_book(self.book, self.student)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 0)
+        self.assertEqual(issue.due_date, circulation.default_due_date())
+
+        circulation.return_book(issue)
+        self.book.refresh_from_db()
+        issue.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 1)
+        self.assertEqual(issue.action, "returned")
+        with self.assertRaises(circulation.IssueNotOpen):
+            circulation.return_book(issue)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 1)
+
+    def test_last_copy_cannot_be_issued_twice(self):
+        # Both desks loaded the book while one copy was still available.
+        stale = Book.objects.get(pk=self.book.pk)
+        circulation.issue_book(self.book, self.student)
+        with self.assertRaises(circulation.NoCopiesAvailable):
+            circulation.issue_book(stale, self.other)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 0)
+        self.assertEqual(BookIssue.objects.count(), 1)
+
+    def test_duplicate_open_issue_rolls_back_counter(self):
+        Book.objects.filter(pk=self.book.pk).update(copies_total=3, copies_available=3)
+        copies.create_copies({self.book.pk: 2})
+        circulation.issue_book(self.book, self.student)
+        with self.assertRaises(circulation.AlreadyIssued):
+            circulation.issue_book(self.book, self.student)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 2)
+
+    def test_overdue_return_applies_fine(self):
+        issue = circulation.issue_book(
+            self.book, self.student, due_date=timezone.localdate() - timedelta(days=3)
+        )
+        issue = circulation.return_book(issue)
+        self.assertEqual(issue.fine_amount, 3)
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class CirculationConcurrencyTests(TransactionTestCase):
+    """Hammer the engine from many threads; needs a real server database."""
+
+    THREADS = 16
+    ATTEMPTS = 200
+    COPIES = 50
+
+    def test_concurrent_issues_never_oversell(self):
+        book = Book.objects.create(
+            title="Dune", copies_total=self.COPIES, copies_available=self.COPIES
+        )
+        students = [make_user(f"s{n}@example.com") for n in range(self.ATTEMPTS)]
+        outcomes = []
+
+        def desk(chunk):
+            try:
+                for student in chunk:
+                    try:
+                        circulation.issue_book(book.pk, student)
+                        outcomes.append("issued")
+                    except circulation.NoCopiesAvailable:
+                        outcomes.append("refused")
+            finally:
+                connection.close()
+
+        chunks = [students[n::self.THREADS] for n in range(self.THREADS)]
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            list(pool.map(desk, chunks))
+
+        book.refresh_from_db()
+        self.assertEqual(outcomes.count("issued"), self.COPIES)
+        self.assertEqual(outcomes.count("refused"), self.ATTEMPTS - self.COPIES)
+        self.assertEqual(book.copies_available, 0)
+        self.assertEqual(BookIssue.objects.filter(book=book).count(), self.COPIES)
+
+
+class AsyncViewTests(TransactionTestCase):
+    """Async views and concurrent queries outside a test transaction."""
+
+    def setUp(self):
+        cache.clear()
+        self.librarian = make_user("lib@example.com", role="librarian")
+        self.student = make_user("stu@example.com")
+        self.book = Book.objects.create(title="Dune", copies_total=2, copies_available=2)
+        circulation.issue_book(self.book, self.student)
+
+    def tearDown(self):
+        async_queries.shutdown()
+
+    def test_gather_runs_queries_on_pool_threads(self):
+        def where(call):
+            return lambda: (call(), threading.current_thread().name)
+
+        results = async_to_sync(async_queries.gather)(
+            where(Book.objects.count), where(BookIssue.objects.count), where(User.objects.count)
+        )
+        self.assertEqual([value for value, _ in results], [1, 1, 2])
+        self.assertTrue(all(name.startswith("erp-query") for _, name in results))
+
+    def test_gather_stays_on_the_request_connection_in_a_transaction(self):
+        with transaction.atomic():
+            Book.objects.create(title="Uncommitted")
+            results = async_to_sync(async_queries.gather)(Book.objects.count, User.objects.count)
+        self.assertEqual(results, [2, 2])
+
+    async def test_async_pages(self):
+        client = AsyncClient()
+        await client.aforce_login(self.librarian)
+        for name in ("librarian_dashboard", "available_books", "librarian_analytics"):
+            response = await client.get(reverse(f"core:{name}"))
+            self.assertContains(response, "Dune", msg_prefix=name)
+        response = await client.get(reverse("core:circulation_trends"))
+        self.assertEqual(response.json()["results"][0]["issues"], 1)
+
+        await client.aforce_login(self.student)
+        response = await client.get(reverse("core:student_issued_books"))
+        self.assertContains(response, "Dune")
+        response = await client.get(reverse("core:available_books"))
+        self.assertRedirects(response, reverse("core:home"), fetch_redirect_response=False)
+
+
+class BulkCirculationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = make_user("lib@example.com", role="librarian")
+        cls.students = [make_user(f"s{n}@example.com") for n in range(6)]
+        cls.book = Book.objects.create(title="Dune", isbn="111", copies_total=4, copies_available=4)
+        cls.other_book = Book.objects.create(title="Emma", isbn="222", copies_total=10, copies_available=10)
+
+    def test_bulk_issue_reports_row_errors(self):
+        rows = [{"book_id": self.book.pk, "student_email": s.username} for s in self.students[:5]]
+        rows += [
+            {"isbn": "222", "student_email": "s0@example.com", "due_date": "2030-01-31"},
+            {"isbn": "222", "student_email": "s0@example.com"},
+            {"isbn": "999", "student_email": "s1@example.com"},
+            {"isbn": "222", "student_email": "nobody@example.com"},
+            {"book_id": "x", "student_email": "s1@example.com"},
+        ]
+        # students, books, open issues, ready holds, shelved copies, insert,
+        # copy update, one counter update per book, the event insert, and
+        # the savepoint pair from running inside the test transaction
+        with self.assertNumQueries(12):
+            issues, errors = circulation.bulk_issue(rows)
+        self.assertEqual(len(issues), 5)
+        self.assertEqual(
+            [(e["row"], e["error"]) for e in errors],
+            [
+                (5, "No copies available for this book."),
+                (7, "s0@example.com already has this book issued."),
+                (8, "Book not found."),
+                (9, "Student not found."),
+                (10, "Invalid book_id or due_date."),
+            ],
+        )
+        self.book.refresh_from_db()
+        self.other_book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 0)
+        self.assertEqual(self.other_book.copies_available, 9)
+        self.assertEqual(
+            BookIssue.objects.get(book=self.other_book).due_date.isoformat(), "2030-01-31"
+        )
+
+    def test_bulk_return_computes_fines(self):
+        today = timezone.localdate()
+        late = circulation.issue_book(self.book, self.students[0], due_date=today - timedelta(days=4))
+        very_late = circulation.issue_book(self.book, self.students[1], due_date=today - timedelta(days=90))
+        circulation.issue_book(self.other_book, self.students[2])
+        issues, errors = circulation.bulk_return([
+            {"issue_id": late.pk},
+            {"issue_id": very_late.pk},
+            {"isbn": "222", "student_email": "s2@example.com"},
+            {"issue_id": late.pk},
+            {"isbn": "222", "student_email": "s3@example.com"},
+        ])
+        self.assertEqual(len(issues), 3)
+        self.assertEqual([e["row"] for e in errors], [4, 5])
+        fines = dict(BookIssue.objects.values_list("pk", "fine_amount"))
+        self.assertEqual(fines[late.pk], 4)
+        self.assertEqual(fines[very_late.pk], 50)
+        self.assertFalse(BookIssue.objects.filter(action="issued").exists())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 4)
+
+    def test_csv_upload_endpoint(self):
+        self.client.force_login(self.librarian)
+        upload = SimpleUploadedFile(
+            "issues.csv",
+            b"isbn,student_email,due_date\n111,s0@example.com,\n111,s1@example.com,2030-01-01\n",
+            content_type="text/csv",
+        )
+        response = self.client.post(reverse("core:bulk_issue_books"), {"file": upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["issued"], 2)
+
+        response = self.client.post(
+            reverse("core:bulk_return_books"),
+            data=json.dumps({"rows": [{"isbn": "111", "student_email": "s0@example.com"}]}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.json()["returned"], 1)
+        self.assertEqual(response.json()["fines_total"], "0.00")
+
+    def test_bad_payload_is_rejected(self):
+        self.client.force_login(self.librarian)
+        response = self.client.post(
+            reverse("core:bulk_issue_books"), data="{", content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class BookCopyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = make_user("lib@example.com", role="librarian")
+        cls.students = [make_user(f"s{n}@example.com") for n in range(3)]
+        cls.book = Book.objects.create(title="Dune", isbn="111", copies_total=2, copies_available=2)
+
+    def test_new_books_get_their_copies(self):
+        self.assertEqual(
+            list(self.book.copies.values_list("barcode", "status")),
+            [(copies.barcode(self.book.pk, 1), "available"), (copies.barcode(self.book.pk, 2), "available")],
+        )
+        gone = Book.objects.create(title="Gone", copies_total=1, copies_available=0)
+        self.assertEqual(gone.copies.get().status, "lost")
+        self.assertFalse(copies.check_counters().exists())
+
+    def test_circulation_moves_copies_with_the_counters(self):
+        first = circulation.issue_book(self.book, self.students[0])
+        scanned = copies.scan(copies.barcode(self.book.pk, 2))
+        second = circulation.issue_book(self.book, self.students[1], copy=scanned)
+        self.assertEqual((first.copy.barcode, second.copy_id), (copies.barcode(self.book.pk, 1), scanned.pk))
+        self.assertFalse(copies.check_counters().exists())
+        with self.assertRaisesMessage(circulation.NoCopiesAvailable, "This copy is not available."):
+            circulation.issue_book(Book.objects.create(title="Emma"), self.students[2], copy=scanned)
+
+        circulation.return_book(first)
+        issues, errors = circulation.bulk_issue([{"isbn": "111", "student_email": "s2@example.com"}])
+        self.assertEqual((issues[0].copy_id, errors), (first.copy_id, []))
+        circulation.bulk_return([{"issue_id": second.pk}, {"issue_id": issues[0].pk}])
+        self.assertEqual(set(self.book.copies.values_list("status", flat=True)), {"available"})
+        self.assertFalse(copies.check_counters().exists())
+
+    def test_sync_counters_repairs_drift(self):
+        Book.objects.filter(pk=self.book.pk).update(copies_total=5, copies_available=0)
+        self.assertEqual(list(copies.check_counters().values_list("pk", flat=True)), [self.book.pk])
+        self.assertEqual(copies.sync_counters(), 1)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.copies_total, self.book.copies_available), (2, 2))
+        self.assertEqual(copies.sync_counters(), 0)
+
+    def test_set_copy_count_serves_holds_and_keeps_copies_out(self):
+        for student in self.students[:2]:
+            circulation.issue_book(self.book, student)
+        hold = holds.place_hold(self.book, self.students[2])
+        self.assertEqual(copies.set_copy_count(self.book.pk, 4), 4)
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, "ready")
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.copies_total, self.book.copies_available), (4, 1))
+        # Both copies on loan and the one set aside stay.
+        self.assertEqual(copies.set_copy_count(self.book.pk, 0), 3)
+        self.assertFalse(copies.check_counters().exists())
+
+    def test_admin_copy_count_edit_goes_through_the_copies(self):
+        admin = make_user("admin@example.com", role="admin", is_staff=True, is_superuser=True)
+        circulation.issue_book(self.book, self.students[0])
+        self.client.force_login(admin)
+        url = reverse("admin:core_book_change", args=[self.book.pk])
+        form = {"title": "Dune (2nd ed.)", "author": "", "isbn": "111", "publisher": "", "year_published": ""}
+        self.assertEqual(self.client.post(url, {**form, "copies_total": 3}).status_code, 302)
+        self.book.refresh_from_db()
+        self.assertEqual(
+            (self.book.title, self.book.copies_total, self.book.copies_available), ("Dune (2nd ed.)", 3, 2)
+        )
+        self.assertEqual(self.book.copies.filter(status__in=copies.HELD_STATUSES).count(), 3)
+
+        response = self.client.post(url, {**form, "copies_total": 0}, follow=True)
+        self.assertContains(response, "Only copies on the shelf can be withdrawn")
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.copies_total, self.book.copies_available), (1, 0))
+        self.assertFalse(copies.check_counters().exists())
+
+    def test_scan_endpoint(self):
+        self.client.force_login(self.librarian)
+        url = reverse("core:scan_copy")
+        code = copies.barcode(self.book.pk, 2)
+        # The session (which carries the user), then the copy with its book.
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {"barcode": code})
+        self.assertEqual(response.json()["book"]["copies_available"], 2)
+        self.assertIsNone(response.json()["issue"])
+        self.assertEqual(self.client.get(url, {"barcode": "nope"}).status_code, 404)
+
+        response = self.client.post(url, {"barcode": code, "action": "issue", "student_email": "s0@example.com"})
+        data = response.json()
+        self.assertEqual((data["status"], data["book"]["copies_available"]), ("on_loan", 1))
+        self.assertEqual(data["issue"]["student"], "s0@example.com")
+        response = self.client.post(url, {"barcode": code, "action": "issue", "student_email": "s1@example.com"})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.client.get(url, {"barcode": code}).json()["issue"]["id"], data["issue"]["id"])
+
+        response = self.client.post(url, {"barcode": code, "action": "return"})
+        self.assertEqual((response.json()["status"], response.json()["issue"]["action"]), ("available", "returned"))
+        self.assertEqual(self.client.post(url, {"barcode": code, "action": "return"}).status_code, 409)
+
+
+class HoldTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = make_user("lib@example.com", role="librarian")
+        cls.students = [make_user(f"s{n}@example.com") for n in range(4)]
+        cls.book = Book.objects.create(title="Dune", isbn="111", copies_total=1, copies_available=1)
+
+    def setUp(self):
+        self.loan = circulation.issue_book(self.book, self.students[0])
+
+    def queue(self, *students):
+        return [holds.place_hold(self.book, student) for student in students]
+
+    def test_place_hold_only_when_nothing_is_on_the_shelf(self):
+        with self.assertRaises(circulation.AlreadyIssued):
+            holds.place_hold(self.book, self.students[0])
+        first, second = self.queue(*self.students[1:3])
+        self.assertEqual((holds.queue_position(first), holds.queue_position(second)), (1, 2))
+        with self.assertRaises(holds.AlreadyOnHold):
+            holds.place_hold(self.book, self.students[1])
+        with self.assertRaises(holds.CopiesAvailable):
+            holds.place_hold(Book.objects.create(title="Emma", copies_total=1, copies_available=1), self.students[1])
+
+    def test_return_sets_the_copy_aside_for_the_first_hold(self):
+        first, second = self.queue(*self.students[1:3])
+        circulation.return_book(self.loan)
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.copy_id), ("ready", self.loan.copy_id))
+        self.assertEqual(BookCopy.objects.get(pk=self.loan.copy_id).status, "on_hold")
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 0)
+        self.assertEqual(holds.queue_position(second), 1)
+        self.assertFalse(copies.check_counters().exists())
+
+        # Nobody else can take the copy set aside; its student picks it up.
+        with self.assertRaises(circulation.NoCopiesAvailable):
+            circulation.issue_book(self.book, self.students[3])
+        issue = circulation.issue_book(self.book, self.students[1])
+        first.refresh_from_db()
+        self.assertEqual((issue.copy_id, first.status), (self.loan.copy_id, "fulfilled"))
+        self.assertFalse(copies.check_counters().exists())
+
+    def test_bulk_issue_hands_out_the_copy_set_aside(self):
+        first, second = self.queue(*self.students[1:3])
+        circulation.return_book(self.loan)
+        # The copy on the hold shelf is not counted as available for anyone else.
+        issues, errors = circulation.bulk_issue([
+            {"book_id": self.book.pk, "student_email": "s3@example.com"},
+            {"book_id": self.book.pk, "student_email": "s1@example.com"},
+        ])
+        self.assertEqual(errors, [{"row": 1, "error": "No copies available for this book."}])
+        self.assertEqual((issues[0].student_id, issues[0].copy_id), (self.students[1].pk, self.loan.copy_id))
+        first.refresh_from_db()
+        self.assertEqual(first.status, "fulfilled")
+        self.assertEqual(BookCopy.objects.get(pk=self.loan.copy_id).status, "on_loan")
+        self.assertEqual(holds.queue_position(second), 1)
+        self.assertFalse(copies.check_counters().exists())
+
+    def test_cancel_moves_the_queue_up(self):
+        first, second, third = self.queue(*self.students[1:])
+        holds.cancel_hold(second)
+        third.refresh_from_db()
+        self.assertEqual((holds.queue_position(first), holds.queue_position(third)), (1, 2))
+        with self.assertRaises(holds.HoldNotOpen):
+            holds.cancel_hold(second)
+        circulation.return_book(self.loan)
+        holds.cancel_hold(first)
+        third.refresh_from_db()
+        self.assertEqual((third.status, third.copy_id), ("ready", self.loan.copy_id))
+
+    def test_expired_hold_passes_its_copy_on(self):
+        first, second = self.queue(*self.students[1:3])
+        circulation.return_book(self.loan)
+        later = timezone.now() + timedelta(days=circulation.pickup_days(), hours=1)
+        self.assertEqual(holds.expire_holds(later), 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status, second.copy_id), ("expired", "ready", self.loan.copy_id))
+        # The last hold expiring puts the copy back on the shelf.
+        self.assertEqual(holds.expire_holds(later + timedelta(days=circulation.pickup_days(), hours=1)), 1)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.copies_available, 1)
+        self.assertFalse(copies.check_counters().exists())
+        self.assertEqual(jobs.expire_holds(), {"expired": 0})
+
+    def test_queue_lookups_are_single_row_reads(self):
+        placed = self.queue(*self.students[1:])
+        # Only the head of the queue is read, however long it is.
+        with self.assertNumQueries(1):
+            self.assertEqual(holds.queue_position(placed[-1]), 3)
+        circulation.return_book(self.loan)
+        self.assertEqual(Hold.objects.filter(status="ready").count(), 1)
+
+    def test_hold_endpoints(self):
+        url = reverse("core:place_hold", args=[self.book.pk])
+        self.client.force_login(self.students[1])
+        response = self.client.post(url)
+        self.assertEqual((response.status_code, response.json()["position"]), (201, 1))
+        hold_id = response.json()["id"]
+        self.assertEqual(self.client.post(url).status_code, 409)
+        self.assertEqual(self.client.post(reverse("core:place_hold", args=[0])).status_code, 404)
+
+        self.client.force_login(self.students[2])
+        self.assertEqual(self.client.get(reverse("core:hold_status", args=[hold_id])).status_code, 404)
+
+        self.client.force_login(self.librarian)
+        response = self.client.post(
+            reverse("core:issue_book", args=[self.book.pk]), {"student_email": "s2@example.com"}
+        )
+        self.assertRedirects(response, reverse("core:books_list"), fetch_redirect_response=False)
+        self.assertEqual(Hold.objects.get(student=self.students[2]).ticket, 2)
+        response = self.client.post(reverse("core:cancel_hold", args=[hold_id]))
+        self.assertEqual((response.json()["status"], response.json()["position"]), ("cancelled", None))
+        data = self.client.get(reverse("core:hold_status", args=[hold_id + 1])).json()
+        self.assertEqual((data["student"], data["position"]), ("s2@example.com", 1))
+
+
+class FineLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = make_user("lib@example.com", role="librarian")
+        cls.students = [make_user(f"s{n}@example.com") for n in range(3)]
+        cls.book = Book.objects.create(title="Dune", isbn="111", copies_total=3, copies_available=3)
+
+    def late_return(self, student, days_late):
+        issue = circulation.issue_book(self.book, student, due_date=timezone.localdate() - timedelta(days=days_late))
+        return circulation.return_book(issue)
+
+    def test_returns_charge_the_ledger(self):
+        self.late_return(self.students[0], 3)
+        self.late_return(self.students[0], 2)
+        circulation.return_book(circulation.issue_book(self.book, self.students[0]))  # On time: no entry.
+        with self.assertNumQueries(1):
+            self.assertEqual(ledger.balance(self.students[0]), Decimal("5.00"))
+        self.assertEqual(
+            [(e.kind, e.amount, e.balance) for e in ledger.statement(self.students[0])],
+            [("charge", Decimal("2.00"), Decimal("5.00")), ("charge", Decimal("3.00"), Decimal("3.00"))],
+        )
+        self.assertEqual(ledger.balance(self.students[1]), 0)
+
+        issues = [
+            circulation.issue_book(self.book, student, due_date=timezone.localdate() - timedelta(days=4))
+            for student in self.students[1:]
+        ]
+        circulation.bulk_return([{"issue_id": issue.pk} for issue in issues])
+        self.assertEqual([ledger.balance(s) for s in self.students], [Decimal("5.00"), Decimal("4.00"), Decimal("4.00")])
+        self.assertEqual(ledger.reconcile(), [])
+
+    def test_payments_and_waivers_credit_the_balance(self):
+        self.late_return(self.students[0], 10)
+        ledger.record_payment(self.students[0], "6.50", recorded_by=self.librarian)
+        entry = ledger.waive(self.students[0], "3.50", note="First offence")
+        self.assertEqual((entry.amount, entry.balance), (Decimal("-3.50"), Decimal("0.00")))
+        with self.assertRaisesMessage(ledger.Overpayment, "Only $0.00 is owed."):
+            ledger.record_payment(self.students[0], "1")
+        for bad in ("", "abc", "-1", "0", "1.234", "NaN"):
+            with self.assertRaises(ledger.InvalidAmount):
+                ledger.record_payment(self.students[0], bad)
+        with self.assertRaises(ValueError):
+            entry.save()
+
+    def test_reconcile_finds_and_fixes_drift(self):
+        self.late_return(self.students[0], 3)
+        self.late_return(self.students[1], 1)
+        FineAccount.objects.filter(pk=self.students[0].pk).update(balance=9)
+        FineAccount.objects.filter(pk=self.students[1].pk).delete()
+        self.assertEqual(
+            ledger.reconcile(),
+            [
+                {"student": self.students[0].pk, "balance": Decimal("9.00"), "ledger": Decimal("3.00")},
+                {"student": self.students[1].pk, "balance": None, "ledger": None},
+            ],
+        )
+        with self.assertRaises(CommandError):
+            call_command("reconcile_fines", stdout=StringIO())
+        out = StringIO()
+        call_command("reconcile_fines", "--fix", stdout=out)
+        self.assertIn("Fixed fine balances: 2 out of step", out.getvalue())
+        self.assertEqual([ledger.balance(s) for s in self.students[:2]], [Decimal("3.00"), Decimal("1.00")])
+        self.assertEqual(ledger.reconcile(), [])
+
+    def test_outstanding_balances_page_largest_first(self):
+        for days, student in zip((2, 7, 4), self.students):
+            self.late_return(student, days)
+        ledger.record_payment(self.students[0], "2")
+        first = paginate_balances(ledger.outstanding(), page_size=1)
+        self.assertEqual([a.student_id for a in first], [self.students[1].pk])
+        second = paginate_balances(ledger.outstanding(), after=first.next_cursor, page_size=1)
+        self.assertEqual([a.student_id for a in second], [self.students[2].pk])
+        self.assertFalse(second.has_next)
+        back = paginate_balances(ledger.outstanding(), before=second.prev_cursor, page_size=1)
+        self.assertEqual([a.student_id for a in back], [self.students[1].pk])
+
+    def test_fine_views(self):
+        self.late_return(self.students[0], 5)
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse("core:fine_balances"))
+        self.assertContains(response, "s0@example.com")
+        self.assertContains(response, "$5.00")
+
+        url = reverse("core:student_fines", args=[self.students[0].pk])
+        response = self.client.post(url, {"kind": "payment", "amount": "2.00", "note": "cash"})
+        data = response.json()
+        self.assertEqual((data["balance"], data["entries"][0]["kind"]), ("3.00", "payment"))
+        self.assertEqual(FineEntry.objects.get(kind="payment").recorded_by, self.librarian)
+        self.assertEqual(self.client.post(url, {"kind": "waiver", "amount": "4"}).status_code, 409)
+        self.assertEqual(self.client.post(url, {"kind": "charge", "amount": "4"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("core:student_fines", args=[self.librarian.pk])).status_code, 404)
+
+
+class OverdueSweepTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = date(2026, 3, 1)
+        students = [make_user(f"s{n}@example.com") for n in range(4)]
+        book = Book.objects.create(title="Dune", copies_total=10, copies_available=6)
+        cls.due = {
+            "current": cls.today + timedelta(days=3),
+            "late": cls.today - timedelta(days=7),
+            "capped": cls.today - timedelta(days=120),
+        }
+        cls.issues = {
+            name: BookIssue.objects.create(book=book, student=student, due_date=due)
+            for (name, due), student in zip(cls.due.items(), students)
+        }
+        BookIssue.objects.create(
+            book=book, student=students[3], action="returned",
+            due_date=cls.today - timedelta(days=30),
+        )
+
+    def state(self):
+        return {
+            name: BookIssue.objects.values_list("action", "fine_amount").get(pk=issue.pk)
+            for name, issue in self.issues.items()
+        }
+
+    def test_fine_expression_matches_python_rule(self):
+        rows = BookIssue.objects.annotate(fine=fine_expression(self.today))
+        for issue in rows:
+            self.assertEqual(issue.fine, fine_for(issue.due_date, self.today))
+
+    def test_sweep_marks_and_fines(self):
+        sweep = sweep_overdue(today=self.today)
+        self.assertEqual(sweep.marked, 2)
+        self.assertEqual(self.state(), {
+            "current": ("issued", 0),
+            "late": ("overdue", 7),
+            "capped": ("overdue", 50),
+        })
+        self.assertEqual(BookIssue.objects.filter(action="returned").count(), 1)
+
+    def test_incremental_sweep_only_touches_changed_rows(self):
+        sweep_overdue(today=self.today)
+        self.assertEqual(sweep_overdue(today=self.today).marked, 0)
+        # Next day only the issue still accruing a fine changes: last sweep,
+        # the two locking SELECTs for state changes (none, so no events), two
+        # UPDATEs and the sweep record, inside a savepoint.
+        with self.assertNumQueries(8):
+            sweep = sweep_overdue(today=self.today + timedelta(days=1))
+        self.assertEqual(sweep.marked, 1)
+        self.assertEqual(self.state()["late"], ("overdue", 8))
+
+    def test_incremental_sweep_picks_up_new_issues_long_past_due(self):
+        sweep_overdue(today=self.today)
+        # Entered after that sweep, due long before its fine window.
+        backdated = BookIssue.objects.create(
+            book=self.issues["late"].book, student=make_user("late@example.com"),
+            due_date=self.today - timedelta(days=200),
+        )
+        sweep = sweep_overdue(today=self.today + timedelta(days=1))
+        self.assertEqual(sweep.marked, 2)
+        backdated.refresh_from_db()
+        self.assertEqual((backdated.action, backdated.fine_amount), ("overdue", 50))
+
+    def test_extended_due_date_is_cleared(self):
+        sweep_overdue(today=self.today)
+        BookIssue.objects.filter(pk=self.issues["late"].pk).update(
+            due_date=self.today + timedelta(days=7)
+        )
+        self.assertEqual(sweep_overdue(today=self.today).cleared, 1)
+        self.assertEqual(self.state()["late"], ("issued", 0))
+
+    def test_management_command(self):
+        out = StringIO()
+        call_command("sweep_overdue", date="2026-03-01", full=True, stdout=out)
+        self.assertIn("2 marked overdue", out.getvalue())
+
+
+class AnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = make_user("lib@example.com", role="librarian")
+        students = [make_user(f"s{n}@example.com") for n in range(3)]
+        dune = Book.objects.create(title="Dune", copies_total=5, copies_available=5)
+        emma = Book.objects.create(title="Emma", copies_total=5, copies_available=5)
+        Book.objects.create(title="Ulysses")
+        now = timezone.now()
+        BookIssue.objects.bulk_create([
+            BookIssue(book=dune, student=students[0], issued_at=now),
+            BookIssue(book=dune, student=students[1], action="overdue", issued_at=now - timedelta(days=40)),
+            BookIssue(book=dune, student=students[2], action="returned",
+                      issued_at=now - timedelta(days=10), returned_at=now - timedelta(days=2)),
+            BookIssue(book=emma, student=students[0], action="returned",
+                      issued_at=now - timedelta(days=400), returned_at=now - timedelta(days=390)),
+        ])
+        rollups.rebuild()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_summary_counts(self):
+        with self.assertNumQueries(3):
+            summary = analytics.library_summary()
+        expected = {
+            "total_books": 3, "total_students": 3, "total_issues": 4,
+            "active_issues": 2, "overdue_books": 1, "recent_issues": 2,
+            "recent_returns": 1, "active_students": 2,
+        }
+        self.assertEqual({key: summary[key] for key in expected}, expected)
+        self.assertEqual(
+            [(b.title, b.issue_count) for b in summary["popular_books"]],
+            [("Dune", 3), ("Emma", 1), ("Ulysses", 0)],
+        )
+        self.assertEqual(sum(m["count"] for m in summary["monthly_data"]), 3)
+
+    def test_trend_uses_calendar_months(self):
+        self.assertEqual(
+            analytics.month_starts(date(2026, 2, 15), months=3),
+            [date(2025, 12, 1), date(2026, 1, 1), date(2026, 2, 1)],
+        )
+        counters, trend = analytics.history_counters(timezone.localdate())
+        self.assertEqual(len(trend), analytics.TREND_MONTHS)
+        self.assertEqual(trend[-1]["month"], timezone.localdate().strftime("%b"))
+
+    def test_dashboard_query_count(self):
+        self.client.force_login(self.librarian)
+        # session, then the three analytics queries
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("core:librarian_analytics"))
+        self.assertEqual(response.status_code, 200)
+
+
+class CirculationRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = make_user("lib@example.com", role="librarian")
+        cls.students = [make_user(f"s{n}@example.com") for n in range(3)]
+        cls.book = Book.objects.create(title="Dune", copies_total=5, copies_available=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def stats(self):
+        return list(CirculationDailyStat.objects.values_list(
+            "date", "book_id", "issues", "returns", "overdue", "fines"
+        ))
+
+    def test_circulation_maintains_rollup_and_rebuild_agrees(self):
+        today = timezone.localdate()
+        with self.captureOnCommitCallbacks(execute=True):
+            late = circulation.issue_book(self.book, self.students[0], due_date=today - timedelta(days=2))
+            circulation.issue_book(self.book, self.students[1])
+            circulation.bulk_issue([{"book_id": self.book.pk, "student_email": "s2@example.com"}])
+            circulation.return_book(late)
+            circulation.bulk_return([{"book_id": self.book.pk, "student_email": "s1@example.com"}])
+        live = self.stats()
+        self.assertEqual(live, [(today, self.book.pk, 3, 2, 1, 2)])
+
+        CirculationDailyStat.objects.all().delete()
+        out = StringIO()
+        call_command("rebuild_circulation_stats", stdout=out)
+        self.assertIn("Wrote 1 rollup rows", out.getvalue())
+        self.assertEqual(self.stats(), live)
+        # The rebuild already counted the logged events.
+        self.assertEqual(projections.catch_up(["daily_stats"]), {"daily_stats": 0})
+        self.assertEqual(projections.replay("daily_stats"), 5)
+        self.assertEqual(self.stats(), live)
+
+    def test_trends_endpoint(self):
+        day = date(2026, 1, 10)
+        CirculationDailyStat.objects.create(date=day, book=self.book, issues=4, returns=1)
+        CirculationDailyStat.objects.create(
+            date=day + timedelta(days=25), book=self.book, issues=2, overdue=1, fines=3
+        )
+        self.client.force_login(self.librarian)
+        url = reverse("core:circulation_trends")
+        response = self.client.get(url, {"from": "2026-01-01", "to": "2026-02-28"})
+        self.assertEqual(
+            [(r["period"], r["issues"]) for r in response.json()["results"]],
+            [("2026-01-10", 4), ("2026-02-04", 2)],
+        )
+        response = self.client.get(
+            url, {"from": "2026-01-01", "to": "2026-02-28", "period": "month", "book": self.book.pk}
+        )
+        self.assertEqual(
+            [(r["period"], r["issues"], r["fines"]) for r in response.json()["results"]],
+            [("2026-01-01", 4, "0.00"), ("2026-02-01", 2, "3.00")],
+        )
+        self.assertEqual(self.client.get(url, {"from": "bad"}).status_code, 400)
+
+    def test_dashboard_reads_today_from_rollup(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            circulation.issue_book(self.book, self.students[0])
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse("core:librarian_dashboard"))
+        self.assertEqual(response.context["today_stats"]["issues"], 1)
+        self.assertEqual(response.context["issued_books"], 1)
+
+
+class EventLogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.students = [make_user(f"s{n}@example.com") for n in range(2)]
+        cls.book = Book.objects.create(title="Dune", copies_total=3, copies_available=3)
+
+    def setUp(self):
+        cache.clear()
+
+    def read_models(self):
+        return (
+            sorted(CurrentLoan.objects.values_list("issue_id", "student_id", "overdue")),
+            sorted(StudentCirculationStat.objects.values_list(
+                "student_id", "current", "overdue", "loans", "returns", "late_returns", "fines"
+            )),
+            sorted(CirculationDailyStat.objects.values_list("date", "book_id", "issues", "returns", "fines")),
+        )
+
+    def test_transitions_are_logged_and_projected_after_commit(self):
+        today = timezone.localdate()
+        with self.captureOnCommitCallbacks(execute=True):
+            late = circulation.issue_book(self.book, self.students[0], due_date=today - timedelta(days=3))
+            kept = circulation.issue_book(self.book, self.students[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            sweep_overdue(today=today)
+        self.assertEqual(CurrentLoan.objects.get(pk=late.pk).overdue, True)
+        self.assertEqual(StudentCirculationStat.objects.get(pk=self.students[0].pk).overdue, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            circulation.return_book(late)
+        self.assertEqual(
+            [(e.kind, e.previous, e.fine) for e in events.history(late)],
+            [("issued", "", 0), ("overdue", "issued", 0), ("returned", "overdue", Decimal("3.00"))],
+        )
+        self.assertEqual(list(CurrentLoan.objects.values_list("issue_id", flat=True)), [kept.pk])
+        stat = StudentCirculationStat.objects.get(pk=self.students[0].pk)
+        self.assertEqual(
+            (stat.current, stat.overdue, stat.loans, stat.returns, stat.late_returns, stat.fines),
+            (0, 0, 1, 1, 1, Decimal("3.00")),
+        )
+        self.assertEqual(projections.lag(), dict.fromkeys(projections.PROJECTORS, 0))
+
+    def test_log_is_append_only(self):
+        issue = circulation.issue_book(self.book, self.students[0])
+        (event,) = events.history(issue)
+        event.kind = "returned"
+        with self.assertRaises(ValueError):
+            event.save()
+
+    def test_catch_up_applies_new_events_in_batches_from_the_offset(self):
+        for student in self.students:
+            circulation.issue_book(self.book, student)
+        self.assertEqual(CurrentLoan.objects.count(), 0)
+        self.assertEqual(projections.lag()["current_loans"], 2)
+        self.assertEqual(projections.catch_up(["current_loans"], batch_size=1, max_batches=1), {"current_loans": 1})
+        self.assertEqual(projections.catch_up(["current_loans"], batch_size=1), {"current_loans": 1})
+        self.assertEqual(CurrentLoan.objects.count(), 2)
+        self.assertEqual(
+            ProjectionOffset.objects.get(pk="current_loans").position,
+            CirculationEvent.objects.order_by("-pk").first().pk,
+        )
+        self.assertEqual(projections.catch_up(["current_loans"]), {"current_loans": 0})
+
+    def test_batch_stops_at_an_unsettled_gap(self):
+        issue = circulation.issue_book(self.book, self.students[0])
+        circulation.return_book(issue)
+        first, second = events.history(issue)
+        now = timezone.now()
+        # An id between them, still to be committed by another transaction.
+        CirculationEvent.objects.filter(pk=second.pk).update(id=second.pk + 1)
+        second.pk += 1
+        self.assertEqual(projections.ready([first, second], first.pk - 1, now), [first])
+        self.assertEqual(projections.catch_up(["current_loans"], now=now), {"current_loans": 1})
+        later = now + timedelta(seconds=projections.settle_seconds() + 1)
+        self.assertEqual(projections.catch_up(["current_loans"], now=later), {"current_loans": 1})
+        self.assertEqual(CurrentLoan.objects.count(), 0)
+
+    def test_replay_rebuilds_what_catch_up_built(self):
+        today = timezone.localdate()
+        with self.captureOnCommitCallbacks(execute=True):
+            late = circulation.issue_book(self.book, self.students[0], due_date=today - timedelta(days=2))
+            circulation.issue_book(self.book, self.students[1])
+            sweep_overdue(today=today)
+            circulation.return_book(late)
+        built = self.read_models()
+        StudentCirculationStat.objects.update(loans=99)
+        out = StringIO()
+        call_command("replay_projection", "--all", "--batch-size", "2", stdout=out)
+        self.assertIn("Replayed student_stats: 4 events", out.getvalue())
+        self.assertEqual(self.read_models(), built)
+        with self.assertRaises(CommandError):
+            call_command("replay_projection", stdout=StringIO())
+
+    def test_worker_task_catches_up(self):
+        circulation.issue_book(self.book, self.students[0])
+        self.assertEqual(jobs.project_circulation(), dict.fromkeys(projections.PROJECTORS, 1))
+        self.assertEqual(CurrentLoan.objects.count(), 1)
+
+
+class VersionedCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = make_user("lib@example.com", role="librarian", is_staff=True)
+        cls.student = make_user("stu@example.com")
+        cls.book = Book.objects.create(title="Dune", copies_total=2, copies_available=2)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_dashboard_is_cached_until_circulation_bumps_version(self):
+        self.client.force_login(self.librarian)
+        url = reverse("core:librarian_dashboard")
+        self.client.get(url)
+        # Warm: only the session lookup hits the database.
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.context["issued_books"], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            circulation.issue_book(self.book, self.student)
+        response = self.client.get(url)
+        self.assertEqual(response.context["issued_books"], 1)
+        self.assertEqual(caching.cache_stats()["hits"], 1)
+        self.assertEqual(caching.cache_stats()["misses"], 2)
+
+    def test_add_book_bumps_version(self):
+        self.client.force_login(self.librarian)
+        version = caching.library_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("core:books_add"), {"title": "Emma"})
+        self.assertRedirects(response, reverse("core:books_add"))
+        self.assertEqual(caching.library_version(), version + 1)
+
+    def test_version_is_not_bumped_by_rolled_back_work(self):
+        version = caching.library_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(circulation.NoCopiesAvailable):
+                circulation.issue_book(Book.objects.create(title="Gone", copies_available=0), self.student)
+        self.assertEqual(caching.library_version(), version)
+
+    def test_stats_endpoint_is_staff_only(self):
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(reverse("core:cache_stats")).status_code, 302)
+        self.client.force_login(self.librarian)
+        caching.cached("probe", lambda: 1)
+        caching.cached("probe", lambda: 1)
+        self.assertEqual(
+            self.client.get(reverse("core:cache_stats")).json()["hit_rate"], 0.5
+        )
+
+
+class StudentSummaryTests(TestCase):
+    today = date(2025, 6, 30)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = make_user("stu@example.com")
+        cls.other = make_user("other@example.com")
+        cls.books = [Book.objects.create(title=f"Book {n}", copies_total=2, copies_available=2) for n in range(5)]
+
+        def loan(book, due_in, action="issued", fine="0.00"):
+            return BookIssue.objects.create(
+                book=book, student=cls.student, action=action,
+                due_date=cls.today + timedelta(days=due_in), fine_amount=fine,
+            )
+
+        loan(cls.books[0], -4, action="overdue")
+        loan(cls.books[1], 2)
+        loan(cls.books[2], 10)
+        ledger.charge_returns([loan(cls.books[3], -1, action="returned", fine=Decimal("3.00"))])
+        events.record(events.from_issues(BookIssue.objects.order_by("pk")))
+        projections.catch_up()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counters_balance_and_loans_in_three_queries(self):
+        with self.assertNumQueries(3):
+            summary = student_summary.compute_summary(self.student.pk, today=self.today)
+        self.assertEqual(
+            {key: summary[key] for key in ("current", "due_soon", "overdue", "history")},
+            {"current": 3, "due_soon": 1, "overdue": 1, "history": 4},
+        )
+        # $3 charged on return plus $4 accruing on the overdue loan.
+        self.assertEqual(summary["fines_owed"], Decimal("7.00"))
+        self.assertEqual([issue.book.title for issue in summary["loans"]], ["Book 0", "Book 1", "Book 2"])
+        self.assertEqual(summary["loans"][0].days_late, 4)
+        self.assertEqual([issue.book.title for issue in summary["recent_returns"]], ["Book 3"])
+
+        with self.assertNumQueries(2):
+            summary = student_summary.compute_summary(self.other.pk, today=self.today)
+        self.assertEqual((summary["history"], summary["fines_owed"], summary["loans"]), (0, 0, []))
+
+    def test_cached_until_the_student_issues_or_returns(self):
+        self.client.force_login(self.student)
+        url = reverse("core:student_dashboard")
+        self.client.get(url)
+        other_summary = student_summary.student_summary(self.other.pk)
+        # Warm: only the session lookup hits the database.
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(len(response.context["issued_books"]), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            issue = circulation.issue_book(self.books[4], self.student)
+        response = self.client.get(reverse("core:student_issued_books"))
+        self.assertEqual(response.context["summary"]["current"], 4)
+        self.assertContains(response, "Book 4")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            circulation.return_book(issue)
+        response = self.client.get(url)
+        self.assertEqual(response.context["summary"]["current"], 3)
+        self.assertEqual(response.context["summary"]["recent_returns"][0].pk, issue.pk)
+
+        # Other students' summaries are not invalidated.
+        with self.assertNumQueries(0):
+            self.assertEqual(student_summary.student_summary(self.other.pk), other_summary)
+
+
+class BookSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = make_user("stu@example.com")
+        cls.dune = Book.objects.create(title="Dune", author="Frank Herbert", isbn="9780441013593")
+        cls.messiah = Book.objects.create(title="Dune Messiah", author="Frank Herbert")
+        cls.emma = Book.objects.create(title="Emma", author="Jane Austen", publisher="Penguin")
+        cls.pride = Book.objects.create(title="Pride and Prejudice", author="Jane Austen")
+
+    def setUp(self):
+        search.clear_index()
+
+    def titles(self, query):
+        return [book.title for book in search.search_books(query)]
+
+    def test_title_matches_rank_above_author_matches(self):
+        Book.objects.create(title="Herbert's Garden", author="Someone Else")
+        self.assertEqual(self.titles("herbert")[0], "Herbert's Garden")
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.titles("dune messiah"), ["Dune Messiah"])
+        self.assertEqual(self.titles("austen pride"), ["Pride and Prejudice"])
+
+    def test_typos_and_prefixes_still_match(self):
+        self.assertEqual(self.titles("austin"), ["Emma", "Pride and Prejudice"])
+        self.assertIn("Pride and Prejudice", self.titles("prejudise"))
+        self.assertEqual(self.titles("messi"), ["Dune Messiah"])
+
+    def test_isbn_and_publisher(self):
+        self.assertEqual(self.titles("9780441013593"), ["Dune"])
+        self.assertEqual(self.titles("penguin"), ["Emma"])
+
+    def test_no_match_and_blank_query(self):
+        self.assertEqual(self.titles("zzzz"), [])
+        self.assertEqual(self.titles("   "), [])
+
+    def test_index_picks_up_new_books(self):
+        self.assertEqual(self.titles("persuasion"), [])
+        Book.objects.create(title="Persuasion", author="Jane Austen")
+        self.assertEqual(self.titles("persuasion"), ["Persuasion"])
+
+    def test_search_view(self):
+        url = reverse("core:search_books")
+        self.assertEqual(self.client.get(url, {"q": "dune"}).status_code, 302)
+        self.client.force_login(self.student)
+        response = self.client.get(url, {"q": "dune", "format": "json", "limit": "1"})
+        results = response.json()["results"]
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["title"], "Dune")
+        response = self.client.get(url, {"q": "emma"})
+        self.assertContains(response, "Jane Austen")
+
+
+class StudentAutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = make_user("lib@example.com", role="librarian")
+        cls.priya = make_user("priya.sharma@example.com", first_name="Priya", last_name="Sharma")
+        cls.rahul = make_user("rahul@example.com", first_name="Rahul", last_name="Sharma")
+        make_user("prisha@example.com", first_name="Prisha", last_name="Iyer", is_active=False)
+        make_user("priyanka@example.com", role="teacher", first_name="Priyanka")
+        cls.book = Book.objects.create(title="Dune", copies_total=1, copies_available=1)
+
+    def setUp(self):
+        self.client.force_login(self.librarian)
+
+    def usernames(self, query, **params):
+        response = self.client.get(reverse("core:student_autocomplete"), {"q": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row["username"] for row in response.json()["results"]]
+
+    def test_prefix_on_any_field_active_students_only(self):
+        self.assertEqual(self.usernames("pri"), ["priya.sharma@example.com"])
+        self.assertEqual(self.usernames("SHAR"), ["priya.sharma@example.com", "rahul@example.com"])
+        self.assertEqual(self.usernames("rahul@"), ["rahul@example.com"])
+        self.assertEqual(self.usernames("arma"), [])
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.usernames("sharma rah"), ["rahul@example.com"])
+
+    def test_short_queries_and_limit(self):
+        self.assertEqual(self.usernames("p"), [])
+        self.assertEqual(self.usernames("sharma", limit=1), ["priya.sharma@example.com"])
+
+    def test_librarians_only(self):
+        self.client.force_login(self.priya)
+        response = self.client.get(reverse("core:student_autocomplete"), {"q": "pri"})
+        self.assertNotEqual(response.status_code, 200)
+
+    def test_issue_form_does_not_list_students(self):
+        url = reverse("core:issue_book", args=[self.book.pk])
+        with self.assertNumQueries(2):  # session, book
+            response = self.client.get(url)
+        self.assertContains(response, reverse("core:student_autocomplete"))
+        self.assertNotContains(response, "rahul@example.com")
+
+        response = self.client.post(url, {"student_email": "nobody@example.com"})
+        self.assertContains(response, 'value="nobody@example.com"')
+        response = self.client.post(url, {"student_email": "rahul@example.com"})
+        self.assertRedirects(response, reverse("core:books_list"), fetch_redirect_response=False)
+        self.assertTrue(BookIssue.objects.filter(student=self.rahul, book=self.book).exists())
+
+
+class SessionUserTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = make_user("lib@example.com", role="librarian", first_name="Lena")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.librarian)
+
+    def user_queries(self, path):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(path)
+        return response, [q["sql"] for q in captured if '"core_user"' in q["sql"]]
+
+    def test_registry_covers_every_role(self):
+        self.assertEqual(set(roles.ROLES), {value for value, _ in User.ROLE_CHOICES})
+        self.assertEqual(roles.dashboard_for(self.librarian), "core:librarian_dashboard")
+        self.assertTrue(roles.has_permission(self.librarian, "issue_books"))
+        self.assertFalse(roles.has_permission(make_user("stu@example.com"), "issue_books"))
+        with self.assertRaises(ImproperlyConfigured):
+            views.role_required("janitor")
+
+    def test_login_redirects_through_registry(self):
+        make_user("teach@example.com", role="teacher")
+        self.client.logout()
+        response = self.client.post(
+            reverse("core:login"), {"email": "teach@example.com", "password": "pass12345"}
+        )
+        self.assertRedirects(response, reverse("core:teacher_dashboard"), fetch_redirect_response=False)
+
+    def test_role_checked_pages_skip_the_user_table(self):
+        response, queries = self.user_queries(reverse("core:search_books"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+        self.assertEqual(response.context["request"].user.first_name, "Lena")
+        # Fields outside the projection still load on demand.
+        user = response.context["request"].user
+        self.assertEqual(user.password, User.objects.get(pk=user.pk).password)
+
+    def test_saving_the_user_invalidates_session_copies(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.librarian.pk).update(role="teacher")
+            User.objects.get(pk=self.librarian.pk).save()
+        response, queries = self.user_queries(reverse("core:librarian_dashboard"))
+        self.assertEqual(len(queries), 1)
+        self.assertRedirects(response, reverse("core:home"), fetch_redirect_response=False)
+
+    def test_password_change_ends_other_sessions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.librarian.set_password("another-pass-987")
+            self.librarian.save()
+        response = self.client.get(reverse("core:search_books"))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith(settings.LOGIN_URL))
+
+    @override_settings(SESSION_USER_TTL=300)
+    def test_ttl_is_capped_without_a_shared_cache(self):
+        # Another worker's version bump never reaches a local-memory cache.
+        self.assertEqual(session_user.ttl(), session_user.LOCAL_CACHE_TTL)
+        with override_settings(CACHES={"default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": "redis://localhost:6379/0",
+        }}):
+            self.assertEqual(session_user.ttl(), 300)
+
+    @override_settings(SESSION_USER_TTL=0)
+    def test_expired_copy_is_checked_again(self):
+        _, queries = self.user_queries(reverse("core:search_books"))
+        self.assertEqual(len(queries), 1)
+
+    @override_settings(SESSION_USER_TTL=0)
+    def test_check_of_an_unchanged_user_leaves_the_session_alone(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse("core:search_books"))
+        self.assertFalse(response.context["request"].session.modified)
+        self.assertFalse([q for q in captured if q["sql"].startswith("UPDATE") and "django_session" in q["sql"]])
+
+
+class SessionSettingsTests(TestCase):
+    def test_purge_sessions_deletes_only_expired(self):
+        now = timezone.now()
+        Session.objects.bulk_create([
+            Session(session_key=f"old{n:05d}", session_data="", expire_date=now - timedelta(days=1))
+            for n in range(7)
+        ] + [Session(session_key="live00000", session_data="", expire_date=now + timedelta(days=1))])
+        out = StringIO()
+        call_command("purge_sessions", "--batch-size", "3", stdout=out)
+        self.assertIn("Deleted 7 expired sessions", out.getvalue())
+        self.assertEqual(list(Session.objects.values_list("session_key", flat=True)), ["live00000"])
+
+    @override_settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies")
+    def test_purge_sessions_with_signed_cookies(self):
+        out = StringIO()
+        call_command("purge_sessions", stdout=out)
+        self.assertIn("keeps no sessions in the database", out.getvalue())
+
+    def test_login_benchmark_leaves_nothing_behind(self):
+        users = User.objects.count()
+        report = benchmark.login_throughput(
+            attempts=2, scenarios=[("db", "fast"), ("signed_cookies", "fast")]
+        )
+        self.assertEqual(
+            [(row["session_backend"], row["attempts"]) for row in report["results"]],
+            [("db", 2), ("signed_cookies", 2)],
+        )
+        self.assertTrue(all(row["logins_per_s"] > 0 for row in report["results"]))
+        self.assertEqual(User.objects.count(), users)
+
+
+class QueryPlanTests(TestCase):
+    def test_isbn_is_unique_but_optional(self):
+        Book.objects.create(title="No ISBN")
+        Book.objects.create(title="Also none")
+        Book.objects.create(title="Dune", isbn="9780441013593")
+        with self.assertRaises(IntegrityError):
+            Book.objects.create(title="Dune again", isbn="9780441013593")
+
+    def test_seq_scans_walks_the_whole_plan(self):
+        plan = {
+            "Node Type": "Limit",
+            "Plans": [{
+                "Node Type": "Nested Loop",
+                "Plans": [
+                    {"Node Type": "Index Scan", "Relation Name": "core_bookissue"},
+                    {"Node Type": "Seq Scan", "Relation Name": "core_book"},
+                    {"Node Type": "Seq Scan", "Relation Name": "tiny_lookup"},
+                ],
+            }],
+        }
+        self.assertEqual(query_plans.seq_scans(plan), ["core_book"])
+        self.assertEqual(query_plans.seq_scans(plan["Plans"][0]["Plans"][0]), [])
+
+    def test_hot_queries_need_sample_rows(self):
+        with self.assertRaises(query_plans.NoSampleData):
+            query_plans.hot_queries()
+        book = Book.objects.create(title="Dune", isbn="9780441013593")
+        circulation.issue_book(book, make_user("stu@example.com"))
+        names = [name for name, _ in query_plans.hot_queries()]
+        self.assertIn("overdue_sweep_candidates", names)
+
+    @skipUnless(connection.vendor == "postgresql", "EXPLAIN checks need PostgreSQL")
+    def test_hot_queries_avoid_seq_scans(self):
+        book = Book.objects.create(title="Dune", isbn="9780441013593")
+        circulation.issue_book(book, make_user("stu@example.com"))
+        for name, scanned, _, _ in query_plans.check_plans(query_plans.hot_queries()):
+            self.assertEqual(scanned, [], name)
+
+    def test_command_needs_postgres(self):
+        if connection.vendor == "postgresql":
+            self.skipTest("runs the real check on PostgreSQL")
+        with self.assertRaisesMessage(CommandError, "PostgreSQL"):
+            call_command("check_query_plans", stdout=StringIO())
+
+
+class SeedAndBenchmarkTests(TestCase):
+    def snapshot(self):
+        return (
+            list(Book.objects.order_by("isbn").values_list("isbn", "title", "copies_available")),
+            list(BookIssue.objects.order_by("issued_at", "book__isbn", "student__username").values_list(
+                "book__isbn", "student__username", "action", "due_date", "fine_amount"
+            )),
+        )
+
+    def test_seed_is_deterministic_and_consistent(self):
+        today = date(2025, 6, 30)
+        created = seeding.seed(users=60, books=30, issues=400, seed=7, today=today)
+        self.assertEqual(created, {"users": 60, "books": 30, "issues": 400})
+        self.assertEqual(User.objects.filter(role="librarian").count(), 1)
+        first = self.snapshot()
+
+        for book in Book.objects.all():
+            out = book.issues.filter(action__in=BookIssue.OPEN_ACTIONS).count()
+            self.assertEqual(book.copies_available, book.copies_total - out)
+        self.assertTrue(BookIssue.objects.filter(action="overdue").exists())
+        self.assertTrue(BookIssue.objects.filter(action="returned", fine_amount__gt=0).exists())
+        self.assertEqual(rollups.totals()["issues"], 400)
+
+        seeding.flush()
+        self.assertFalse(Book.objects.exists())
+        seeding.seed(users=60, books=30, issues=400, seed=7, today=today)
+        self.assertEqual(self.snapshot(), first)
+
+    def test_benchmark_covers_every_route(self):
+        seeding.seed(users=40, books=10, issues=60)
+        report = benchmark.run(iterations=2)
+        rows = {row["name"]: row for row in report["results"]}
+        self.assertEqual(len(rows), len([p for p in urlpatterns if p.name]))
+        self.assertEqual(rows["issue_book"]["status"], 200)
+        self.assertEqual(rows["bulk_return_books"]["status"], 200)
+        self.assertEqual(rows["student_issued_books"]["status"], 200)
+        for row in rows.values():
+            self.assertLessEqual(row["p50_ms"], row["p95_ms"])
+        json.dumps(report)
+
+        slower = json.loads(json.dumps(report))
+        slower["results"][0]["queries"] += 1
+        self.assertEqual(len(benchmark.compare(report, slower)), 1)
+        self.assertEqual(benchmark.compare(report, report), [])
+
+    def test_percentile(self):
+        self.assertEqual(benchmark.percentile([5, 1, 3, 2, 4], 50), 3)
+        self.assertEqual(benchmark.percentile(list(range(1, 101)), 95), 95)
+
+    def test_loadtest_keeps_connections_alive(self):
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                body = self.headers.get("Cookie", "").encode()
+                self.send_response(200 if body == b"sessionid=abc" else 403)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f"http://127.0.0.1:{server.server_port}/analytics/"
+
+        report = loadtest.run(url, concurrency=2, duration=0.3, cookies={"sessionid": "abc"})
+        self.assertGreater(report["requests"], 2)
+        self.assertEqual(list(report["statuses"]), ["200"])
+        self.assertLessEqual(report["p50_ms"], report["p95_ms"])
+        with self.assertRaises(loadtest.LoadTestError):
+            loadtest.run("https://127.0.0.1/", duration=0.1)
+
+
+class ProfilingMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = make_user("lib@example.com", role="librarian", is_staff=True)
+        cls.student = make_user("stu@example.com")
+        for n in range(6):
+            book = Book.objects.create(title=f"Book {n}")
+            BookIssue.objects.create(book=book, student=cls.student, action="returned")
+
+    def setUp(self):
+        profiling.store.reset()
+
+    def view_stats(self, name):
+        views = profiling.store.snapshot()["views"]
+        return next(row for row in views if row["view"] == name)
+
+    def test_records_timings_per_url_name(self):
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse("core:all_book_issue_history"))
+        self.assertRegex(
+            response["Server-Timing"],
+            r'^sql;dur=[\d.]+;desc="\d+ queries", render;dur=[\d.]+, total;dur=[\d.]+$',
+        )
+        stats = self.view_stats("core:all_book_issue_history")
+        self.assertEqual(stats["requests"], 1)
+        self.assertGreater(stats["avg_queries"], 0)
+        self.assertGreater(stats["avg_render_ms"], 0)
+        self.assertEqual(stats["n_plus_one_requests"], 0)
+        self.assertEqual(sum(stats["histograms"]["total_ms"].values()), 1)
+
+    def test_capture_counts_queries_on_other_threads_and_inside_requests(self):
+        self.client.force_login(self.librarian)
+
+        def query_on_thread():
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            finally:
+                connection.close()
+
+        with profiling.capture() as captured, ThreadPoolExecutor(max_workers=1) as pool:
+            pool.submit(contextvars.copy_context().run, query_on_thread).result()
+            response = self.client.get(reverse("core:all_book_issue_history"))
+        # The request's own (sampled) profile reports to the enclosing one.
+        in_request = int(response["Server-Timing"].split('desc="')[1].split()[0])
+        self.assertEqual(captured.queries, 1 + in_request)
+
+    def test_flags_repeated_queries(self):
+        def view(request):
+            from django.http import HttpResponse
+            titles = [issue.book.title for issue in BookIssue.objects.all()]
+            return HttpResponse(", ".join(titles))
+
+        request = RequestFactory().get("/")
+        with self.assertLogs("core.profiling", "WARNING") as logs:
+            profiling.ProfilingMiddleware(view)(request)
+        self.assertIn("Possible N+1", logs.output[0])
+        stats = self.view_stats("<unresolved>")
+        self.assertEqual(stats["n_plus_one_requests"], 1)
+        self.assertEqual(stats["duplicate_sql"][0]["max_per_request"], 6)
+
+    @override_settings(PROFILING_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_recorded(self):
+        self.client.force_login(self.librarian)
+        response = self.client.get(reverse("core:all_book_issue_history"))
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(profiling.store.snapshot()["views"], [])
+
+    def test_endpoint_is_staff_only_and_resets(self):
+        url = reverse("core:profiling_stats")
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.librarian)
+        self.client.get(reverse("core:all_book_issue_history"))
+        names = [row["view"] for row in self.client.get(url).json()["views"]]
+        self.assertIn("core:all_book_issue_history", names)
+        self.client.post(url)
+        # Only the reset request itself is left.
+        names = [row["view"] for row in profiling.store.snapshot()["views"]]
+        self.assertEqual(names, ["core:profiling_stats"])
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = make_user("lib@example.com", role="librarian")
+        cls.student = make_user("stu@example.com")
+        cls.book = Book.objects.create(title="Dune", copies_total=2, copies_available=2)
+
+    def setUp(self):
+        self.router = db_routing.ReplicaRouter()
+
+    def read_from(self, request):
+        """The alias a replica-scoped view sees for `request`, through the pin middleware."""
+        @db_routing.reads_from_replica
+        def view(request):
+            return HttpResponse(self.router.db_for_read(Book) or "default")
+
+        return db_routing.ReplicaPinMiddleware(view)(request)
+
+    def test_router_reads_from_replica_only_in_scope(self):
+        self.assertIsNone(self.router.db_for_read(Book))
+        with db_routing.replica_reads():
+            self.assertEqual(self.router.db_for_read(Book), "replica")
+            self.assertEqual(self.router.db_for_write(Book), "default")
+            with db_routing.primary_reads():
+                self.assertIsNone(self.router.db_for_read(Book))
+        self.assertIs(self.router.allow_migrate("replica", "core"), False)
+        self.assertIsNone(self.router.allow_migrate("default", "core"))
+        with override_settings(DATABASE_REPLICAS=[]), db_routing.replica_reads():
+            self.assertIsNone(self.router.db_for_read(Book))
+
+    def test_writes_pin_the_browser_to_the_primary(self):
+        factory = RequestFactory()
+        self.assertEqual(self.read_from(factory.get("/")).content, b"replica")
+        response = self.read_from(factory.post("/"))
+        self.assertEqual(response.content, b"default")
+        cookie = response.cookies[db_routing.PIN_COOKIE]
+        self.assertEqual(cookie["max-age"], db_routing.pin_seconds())
+
+        pinned = factory.get("/")
+        pinned.COOKIES[db_routing.PIN_COOKIE] = cookie.value
+        self.assertEqual(self.read_from(pinned).content, b"default")
+        forged = factory.get("/")
+        forged.COOKIES[db_routing.PIN_COOKIE] = "1"
+        self.assertEqual(self.read_from(forged).content, b"replica")
+
+    def test_issuing_sets_the_pin(self):
+        self.client.force_login(self.librarian)
+        response = self.client.post(
+            reverse("core:issue_book", args=[self.book.pk]), {"student_email": self.student.username}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(db_routing.PIN_COOKIE, response.cookies)
+        # Pinned, so the history read after the redirect stays on the primary.
+        response = self.client.get(reverse("core:all_book_issue_history"))
+        self.assertContains(response, "Dune")
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = make_user("lib@example.com", role="librarian")
+        cls.alice = make_user("alice@example.com")
+        cls.bob = make_user("bob@example.com")
+        cls.book = Book.objects.create(title='Dune, "Deluxe" <Ed>', isbn="9780441013593", copies_total=3)
+        BookIssue.objects.create(book=cls.book, student=cls.alice, action="returned", fine_amount=2)
+        BookIssue.objects.create(book=cls.book, student=cls.bob, action="issued")
+
+    def download(self, url, **params):
+        self.client.force_login(self.librarian)
+        response = self.client.get(url, params)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content)
+
+    def test_issue_csv_uses_history_filters(self):
+        response, body = self.download(reverse("core:export_issues"), student=self.alice.pk)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertIn("attachment;", response["Content-Disposition"])
+        rows = list(csv.reader(body.decode("utf-8-sig").splitlines()))
+        self.assertEqual(rows[0][:3], ["Issue ID", "Book ID", "Book"])
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][2], 'Dune, "Deluxe" <Ed>')
+        self.assertEqual(rows[1][5], "alice@example.com")
+        self.assertEqual(rows[1][10], "2.00")
+
+    def test_book_xlsx_is_a_valid_workbook(self):
+        response, body = self.download(reverse("core:export_books"), format="xlsx")
+        self.assertTrue(response["Content-Disposition"].endswith('.xlsx"'))
+        with zipfile.ZipFile(BytesIO(body)) as archive:
+            self.assertIsNone(archive.testzip())
+            sheet = archive.read("xl/worksheets/sheet1.xml").decode()
+            self.assertIn("[Content_Types].xml", archive.namelist())
+        self.assertIn('Dune, "Deluxe" &lt;Ed&gt;', sheet)
+        self.assertIn("<c><v>3</v></c>", sheet)
+
+    def test_rows_are_streamed_in_chunks(self):
+        Book.objects.bulk_create(Book(title=f"Extra {n}") for n in range(exports.ROWS_PER_CHUNK * 2))
+        header, rows = exports.book_rows()
+        chunks = list(exports.stream_csv(header, rows))
+        self.assertGreaterEqual(len(chunks), 3)
+        with self.assertNumQueries(1):
+            chunks = list(exports.stream_xlsx(*exports.book_rows()))
+        self.assertGreater(len(chunks), 2)
+
+    def test_export_is_librarian_only(self):
+        self.client.force_login(self.alice)
+        self.assertEqual(self.client.get(reverse("core:export_issues")).status_code, 302)
+
+
+
+TASK_CALLS = []
+
+
+@tasks.task("tests.flaky", max_attempts=2, retry_delay=60)
+def flaky_task(failures=0):
+    TASK_CALLS.append(failures)
+    if len(TASK_CALLS) <= failures:
+        raise RuntimeError("boom")
+    return {"calls": len(TASK_CALLS), "on": date(2025, 6, 30)}
+
+
+class BackgroundTaskTests(TestCase):
+    def setUp(self):
+        TASK_CALLS.clear()
+
+    def test_task_runs_and_stores_its_result(self):
+        task = tasks.enqueue("tests.flaky")
+        self.assertEqual(tasks.run_pending(), 1)
+        task.refresh_from_db()
+        self.assertEqual(task.status, "succeeded")
+        self.assertEqual(task.result, {"calls": 1, "on": "2025-06-30"})
+        self.assertEqual(task.attempts, 1)
+        self.assertEqual(task.locked_by, "")
+        self.assertEqual(tasks.run_pending(), 0)
+
+    def test_failures_retry_with_backoff_then_fail(self):
+        task = tasks.enqueue("tests.flaky", {"failures": 5})
+        with self.assertLogs("core.tasks", "WARNING"):
+            tasks.run_pending()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ("queued", 1))
+        self.assertIn("RuntimeError: boom", task.last_error)
+        self.assertGreater(task.run_at, timezone.now() + timedelta(seconds=50))
+
+        with self.assertLogs("core.tasks", "ERROR"):
+            tasks.run_pending(now=task.run_at)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ("failed", 2))
+        self.assertIsNotNone(task.finished_at)
+
+        unknown = BackgroundTask.objects.create(name="tests.missing")
+        with self.assertLogs("core.tasks", "ERROR"):
+            tasks.run_pending()
+        unknown.refresh_from_db()
+        self.assertEqual((unknown.status, unknown.attempts), ("failed", 1))
+
+    def test_delayed_tasks_and_keys(self):
+        later = tasks.enqueue("tests.flaky", delay=3600)
+        self.assertEqual(tasks.run_pending(), 0)
+        self.assertEqual(tasks.enqueue("tests.flaky", key="once").pk, tasks.enqueue("tests.flaky", key="once").pk)
+        self.assertEqual(tasks.run_pending(now=later.run_at), 2)
+        with self.assertRaises(tasks.UnknownTask):
+            tasks.enqueue("tests.missing")
+
+    def test_claimed_task_is_not_claimed_twice(self):
+        tasks.enqueue("tests.flaky")
+        first = tasks.claim("worker-a")
+        self.assertEqual(len(first), 1)
+        self.assertEqual(tasks.claim("worker-b"), [])
+
+    def test_expired_lease_is_requeued(self):
+        task = tasks.enqueue("tests.flaky")
+        [claimed] = tasks.claim("worker-a")
+        later = timezone.now() + timedelta(seconds=tasks.lease() + 1)
+        self.assertEqual(tasks.requeue_expired(now=later), 1)
+        task.refresh_from_db()
+        self.assertEqual(task.status, "queued")
+        # The lost worker's outcome is ignored.
+        with self.assertLogs("core.tasks", "WARNING"):
+            tasks.execute(claimed)
+        task.refresh_from_db()
+        self.assertEqual(task.status, "queued")
+
+    @override_settings(TASK_SCHEDULE={"nightly": {"task": "tests.flaky", "every": 86400, "offset": 3600}})
+    def test_schedule_enqueues_each_period_once(self):
+        now = datetime(2025, 6, 30, 12, tzinfo=dt_timezone.utc)
+        [row] = tasks.schedule(now)
+        self.assertEqual(row.run_at, datetime(2025, 6, 30, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(tasks.schedule(now + timedelta(hours=6))[0].pk, row.pk)
+        self.assertNotEqual(tasks.schedule(now + timedelta(days=1))[0].pk, row.pk)
+
+    def test_prune_keeps_failed_tasks(self):
+        old = timezone.now() - timedelta(days=30)
+        BackgroundTask.objects.create(name="tests.flaky", status="succeeded", finished_at=old)
+        BackgroundTask.objects.create(name="tests.flaky", status="failed", finished_at=old)
+        self.assertEqual(tasks.prune(), 1)
+        self.assertEqual(BackgroundTask.objects.get().status, "failed")
+
+    def test_library_jobs(self):
+        student = make_user("late@example.com", first_name="Late")
+        book = Book.objects.create(title="Dune")
+        BookIssue.objects.create(
+            book=book, student=student, action="issued", due_date=timezone.localdate() - timedelta(days=3)
+        )
+        sweep = tasks.enqueue("core.sweep_overdue")
+        digests = tasks.enqueue("core.send_reminders", delay=1)
+        tasks.run_pending()
+        tasks.run_pending(now=digests.run_at)
+        sweep.refresh_from_db()
+        digests.refresh_from_db()
+        self.assertEqual(sweep.result["marked"], 1)
+        self.assertEqual(digests.result, {"students": 1, "loans": 1, "sent": 1, "batches": 1})
+        self.assertEqual(mail.outbox[0].to, ["late@example.com"])
+        self.assertIn("$3.00", mail.outbox[0].body)
+
+    def test_export_runs_in_the_background(self):
+        librarian = make_user("lib@example.com", role="librarian")
+        Book.objects.create(title="Dune")
+        self.client.force_login(librarian)
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            response = self.client.post(reverse("core:export_books") + "?format=csv")
+            self.assertEqual(response.status_code, 202)
+            status_url = response["Location"]
+            self.assertEqual(response.json()["task"]["status"], "queued")
+            self.assertEqual(self.client.get(status_url).json()["status"], "queued")
+
+            tasks.run_pending()
+            data = self.client.get(status_url).json()
+            self.assertEqual(data["status"], "succeeded")
+            download = self.client.get(data["download"])
+            # Consuming the stream closes the file; closing again would fire
+            # request_finished and close the test's database connection.
+            body = b"".join(download.streaming_content).decode("utf-8-sig")
+        self.assertIn("attachment;", download["Content-Disposition"])
+        self.assertIn("Dune", body)
+
+
+
+class CountingEmailBackend(locmem.EmailBackend):
+    opened = 0
+
+    def open(self):
+        type(self).opened += 1
+        return True
+
+
+class ReminderTests(TestCase):
+    today = date(2025, 6, 30)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = make_user("alice@example.com", first_name="Alice")
+        cls.bob = make_user("bob@example.com")
+        cls.carol = make_user("carol@example.com", is_active=False)
+        books = [Book.objects.create(title=f"Book {n}", author="Author") for n in range(6)]
+
+        def loan(book, student, due_in, action="issued"):
+            BookIssue.objects.create(
+                book=book, student=student, action=action, due_date=cls.today + timedelta(days=due_in)
+            )
+
+        loan(books[0], cls.alice, -4, action="overdue")
+        loan(books[1], cls.alice, 2)
+        loan(books[2], cls.alice, 10)  # not due yet
+        loan(books[3], cls.alice, -1, action="returned")
+        loan(books[4], cls.bob, 0)
+        loan(books[5], cls.carol, -2)  # inactive account
+
+    def test_one_digest_per_student_from_one_query(self):
+        with self.assertNumQueries(1):
+            stats = reminders.send_reminders(today=self.today)
+        self.assertEqual(stats, {"students": 2, "loans": 3, "sent": 2, "batches": 1})
+        alice, bob = sorted(mail.outbox, key=lambda m: m.to)
+        self.assertEqual(alice.subject, "Library reminder: 1 overdue, 1 due soon")
+        self.assertIn("Hello Alice,", alice.body)
+        self.assertIn("- Book 0 by Author: due 2025-06-26, 4 days late, fine $4.00", alice.body)
+        self.assertIn("- Book 1 by Author: due 2025-07-02 (in 2 days)", alice.body)
+        self.assertNotIn("Book 2", alice.body)
+        self.assertNotIn("Book 3", alice.body)
+        self.assertEqual(bob.subject, "Library reminder: 1 due soon")
+        self.assertIn("Hello bob@example.com,", bob.body)
+        self.assertIn("(today)", bob.body)
+
+    def test_batches_share_one_connection(self):
+        CountingEmailBackend.opened = 0
+        stats = reminders.send_reminders(today=self.today, batch_size=1, connection=CountingEmailBackend())
+        self.assertEqual((stats["sent"], stats["batches"]), (2, 2))
+        self.assertEqual(CountingEmailBackend.opened, 1)
+
+    def test_days_ahead_and_command(self):
+        self.assertEqual(reminders.send_reminders(today=self.today, days=0)["loans"], 2)
+        out = StringIO()
+        call_command("send_reminders", "--date", "2025-06-30", "--days", "10", stdout=out)
+        self.assertIn("Sent 2 digests covering 4 loans to 2 students", out.getvalue())
+
+class TaskWorkerTests(TransactionTestCase):
+    """The threaded worker, whose threads use their own connections."""
+
+    def setUp(self):
+        TASK_CALLS.clear()
+
+    @override_settings(TASK_SCHEDULE={})
+    def test_worker_drains_due_tasks(self):
+        for _ in range(4):
+            tasks.enqueue("tests.flaky")
+        later = tasks.enqueue("tests.flaky", delay=3600)
+        out = StringIO()
+        call_command("run_tasks", "--once", "--concurrency", "2", "--poll-interval", "0.05", stdout=out)
+        self.assertIn("Ran 4 tasks (4 succeeded", out.getvalue())
+        self.assertEqual(BackgroundTask.objects.filter(status="succeeded").count(), 4)
+        later.refresh_from_db()
+        self.assertEqual(later.status, "queued")
+
+MARC_RECORD = {
+    "leader": "00000nam a2200000 a 4500",
+    "fields": [
+        {"001": "ocm0001"},
+        {"020": {"ind1": " ", "ind2": " ", "subfields": [{"a": "0-441-01359-7 (pbk.)"}]}},
+        {"100": {"ind1": "1", "ind2": " ", "subfields": [{"a": "Herbert, Frank."}]}},
+        {"245": {"ind1": "1", "ind2": "0", "subfields": [{"a": "Dune :"}, {"b": "a novel /"}]}},
+        {"264": {"ind1": " ", "ind2": "1", "subfields": [{"b": "Ace,"}, {"c": "c2005."}]}},
+        {"852": {"ind1": " ", "ind2": " ", "subfields": [{"b": "MAIN"}]}},
+        {"852": {"ind1": " ", "ind2": " ", "subfields": [{"b": "ANNEX"}]}},
+    ],
+}
+
+
+class CatalogueImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = make_user("lib@example.com", role="librarian")
+        cls.student = make_user("stu@example.com")
+
+    def run_csv(self, text, **kwargs):
+        return book_import.run_import(BytesIO(text.encode()), source="books.csv", **kwargs)
+
+    def test_normalise_isbn(self):
+        self.assertEqual(book_import.normalise_isbn("0-441-01359-7"), "9780441013593")
+        self.assertEqual(book_import.normalise_isbn("978-0-441-01359-3"), "9780441013593")
+        self.assertEqual(book_import.normalise_isbn("080442957X"), "9780804429573")
+        self.assertIsNone(book_import.normalise_isbn("0-441-01359-8"))
+        self.assertIsNone(book_import.normalise_isbn(""))
+
+    def test_csv_upserts_and_keeps_loans_consistent(self):
+        book = Book.objects.create(title="Dune", isbn="9780441013593", copies_total=3, copies_available=3)
+        circulation.issue_book(book, self.student)  # one copy out
+        job = self.run_csv(
+            "ISBN,Title,Author,Copies,Year\n"
+            "0-441-01359-7,Dune,Frank Herbert,5,1965\n"
+            "9780140449136,Crime and Punishment,Dostoevsky,2,\n"
+            "9780140449136,Crime and Punishment,Fyodor Dostoevsky,4,\n"
+            "123,Bad,,1,\n"
+        )
+        self.assertEqual(job.status, "completed")
+        self.assertEqual((job.records_done, job.created, job.updated, job.rejected), (4, 1, 1, 1))
+        self.assertEqual(job.errors[0]["record"], 4)
+        book.refresh_from_db()
+        self.assertEqual((book.copies_total, book.copies_available, book.author), (5, 4, "Frank Herbert"))
+        crime = Book.objects.get(isbn="9780140449136")
+        self.assertEqual((crime.author, crime.copies_total, crime.copies_available), ("Fyodor Dostoevsky", 4, 4))
+        self.assertFalse(copies.check_counters().exists())
+
+        # Fewer copies than are out: the loaned copy is kept.
+        self.run_csv("isbn,title,copies\n9780441013593,Dune,0\n")
+        book.refresh_from_db()
+        self.assertEqual((book.copies_total, book.copies_available), (1, 0))
+        self.assertEqual(book.copies.filter(status="withdrawn").count(), 4)
+        self.assertFalse(copies.check_counters().exists())
+
+    def test_new_copies_go_to_waiting_holds(self):
+        book = Book.objects.create(title="Dune", isbn="9780441013593", copies_total=1, copies_available=1)
+        circulation.issue_book(book, self.student)
+        hold = holds.place_hold(book, make_user("next@example.com"))
+        self.run_csv("isbn,title,copies\n9780441013593,Dune,2\n")
+        hold.refresh_from_db()
+        book.refresh_from_db()
+        self.assertEqual(hold.status, "ready")
+        self.assertEqual(hold.copy.status, "on_hold")
+        self.assertEqual((book.copies_total, book.copies_available), (2, 0))
+        self.assertFalse(copies.check_counters().exists())
+
+    def test_marc_json_array_and_lines(self):
+        array = json.dumps([MARC_RECORD]).encode()
+        job = book_import.run_import(BytesIO(array), source="feed.json")
+        self.assertEqual((job.format, job.created), ("marc-json", 1))
+        book = Book.objects.get(isbn="9780441013593")
+        self.assertEqual(
+            (book.title, book.author, book.publisher, book.year_published, book.copies_total),
+            ("Dune : a novel", "Herbert, Frank", "Ace", 2005, 2),
+        )
+        lines = (json.dumps(MARC_RECORD) + "\n" + json.dumps(MARC_RECORD) + "\n").encode()
+        job = book_import.run_import(BytesIO(lines), source="feed.jsonl", batch_size=1)
+        self.assertEqual((job.records_done, job.updated), (2, 2))
+
+    def test_resumes_after_failure(self):
+        isbns = []
+        for n in range(6):
+            body = f"978000000{n:03d}"
+            isbns.append(body + book_import._isbn13_check(body))
+        text = "isbn,title\n" + "".join(f"{isbn},Book {n}\n" for n, isbn in enumerate(isbns)) + "not-an-isbn,Broken\n"
+        data = json.dumps([MARC_RECORD])[:-2]  # truncated array
+
+        with self.assertRaises(book_import.CatalogueImportError):
+            book_import.run_import(BytesIO(data.encode()), source="broken.json")
+        self.assertEqual(CatalogueImport.objects.get(source="broken.json").status, "failed")
+
+        apply_batch = book_import.apply_batch
+        calls = []
+
+        def flaky(records):
+            calls.append(len(records))
+            if len(calls) == 2:
+                raise ValueError("database went away")
+            return apply_batch(records)
+
+        with mock.patch.object(book_import, "apply_batch", flaky):
+            with self.assertRaises(ValueError):
+                self.run_csv(text, batch_size=2)
+        job = CatalogueImport.objects.get(source="books.csv")
+        self.assertEqual((job.status, job.records_done), ("failed", 2))
+        self.assertEqual(Book.objects.count(), 2)
+
+        job = self.run_csv(text, batch_size=2)
+        self.assertEqual((job.status, job.records_done, job.created), ("completed", 7, 6))
+        self.assertEqual(CatalogueImport.objects.filter(source="books.csv").count(), 1)
+
+    def test_upload_endpoint(self):
+        self.client.force_login(self.librarian)
+        upload = SimpleUploadedFile("books.csv", b"isbn,title\n9780441013593,Dune\n", content_type="text/csv")
+        response = self.client.post(reverse("core:import_books"), {"file": upload})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data["status"], data["created"]), ("completed", 1))
+        status = self.client.get(reverse("core:import_status", args=[data["id"]])).json()
+        self.assertEqual(status["records_done"], 1)
+        self.assertEqual(self.client.post(reverse("core:import_books")).status_code, 400)
+
+    def test_command_reports_progress(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as handle:
+            handle.write("isbn,title,copies\n9780441013593,Dune,2\n9780140449136,Crime,1\n")
+            handle.flush()
+            out = StringIO()
+            call_command("import_books", handle.name, "--batch-size", "1", stdout=out)
+        self.assertIn("records/s", out.getvalue())
+        self.assertIn("Imported 2 records (2 created", out.getvalue())
+
+
+try:
+    from fakeredis import FakeConnection
+except ImportError:  # optional test dependency
+    FakeConnection = None
+
+
+@skipIf(FakeConnection is None, "fakeredis is not installed")
+class RedisVersionedCacheTests(VersionedCacheTests):
+    """Same behaviour on the Redis backend, with fakeredis standing in for a server."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._redis = override_settings(CACHES={"default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": "redis://localhost:6379/0",
+            "OPTIONS": {"connection_class": FakeConnection},
+        }})
+        cls._redis.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._redis.disable()
@@ -22,10 +22,27 @@ urlpatterns = [
     # Library management URLs
     path('library/my-books/', views.student_issued_books, name='student_issued_books'),
     path('library/all-issues/', views.all_book_issue_history, name='all_book_issue_history'),
+    path('library/all-issues/export/', views.export_issues, name='export_issues'),
     path('library/available-books/', views.available_books, name='available_books'),
+    path('books/export/', views.export_books, name='export_books'),
+    path('books/import/', views.import_books, name='import_books'),
+    path('books/import/<int:import_id>/', views.import_status, name='import_status'),
+    path('books/search/', views.search_books, name='search_books'),
+    path('students/autocomplete/', views.student_autocomplete, name='student_autocomplete'),
     path('books/issue/<int:book_id>/', views.issue_book, name='issue_book'),
     path('books/return/<int:issue_id>/', views.return_book, name='return_book'),
+    path('books/scan/', views.scan_copy, name='scan_copy'),
+    path('books/<int:book_id>/hold/', views.place_hold, name='place_hold'),
+    path('holds/<int:hold_id>/', views.hold_status, name='hold_status'),
+    path('holds/<int:hold_id>/cancel/', views.cancel_hold, name='cancel_hold'),
+    path('books/bulk-issue/', views.bulk_issue_books, name='bulk_issue_books'),
+    path('books/bulk-return/', views.bulk_return_books, name='bulk_return_books'),
+    path('fines/', views.fine_balances, name='fine_balances'),
+    path('fines/<int:student_id>/', views.student_fines, name='student_fines'),
     path('analytics/', views.librarian_analytics, name='librarian_analytics'),
+    path('analytics/trends/', views.circulation_trends, name='circulation_trends'),
+    path('tasks/<int:task_id>/', views.task_status, name='task_status'),
+    path('tasks/<int:task_id>/download/', views.task_download, name='task_download'),
 
 
     # Helpful endpoints referenced from templates (add if missing in views.py)
@@ -34,4 +51,6 @@ urlpatterns = [
     path('issues/manage/', views.manage_issues, name='issues_manage'),
 
     path('profile/', views.profile, name='profile'),
+    path('ops/cache-stats/', views.cache_stats, name='cache_stats'),
+    path('ops/profiling/', views.profiling_stats, name='profiling_stats'),
 ]
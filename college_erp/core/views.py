@@ -1,41 +1,61 @@
 # college_erp/core/views.py
+import csv
+import io
+import json
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
 from django.shortcuts import render, redirect
-from datetime import datetime
-from .models import User, Book, BookIssue  # ensure these models exist in core/models.py
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from datetime import datetime, timedelta
+from .models import User, Book, BookIssue, BackgroundTask, CatalogueImport, CurrentLoan, Hold  # ensure these models exist in core/models.py
+from . import (
+    analytics, async_queries, book_import, caching, circulation, copies, db_routing, exports, holds, ledger,
+    profiling, roles, rollups, search, student_summary, tasks,
+)
+from .filters import clean_issue_filters, filter_issues
+from .pagination import clamp_page_size, paginate_balances, paginate_issues
 from django.contrib import messages
 from django.contrib.auth import authenticate, login as auth_login, logout as auth_logout
 from django.contrib.auth.decorators import login_required
-from django.db import models # Added missing import for models
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
 
 
 def role_required(required_role: str):
-    """Decorator to restrict a view to users with a specific role."""
+    """Decorator to restrict a view (sync or async) to users with a specific role (see core.roles)."""
+    if required_role not in roles.ROLES:
+        raise ImproperlyConfigured(f"Unknown role {required_role!r}.")
+
+    def denied(request):
+        messages.error(request, "You do not have permission to access this page.")
+        return redirect("core:home")
+
     def decorator(view_func):
-        @login_required
-        def _wrapped(request, *args, **kwargs):
-            if getattr(request.user, "role", None) != required_role:
-                messages.error(request, "You do not have permission to access this page.")
-                return redirect("core:home")
-            return view_func(request, *args, **kwargs)
-        return _wrapped
+        if iscoroutinefunction(view_func):
+            async def _wrapped(request, *args, **kwargs):
+                if not roles.has_role(await request.auser(), required_role):
+                    return denied(request)
+                return await view_func(request, *args, **kwargs)
+        else:
+            def _wrapped(request, *args, **kwargs):
+                if not roles.has_role(request.user, required_role):
+                    return denied(request)
+                return view_func(request, *args, **kwargs)
+        return login_required(wraps(view_func)(_wrapped))
     return decorator
 
 
 def home(request):
     # If already authenticated, redirect to relevant dashboard
-    if request.user.is_authenticated:
-        role = getattr(request.user, 'role', None)
-        if role == 'student':
-            return redirect('core:student_dashboard')
-        if role == 'teacher':
-            return redirect('core:teacher_dashboard')
-        if role == 'admin':
-            return redirect('core:admin_dashboard')
-        if role == 'clerk':
-            return redirect('core:clerk_dashboard')
-        if role == 'librarian':
-            return redirect('core:librarian_dashboard')
-        return redirect('core:home')
+    role = roles.role_of(request.user)
+    if role is not None:
+        return redirect(role.dashboard)
     return render(request, 'home.html', {'year': datetime.now().year})
 
 
@@ -68,6 +88,8 @@ def register(request):
                 last_name=last_name,
                 role=role
             )
+            if user.role == 'student':
+                caching.bump_library_version()  # student counters changed
             messages.success(request, "User registered successfully!")
             return redirect('core:login')  # namespaced redirect (see note)
         except Exception as e:
@@ -89,19 +111,7 @@ def login_view(request):
             auth_login(request, user)  # log the user in
 
             # Redirect based on role
-            # Use namespaced names if you included core urls with namespace='core'
-            if user.role == 'student':
-                return redirect('core:student_dashboard')
-            elif user.role == 'teacher':
-                return redirect('core:teacher_dashboard')
-            elif user.role == 'admin':
-                return redirect('core:admin_dashboard')
-            elif user.role == 'clerk':
-                return redirect('core:clerk_dashboard')
-            elif user.role == 'librarian':
-                return redirect('core:librarian_dashboard')
-            else:
-                return redirect('core:home')  # fallback
+            return redirect(roles.dashboard_for(user))
 
         else:
             messages.error(request, "Invalid email or password.")
@@ -125,66 +135,67 @@ def logout_view(request):
 def profile(request):
     return render(request, 'profile.html', {'year': datetime.now().year})
 
+# Read-only pages are async: under ASGI (uvicorn) a worker keeps serving
+# other requests while these wait on the database. See docs/benchmarking.md.
 @login_required
-def student_dashboard(request):
-    return render(request, 'dashboard/student.html', {'user': request.user})
+async def student_dashboard(request):
+    user = await request.auser()
+    summary = await sync_to_async(student_summary.student_summary)(user.pk)
+    return render(request, 'dashboard/student.html', {
+        'user': user, 'summary': summary, 'issued_books': summary['loans'],
+    })
 
 @login_required
-def teacher_dashboard(request):
-    return render(request, 'dashboard/teacher.html', {'user': request.user})
+async def teacher_dashboard(request):
+    return render(request, 'dashboard/teacher.html', {'user': await request.auser()})
 
 @login_required
-def admin_dashboard(request):
-    return render(request, 'dashboard/admin.html', {'user': request.user})
+async def admin_dashboard(request):
+    return render(request, 'dashboard/admin.html', {'user': await request.auser()})
 
 @login_required
-def clerk_dashboard(request):
-    return render(request, 'dashboard/clerk.html', {'user': request.user})
-
-@role_required('librarian')
-def librarian_dashboard(request):
-    # Compute quick stats
-    try:
-        total_books = Book.objects.count()
-    except Exception:
-        total_books = 0
-
-    try:
-        issued_books = BookIssue.objects.filter(action='issued').count()
-    except Exception:
-        issued_books = 0
-
-    try:
-        students_count = User.objects.filter(role='student').count()
-    except Exception:
-        students_count = 0
-
+async def clerk_dashboard(request):
+    return render(request, 'dashboard/clerk.html', {'user': await request.auser()})
+
+async def _librarian_dashboard_stats(today):
+    """Counters and recent transactions for the librarian dashboard (five concurrent queries)."""
+    recent_issues = BookIssue.objects.select_related('book', 'student').order_by('-issued_at')[:10]
+    total_books, issued_books, students_count, today_stats, recent = await async_queries.gather(
+        Book.objects.count,
+        # Loans out, kept by the current_loans projection
+        CurrentLoan.objects.count,
+        User.objects.filter(role='student').count,
+        # Today's activity, one rollup row per book touched today
+        lambda: rollups.totals(start=today, end=today),
+        lambda: list(recent_issues),
+    )
     # Recent transactions (map issued_at to 'date' key for template)
-    try:
-        recent = (
-            BookIssue.objects.select_related('book', 'student')
-            .order_by('-issued_at')[:10]
-        )
-        transactions = [
-            {
-                'book': bi.book,
-                'student': bi.student,
-                'action': bi.action,
-                'date': bi.issued_at,
-            }
-            for bi in recent
-        ]
-    except Exception:
-        transactions = []
-
-    context = {
-        'user': request.user,
+    transactions = [
+        {
+            'book': bi.book,
+            'student': bi.student,
+            'action': bi.action,
+            'date': bi.issued_at,
+        }
+        for bi in recent
+    ]
+    return {
         'total_books': total_books,
         'issued_books': issued_books,
         'students_count': students_count,
+        'today_stats': today_stats,
         'transactions': transactions,
     }
-    return render(request, 'dashboard/librarian.html', context)
+
+
+@role_required('librarian')
+async def librarian_dashboard(request):
+    # Served from the versioned cache; any issue, return or new book invalidates it
+    today = timezone.localdate()
+    context = await caching.acached(
+        'librarian_dashboard', lambda: _librarian_dashboard_stats(today), today
+    )
+    return render(request, 'dashboard/librarian.html', {'user': await request.auser(), **context})
 
 # ----------------------------
 # Library related views below
@@ -192,24 +203,124 @@ def librarian_dashboard(request):
 
 # Student issued books view — ensure BookIssue model exists
 @login_required
-def student_issued_books(request):
+async def student_issued_books(request):
+    user = await request.auser()
+    # Current loans and the latest returns, books joined and cached per
+    # student: rendering must not query from async code.
+    summary = await sync_to_async(student_summary.student_summary)(user.pk)
+    return render(request, 'student_issued_books.html', {'summary': summary})
+
+def _issue_history_context(request):
+    """
+    Build one keyset page of issue history for the current query string.
+    Book and student are joined up front so rendering a row costs no queries.
+    """
+    filters = clean_issue_filters(request.GET)
+    issues = filter_issues(
+        BookIssue.objects.select_related('book', 'student'), filters
+    )
+    page_size = clamp_page_size(request.GET.get('page_size'))
     try:
-        books = BookIssue.objects.filter(student=request.user)
-    except Exception:
-        # If BookIssue model is missing or query fails, return empty list and a message
-        messages.error(request, "BookIssue model not found or query failed.")
-        books = []
-    return render(request, 'student_issued_books.html', {'books': books})
+        page = paginate_issues(
+            issues,
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            page_size=page_size,
+        )
+    except ValueError:
+        messages.error(request, "Invalid page cursor, showing the first page.")
+        page = paginate_issues(issues, page_size=page_size)
+    return {
+        'issues': page,
+        'page': page,
+        'filters': filters,
+        'action_choices': BookIssue.ACTION_CHOICES,
+    }
+
 
 # All book issue history (admin/librarian)
 @login_required
+@db_routing.reads_from_replica
 def all_book_issue_history(request):
-    try:
-        issues = BookIssue.objects.all()
-    except Exception:
-        messages.error(request, "BookIssue model not found or query failed.")
-        issues = []
-    return render(request, 'all_book_issue_history.html', {'issues': issues})
+    return render(request, 'all_book_issue_history.html', _issue_history_context(request))
+
+def _export_response(request, name):
+    """
+    GET streams the export now; POST queues it as a background task
+    (core.jobs.export) and answers 202 with the task to poll.
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        fmt = 'csv'
+    if request.method == 'POST':
+        task = tasks.enqueue('core.export', {'name': name, 'fmt': fmt, 'params': request.GET.dict()})
+        response = JsonResponse({'task': _task_json(task)}, status=202)
+        response['Location'] = reverse('core:task_status', args=[task.pk])
+        return response
+    # The rows are read while the response streams, after the view has
+    # returned, so the replica is fixed here.
+    header, rows = exports.rows_for(name, request.GET, using=db_routing.read_alias())
+    response = StreamingHttpResponse(
+        exports.stream(fmt, header, rows, sheet_name=name.replace('-', ' ').title()),
+        content_type=exports.CONTENT_TYPES[fmt],
+    )
+    filename = f"{name}-{timezone.localdate():%Y%m%d}.{fmt}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@role_required('librarian')
+@db_routing.reads_from_replica
+def export_issues(request):
+    """Export the issue history as CSV/XLSX, with the history page's filters."""
+    return _export_response(request, 'book-issues')
+
+
+@role_required('librarian')
+@db_routing.reads_from_replica
+def export_books(request):
+    """Export the book catalogue as CSV/XLSX."""
+    return _export_response(request, 'books')
+
+
+def _task_json(task):
+    data = {
+        'id': task.pk,
+        'name': task.name,
+        'status': task.status,
+        'attempts': task.attempts,
+        'run_at': task.run_at.isoformat(),
+        'finished_at': task.finished_at.isoformat() if task.finished_at else None,
+        'result': task.result,
+        'error': task.last_error.strip().splitlines()[-1] if task.last_error else None,
+    }
+    if task.name == 'core.export' and task.status == 'succeeded':
+        data['download'] = reverse('core:task_download', args=[task.pk])
+    return data
+
+
+@role_required('librarian')
+def task_status(request, task_id):
+    """Progress of a background task, e.g. a queued export."""
+    task = BackgroundTask.objects.filter(pk=task_id).first()
+    if task is None:
+        return JsonResponse({'error': "Task not found."}, status=404)
+    return JsonResponse(_task_json(task))
+
+
+@role_required('librarian')
+def task_download(request, task_id):
+    """The file written by a finished export task."""
+    task = BackgroundTask.objects.filter(pk=task_id, name='core.export', status='succeeded').first()
+    if task is None or not default_storage.exists(task.result['path']):
+        return JsonResponse({'error': "Export not found or not finished."}, status=404)
+    path = task.result['path']
+    return FileResponse(
+        default_storage.open(path, 'rb'),
+        as_attachment=True,
+        filename=path.rsplit('/', 1)[-1],
+        content_type=exports.CONTENT_TYPES[task.result['format']],
+    )
 
 # ----------------------------
 # Missing view stubs that caused your server to crash
@@ -235,14 +346,17 @@ def add_book(request):
                 except ValueError:
                     copies_total = 1
 
-                book = Book.objects.create(
-                    title=title,
-                    author=author or "",
-                    copies_total=copies_total,
-                    copies_available=copies_total,
-                )
+                # Its copies are created along with it (core.copies)
+                with transaction.atomic():
+                    book = Book.objects.create(
+                        title=title,
+                        author=author or "",
+                        copies_total=copies_total,
+                        copies_available=copies_total,
+                    )
+                caching.bump_library_version()
                 messages.success(request, f"Book '{book.title}' added successfully.")
-                return redirect('core:add-book')
+                return redirect('core:books_add')
             except Exception as e:
                 messages.error(request, f"Could not create book: {e}")
         else:
@@ -257,47 +371,84 @@ def add_book(request):
 @role_required('librarian')
 def manage_issues(request):
     """
-    Manage issues stub — list all issues and optionally mark returned.
+    Manage issues stub — list issues page by page and optionally mark returned.
     """
-    try:
-        issues = BookIssue.objects.all()
-    except Exception:
-        issues = []
     # Render a manage issues template (create core/templates/manage_issues.html)
     try:
-        return render(request, 'manage_issues.html', {'issues': issues})
+        return render(request, 'manage_issues.html', _issue_history_context(request))
     except Exception:
         return redirect('core:librarian_dashboard')
 
 @role_required('librarian')
-def available_books(request):
+async def available_books(request):
     """List all books with copies info and issued counts."""
-    try:
-        # Efficiently prefetch related issues for counting
-        books = list(Book.objects.all())
-        # Build a map of book_id to issued count
-        issued_counts_qs = (
-            BookIssue.objects.filter(action='issued')
-            .values('book')
-            .order_by()
-            .annotate(count=models.Count('id'))
-        )
-        book_id_to_issued = {row['book']: row['count'] for row in issued_counts_qs}
-
-        rows = []
-        for book in books:
-            issued_count = book_id_to_issued.get(book.id, 0)
-            rows.append({
-                'book': book,
-                'copies_total': book.copies_total,
-                'copies_available': book.copies_available,
-                'copies_issued': issued_count,
-            })
-    except Exception:
-        rows = []
+    # The counters summarise each book's copies (core.copies); nothing is recounted
+    rows = [
+        {
+            'book': book,
+            'copies_total': book.copies_total,
+            'copies_available': book.copies_available,
+            'copies_issued': book.copies_total - book.copies_available,
+        }
+        async for book in Book.objects.all()
+    ]
     return render(request, 'available_books.html', { 'rows': rows })
 
 
+@login_required
+def search_books(request):
+    """
+    Ranked, typo-tolerant catalogue search (see core.search).
+    Query params: q, limit. Returns JSON when format=json.
+    """
+    query = request.GET.get('q', '').strip()
+    results = search.search_books(query, search.clamp_limit(request.GET.get('limit')))
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'query': query,
+            'results': [
+                {
+                    'id': book.id,
+                    'title': book.title,
+                    'author': book.author,
+                    'isbn': book.isbn,
+                    'publisher': book.publisher,
+                    'copies_available': book.copies_available,
+                    'rank': round(float(book.rank), 4),
+                }
+                for book in results
+            ],
+        })
+    return render(request, 'search_books.html', {
+        'query': query,
+        'results': results,
+        'can_issue': roles.has_permission(request.user, 'issue_books'),
+    })
+
+
+@role_required('librarian')
+def student_autocomplete(request):
+    """
+    Students matching `q` for the issue form's picker (see
+    core.search.search_students). Query params: q, limit.
+    """
+    query = request.GET.get('q', '').strip()
+    limit = min(search.clamp_limit(request.GET.get('limit', search.STUDENT_LIMIT)), search.MAX_STUDENT_LIMIT)
+    students = search.search_students(query, limit)
+    return JsonResponse({
+        'query': query,
+        'results': [
+            {
+                'id': student.id,
+                'username': student.username,
+                'email': student.email,
+                'name': student.get_full_name(),
+            }
+            for student in students
+        ],
+    })
+
+
 @role_required('librarian')
 def issue_book(request, book_id):
     """Issue a book to a student."""
@@ -313,88 +464,67 @@ def issue_book(request, book_id):
         
         if not student_email:
             messages.error(request, "Student email is required.")
-            return render(request, 'issue_book.html', {'book': book, 'students': User.objects.filter(role='student')})
+            return render(request, 'issue_book.html', {'book': book, 'student_email': student_email})
         
         try:
             student = User.objects.get(username=student_email, role='student')
         except User.DoesNotExist:
             messages.error(request, "Student not found.")
-            return render(request, 'issue_book.html', {'book': book, 'students': User.objects.filter(role='student')})
-        
-        # Check if book is available
-        if book.copies_available <= 0:
-            messages.error(request, "No copies available for this book.")
-            return render(request, 'issue_book.html', {'book': book, 'students': User.objects.filter(role='student')})
-        
-        # Check if student already has this book issued
-        existing_issue = BookIssue.objects.filter(
-            book=book, 
-            student=student, 
-            action='issued'
-        ).exists()
+            return render(request, 'issue_book.html', {'book': book, 'student_email': student_email})
         
-        if existing_issue:
-            messages.error(request, f"{student.get_full_name()} already has this book issued.")
-            return render(request, 'issue_book.html', {'book': book, 'students': User.objects.filter(role='student')})
-        
-        # Create the issue
+        # Create the issue; availability and duplicate checks happen atomically
         try:
-            from datetime import datetime, timedelta
+            from datetime import datetime
             due_date = None
             if due_date_str:
                 due_date = datetime.strptime(due_date_str, '%Y-%m-%d').date()
-            else:
-                # Default due date: 14 days from now
-                due_date = datetime.now().date() + timedelta(days=14)
-            
-            BookIssue.objects.create(
-                book=book,
-                student=student,
-                action='issued',
-                due_date=due_date
-            )
-            
-            # Update available copies
-            book.copies_available -= 1
-            book.save()
-            
+
+            circulation.issue_book(book, student, due_date=due_date)
+
             messages.success(request, f"Book '{book.title}' issued to {student.get_full_name()} successfully.")
             return redirect('core:books_list')
-            
+
+        except circulation.NoCopiesAvailable:
+            # Queue the demand instead of turning the student away
+            try:
+                hold = holds.place_hold(book, student)
+            except circulation.CirculationError as e:
+                messages.error(request, str(e))
+            else:
+                messages.info(
+                    request,
+                    f"No copies of '{book.title}' are available. {student.get_full_name() or student.username} "
+                    f"is number {holds.queue_position(hold)} in the hold queue.",
+                )
+                return redirect('core:books_list')
+            return render(request, 'issue_book.html', {'book': book, 'student_email': student_email})
+        except circulation.CirculationError as e:
+            messages.error(request, str(e))
+            return render(request, 'issue_book.html', {'book': book, 'student_email': student_email})
         except Exception as e:
             messages.error(request, f"Error issuing book: {e}")
     
-    # GET request - show form
-    students = User.objects.filter(role='student').order_by('first_name', 'last_name')
-    return render(request, 'issue_book.html', {'book': book, 'students': students})
+    # GET request - show form; students are looked up via student_autocomplete
+    return render(request, 'issue_book.html', {'book': book})
 
 
 @role_required('librarian')
 def return_book(request, issue_id):
     """Return a book."""
     try:
-        issue = BookIssue.objects.get(id=issue_id, action='issued')
+        issue = BookIssue.objects.select_related('book', 'student').get(
+            id=issue_id, action__in=BookIssue.OPEN_ACTIONS
+        )
     except BookIssue.DoesNotExist:
         messages.error(request, "Issue record not found.")
         return redirect('core:all_book_issue_history')
     
     if request.method == "POST":
         try:
-            from datetime import datetime
-            
-            # Calculate fine if overdue
-            fine_amount = issue.calculate_fine()
-            
-            # Update the issue record
-            issue.action = 'returned'
-            issue.returned_at = datetime.now()
-            issue.fine_amount = fine_amount
-            issue.save()
-            
-            # Update book availability
-            issue.book.copies_available += 1
-            issue.book.save()
-            
+            # Fine, status and book availability are updated in one transaction
+            issue = circulation.return_book(issue)
+            fine_amount = issue.fine_amount
+
             if fine_amount > 0:
                 messages.warning(request, f"Book returned with fine: ${fine_amount:.2f}")
             else:
@@ -402,73 +532,372 @@ def return_book(request, issue_id):
             
             return redirect('core:all_book_issue_history')
             
+        except circulation.CirculationError as e:
+            messages.error(request, str(e))
+            return redirect('core:all_book_issue_history')
         except Exception as e:
             messages.error(request, f"Error returning book: {e}")
     
     return render(request, 'return_book.html', {'issue': issue})
 
 
+def _copy_json(copy, issue=None):
+    data = {
+        'barcode': copy.barcode,
+        'status': copy.status,
+        'book': {
+            'id': copy.book_id,
+            'title': copy.book.title,
+            'author': copy.book.author,
+            'isbn': copy.book.isbn,
+            'copies_total': copy.book.copies_total,
+            'copies_available': copy.book.copies_available,
+        },
+        'issue': None,
+    }
+    if issue is not None:
+        data['issue'] = {
+            'id': issue.pk,
+            'student': issue.student.username,
+            'action': issue.action,
+            'due_date': issue.due_date.isoformat() if issue.due_date else None,
+            'fine_amount': str(issue.fine_amount),
+        }
+    return data
+
+
 @role_required('librarian')
-def librarian_analytics(request):
-    """Analytics dashboard for librarians."""
-    from datetime import datetime, timedelta
-    from django.db.models import Count, Q
-    
-    # Basic stats
-    total_books = Book.objects.count()
-    total_students = User.objects.filter(role='student').count()
-    total_issues = BookIssue.objects.count()
-    active_issues = BookIssue.objects.filter(action='issued').count()
-    overdue_books = BookIssue.objects.filter(
-        action='issued',
-        due_date__lt=datetime.now().date()
-    ).count()
-    
-    # Recent activity (last 30 days)
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-    recent_issues = BookIssue.objects.filter(issued_at__gte=thirty_days_ago).count()
-    recent_returns = BookIssue.objects.filter(
-        returned_at__gte=thirty_days_ago,
-        action='returned'
-    ).count()
-    
-    # Popular books (most issued)
-    popular_books = Book.objects.annotate(
-        issue_count=Count('issues', filter=Q(issues__action='issued'))
-    ).order_by('-issue_count')[:5]
-    
-    # Monthly issue trends (last 6 months)
-    monthly_data = []
-    for i in range(6):
-        month_start = datetime.now() - timedelta(days=30*i)
-        month_end = month_start + timedelta(days=30)
-        count = BookIssue.objects.filter(
-            issued_at__gte=month_start,
-            issued_at__lt=month_end
-        ).count()
-        monthly_data.append({
-            'month': month_start.strftime('%b'),
-            'count': count
-        })
-    monthly_data.reverse()
-    
-    # Student activity
-    active_students = User.objects.filter(
-        role='student',
-        book_issues__action='issued'
-    ).distinct().count()
-    
-    context = {
-        'total_books': total_books,
-        'total_students': total_students,
-        'total_issues': total_issues,
-        'active_issues': active_issues,
-        'overdue_books': overdue_books,
-        'recent_issues': recent_issues,
-        'recent_returns': recent_returns,
-        'popular_books': popular_books,
-        'monthly_data': monthly_data,
-        'active_students': active_students,
+def scan_copy(request):
+    """
+    Desk scanner endpoint, keyed by a copy's barcode.
+    GET ?barcode= looks the copy up, with its loan if it is out or its
+    hold if it is set aside.
+    POST barcode and action=return, or action=issue with student_email
+    (and optionally due_date), moves that exact copy.
+    """
+    params = request.POST if request.method == 'POST' else request.GET
+    code = params.get('barcode', '').strip()
+    if not code:
+        return JsonResponse({'error': "barcode is required."}, status=400)
+    # One lookup on the barcode's unique index, book joined
+    copy = copies.scan(code)
+    if copy is None:
+        return JsonResponse({'error': "No copy has this barcode."}, status=404)
+
+    if request.method != 'POST':
+        issue = copies.open_issue(copy) if copy.status == 'on_loan' else None
+        data = _copy_json(copy, issue)
+        if copy.status == 'on_hold':
+            # Set aside: the desk needs to know whose it is
+            hold = Hold.objects.select_related('student').filter(copy=copy, status='ready').first()
+            data['hold'] = _hold_json(hold) if hold else None
+        return JsonResponse(data)
+
+    action = params.get('action')
+    if action not in ('issue', 'return'):
+        return JsonResponse({'error': "action must be 'issue' or 'return'."}, status=400)
+    try:
+        due_date = params.get('due_date')
+        due_date = datetime.strptime(due_date, '%Y-%m-%d').date() if due_date else None
+    except ValueError:
+        return JsonResponse({'error': "due_date must be in YYYY-MM-DD format."}, status=400)
+    try:
+        if action == 'issue':
+            student = User.objects.filter(
+                username=params.get('student_email', '').strip(), role='student'
+            ).first()
+            if student is None:
+                return JsonResponse({'error': "Student not found."}, status=400)
+            issue = circulation.issue_book(copy.book_id, student, due_date=due_date, copy=copy)
+        else:
+            issue = copies.open_issue(copy)
+            if issue is None:
+                raise circulation.IssueNotOpen("This copy is not on loan.")
+            issue = circulation.return_book(issue)
+    except circulation.CirculationError as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    # Re-read for the new status and counters
+    return JsonResponse(_copy_json(copies.scan(code), issue))
+
+
+def _hold_json(hold):
+    return {
+        'id': hold.pk,
+        'book': hold.book_id,
+        'student': hold.student.username,
+        'status': hold.status,
+        'position': holds.queue_position(hold),
+        'created_at': hold.created_at.isoformat(),
+        'expires_at': hold.expires_at.isoformat() if hold.expires_at else None,
     }
-    
-    return render(request, 'analytics.html', context)
+
+
+def _visible_hold(request, hold_id):
+    """The hold if the user may see it: their own, or any for a librarian."""
+    visible = Hold.objects.select_related('student').filter(pk=hold_id)
+    if not roles.has_role(request.user, 'librarian'):
+        visible = visible.filter(student=request.user)
+    return visible.first()
+
+
+@login_required
+@require_POST
+def place_hold(request, book_id):
+    """
+    Join the hold queue of a book with no copy on the shelf. Students hold
+    for themselves; a librarian passes student_email.
+    """
+    if not roles.has_permission(request.user, 'place_holds'):
+        return JsonResponse({'error': "You cannot place holds."}, status=403)
+    student = request.user
+    if roles.has_role(request.user, 'librarian'):
+        student = User.objects.filter(
+            username=request.POST.get('student_email', '').strip(), role='student'
+        ).first()
+        if student is None:
+            return JsonResponse({'error': "Student not found."}, status=400)
+    try:
+        hold = holds.place_hold(book_id, student)
+    except holds.BookNotFound as e:
+        return JsonResponse({'error': str(e)}, status=404)
+    except circulation.CirculationError as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    return JsonResponse(_hold_json(hold), status=201)
+
+
+@login_required
+def hold_status(request, hold_id):
+    """A hold with its place in the queue (1 is next in line)."""
+    hold = _visible_hold(request, hold_id)
+    if hold is None:
+        return JsonResponse({'error': "Hold not found."}, status=404)
+    return JsonResponse(_hold_json(hold))
+
+
+@login_required
+@require_POST
+def cancel_hold(request, hold_id):
+    """Leave the queue; a copy already set aside goes to the next in line."""
+    hold = _visible_hold(request, hold_id)
+    if hold is None:
+        return JsonResponse({'error': "Hold not found."}, status=404)
+    try:
+        closed = holds.cancel_hold(hold)
+    except holds.HoldNotOpen as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    closed.student = hold.student
+    return JsonResponse(_hold_json(closed))
+
+
+@role_required('librarian')
+def fine_balances(request):
+    """Students who owe fines, largest balance first, one keyset page at a time."""
+    page_size = clamp_page_size(request.GET.get('page_size'))
+    try:
+        page = paginate_balances(
+            ledger.outstanding(),
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            page_size=page_size,
+        )
+    except ValueError:
+        messages.error(request, "Invalid page cursor, showing the first page.")
+        page = paginate_balances(ledger.outstanding(), page_size=page_size)
+    return render(request, 'fine_balances.html', {'accounts': page, 'page': page})
+
+
+def _fine_entry_json(entry):
+    return {
+        'id': entry.pk,
+        'kind': entry.kind,
+        'amount': str(entry.amount),
+        'balance': str(entry.balance),
+        'issue': entry.issue_id,
+        'note': entry.note,
+        'created_at': entry.created_at.isoformat(),
+    }
+
+
+@role_required('librarian')
+def student_fines(request, student_id):
+    """
+    GET: a student's balance and latest ledger entries.
+    POST kind=payment|waiver, amount (and optionally note) credits the balance.
+    """
+    student = User.objects.filter(pk=student_id, role='student').first()
+    if student is None:
+        return JsonResponse({'error': "Student not found."}, status=404)
+    if request.method == 'POST':
+        kind = request.POST.get('kind')
+        if kind not in ('payment', 'waiver'):
+            return JsonResponse({'error': "kind must be 'payment' or 'waiver'."}, status=400)
+        credit = ledger.record_payment if kind == 'payment' else ledger.waive
+        try:
+            credit(student, request.POST.get('amount', ''), recorded_by=request.user, note=request.POST.get('note', ''))
+        except ledger.InvalidAmount as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except ledger.Overpayment as e:
+            return JsonResponse({'error': str(e)}, status=409)
+    return JsonResponse({
+        'student': student.username,
+        'balance': str(ledger.balance(student)),
+        'entries': [_fine_entry_json(entry) for entry in ledger.statement(student)],
+    })
+
+
+def _bulk_rows(request):
+    """
+    Read bulk circulation rows from a CSV upload (form field `file`) or a
+    JSON body that is either a list of rows or {"rows": [...]}.
+    """
+    if request.content_type == 'application/json':
+        payload = json.loads(request.body or b'[]')
+        if isinstance(payload, dict):
+            payload = payload.get('rows', [])
+        if not isinstance(payload, list) or not all(isinstance(row, dict) for row in payload):
+            raise ValueError("Expected a list of row objects.")
+        return payload
+    upload = request.FILES.get('file')
+    if upload is None:
+        raise ValueError("Upload a CSV file or send a JSON list of rows.")
+    return list(csv.DictReader(io.TextIOWrapper(upload.file, encoding='utf-8-sig')))
+
+
+def _bulk_response(request, operation, count_key):
+    try:
+        rows = _bulk_rows(request)
+        issues, errors = operation(rows)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return JsonResponse({'error': f"Could not read rows: {e}"}, status=400)
+    except circulation.CirculationError as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    data = {
+        count_key: len(issues),
+        'issue_ids': [issue.pk for issue in issues],
+        'errors': errors,
+    }
+    if count_key == 'returned':
+        data['fines_total'] = str(sum((issue.fine_amount for issue in issues), 0))
+    return JsonResponse(data)
+
+
+@role_required('librarian')
+@require_POST
+def bulk_issue_books(request):
+    """Issue a batch of books: CSV/JSON rows of book_id or isbn, student_email, due_date."""
+    return _bulk_response(request, circulation.bulk_issue, 'issued')
+
+
+@role_required('librarian')
+@require_POST
+def bulk_return_books(request):
+    """Return a batch of books: rows of issue_id, or book_id or isbn plus student_email."""
+    return _bulk_response(request, circulation.bulk_return, 'returned')
+
+
+def _import_json(job):
+    return {
+        'id': job.pk,
+        'source': job.source,
+        'format': job.format,
+        'status': job.status,
+        'records_done': job.records_done,
+        'created': job.created,
+        'updated': job.updated,
+        'rejected': job.rejected,
+        'errors': job.errors,
+        'last_error': job.last_error,
+        'started_at': job.started_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+@role_required('librarian')
+@require_POST
+def import_books(request):
+    """
+    Import an uploaded catalogue (form field `file`, CSV or MARC-in-JSON).
+    Uploading the same file again after a failure resumes the import.
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'error': "Upload a CSV or MARC-in-JSON file as 'file'."}, status=400)
+    fmt = request.POST.get('format') or None
+    try:
+        job = book_import.run_import(upload.file, source=upload.name, fmt=fmt)
+    except (book_import.CatalogueImportError, UnicodeDecodeError, ValueError, csv.Error) as e:
+        job = CatalogueImport.objects.filter(source=upload.name[:255]).order_by('-started_at').first()
+        data = {'error': f"Import failed, upload the file again to resume: {e}"}
+        if job is not None:
+            data['import'] = _import_json(job)
+        return JsonResponse(data, status=400)
+    return JsonResponse(_import_json(job))
+
+
+@role_required('librarian')
+def import_status(request, import_id):
+    """Progress of a catalogue import; checkpoints are committed per batch."""
+    job = CatalogueImport.objects.filter(pk=import_id).first()
+    if job is None:
+        return JsonResponse({'error': "Import not found."}, status=404)
+    return JsonResponse(_import_json(job))
+
+
+@role_required('librarian')
+@db_routing.reads_from_replica
+async def circulation_trends(request):
+    """
+    JSON circulation counters per day or month from the daily rollup.
+    Query params: from, to (YYYY-MM-DD, default last 30 days), book, period.
+    """
+    try:
+        end = datetime.strptime(request.GET['to'], '%Y-%m-%d').date() if request.GET.get('to') else timezone.localdate()
+        start = datetime.strptime(request.GET['from'], '%Y-%m-%d').date() if request.GET.get('from') else end - timedelta(days=30)
+        book_id = int(request.GET['book']) if request.GET.get('book') else None
+    except ValueError:
+        return JsonResponse({'error': "Use YYYY-MM-DD dates and a numeric book id."}, status=400)
+    if start > end:
+        return JsonResponse({'error': "'from' must not be after 'to'."}, status=400)
+    period = 'month' if request.GET.get('period') == 'month' else 'day'
+
+    rows = [row async for row in rollups.trend_queryset(start, end, book_id=book_id, period=period)]
+    return JsonResponse({
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'period': period,
+        'book': book_id,
+        'results': [
+            {
+                'period': row['period'].isoformat()[:10],
+                'issues': row['issues'],
+                'returns': row['returns'],
+                'overdue': row['overdue'],
+                'fines': f"{row['fines'] or 0:.2f}",
+            }
+            for row in rows
+        ],
+    })
+
+
+@role_required('librarian')
+@db_routing.reads_from_replica
+async def librarian_analytics(request):
+    """Analytics dashboard for librarians (three queries, see core.analytics)."""
+    return render(request, 'analytics.html', await analytics.alibrary_summary())
+
+
+@staff_member_required
+def cache_stats(request):
+    """Hit/miss counters of the versioned library cache (staff only)."""
+    return JsonResponse(caching.cache_stats())
+
+
+@staff_member_required
+def profiling_stats(request):
+    """
+    Per-view query counts, timings and histograms from the profiling
+    middleware (this worker process only). POST resets them.
+    """
+    if request.method == 'POST':
+        profiling.store.reset()
+    return JsonResponse(profiling.store.snapshot())